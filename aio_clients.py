@@ -0,0 +1,163 @@
+"""
+비동기 업스트림 클라이언트 및 CPU 작업 실행기
+
+- Azure OpenAI: AsyncAzureOpenAI (임베딩/채팅)
+- Azure Blob Storage: azure.storage.blob.aio.BlobServiceClient
+- Azure Cognitive Search: 커넥션 풀을 쓰는 httpx.AsyncClient
+- 업스트림별 동시 요청 수(asyncio.Semaphore)와 타임아웃은 환경변수로 설정
+- FAISS 검색, PDF 파싱 같은 CPU 작업은 run_cpu()로 스레드 풀에서 실행(이벤트 루프 차단 방지)
+- 업스트림 호출 시간/실패 수는 metrics에 기록(동시 요청 슬롯 대기 시간 제외)
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', '32'))
+OPENAI_TIMEOUT_SEC = float(os.getenv('OPENAI_TIMEOUT_SEC', '30'))
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '2'))
+BLOB_MAX_CONCURRENCY = int(os.getenv('BLOB_MAX_CONCURRENCY', '16'))
+BLOB_TIMEOUT_SEC = float(os.getenv('BLOB_TIMEOUT_SEC', '60'))
+# 다운로드 시 한 번에 가져오는 청크 크기(워커당 다운로드 메모리 상한)
+BLOB_CHUNK_SIZE = int(os.getenv('BLOB_CHUNK_SIZE', str(4 * 1024 * 1024)))
+SEARCH_MAX_CONCURRENCY = int(os.getenv('SEARCH_MAX_CONCURRENCY', '8'))
+SEARCH_TIMEOUT_SEC = float(os.getenv('SEARCH_TIMEOUT_SEC', '30'))
+CPU_WORKERS = int(os.getenv('CPU_WORKERS') or min(32, (os.cpu_count() or 1) + 4))
+
+_cpu_pool = None
+_openai_client = None
+_blob_service = None
+_http_client = None
+_semaphores = {}
+
+
+def _semaphore(name, limit):
+    sem = _semaphores.get(name)
+    if sem is None:
+        sem = _semaphores[name] = asyncio.Semaphore(limit)
+    return sem
+
+
+def openai_limit():
+    return _semaphore('openai', OPENAI_MAX_CONCURRENCY)
+
+
+def blob_limit():
+    return _semaphore('blob', BLOB_MAX_CONCURRENCY)
+
+
+def search_limit():
+    return _semaphore('search', SEARCH_MAX_CONCURRENCY)
+
+
+# ----- CPU 작업 -----
+def cpu_pool():
+    global _cpu_pool
+    if _cpu_pool is None:
+        _cpu_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix='cpu')
+    return _cpu_pool
+
+
+async def run_cpu(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_pool(), functools.partial(fn, *args, **kwargs))
+
+
+# ----- Azure OpenAI -----
+def get_openai():
+    global _openai_client
+    if _openai_client is None:
+        from openai import AsyncAzureOpenAI
+        _openai_client = AsyncAzureOpenAI(
+            api_key=os.getenv('OPENAI_API_KEY') or os.getenv('AZURE_OPENAI_KEY'),
+            api_version=os.getenv('OPENAI_API_VERSION') or '2024-02-01',
+            azure_endpoint=os.getenv('OPENAI_API_BASE') or os.getenv('AZURE_OPENAI_ENDPOINT'),
+            timeout=OPENAI_TIMEOUT_SEC,
+            max_retries=OPENAI_MAX_RETRIES,
+        )
+    return _openai_client
+
+
+async def create_embeddings(texts, model, dimensions=None):
+    # dimensions: text-embedding-3 계열의 축소 차원(None이면 모델 기본 차원)
+    kwargs = {'dimensions': dimensions} if dimensions else {}
+    async with openai_limit():
+        with metrics.timed('embedding', upstream='openai'):
+            return await get_openai().embeddings.create(input=list(texts), model=model, **kwargs)
+
+
+async def create_chat_completion(**kwargs):
+    async with openai_limit():
+        with metrics.timed('gpt', upstream='openai'):
+            return await get_openai().chat.completions.create(**kwargs)
+
+
+async def stream_chat_completion(**kwargs):
+    """스트리밍 채팅 응답 청크를 순서대로 반환(스트림이 끝날 때까지 동시 요청 슬롯 유지)"""
+    async with openai_limit():
+        with metrics.timed('gpt', upstream='openai'):
+            stream = await get_openai().chat.completions.create(stream=True, **kwargs)
+            async for chunk in stream:
+                yield chunk
+
+
+# ----- Azure Blob Storage -----
+def get_blob_service():
+    """연결 문자열이 없으면 None"""
+    global _blob_service
+    if _blob_service is None:
+        conn_str = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
+        if not conn_str:
+            return None
+        from azure.storage.blob.aio import BlobServiceClient
+        _blob_service = BlobServiceClient.from_connection_string(
+            conn_str, connection_timeout=BLOB_TIMEOUT_SEC, read_timeout=BLOB_TIMEOUT_SEC,
+            max_single_get_size=BLOB_CHUNK_SIZE, max_chunk_get_size=BLOB_CHUNK_SIZE)
+    return _blob_service
+
+
+def get_blob_client(container, blob):
+    service = get_blob_service()
+    return service.get_blob_client(container=container, blob=blob) if service else None
+
+
+# ----- Azure Cognitive Search(HTTP) -----
+def get_http():
+    global _http_client
+    if _http_client is None:
+        import httpx
+        _http_client = httpx.AsyncClient(
+            timeout=SEARCH_TIMEOUT_SEC,
+            limits=httpx.Limits(max_connections=SEARCH_MAX_CONCURRENCY * 2,
+                                max_keepalive_connections=SEARCH_MAX_CONCURRENCY),
+        )
+    return _http_client
+
+
+async def http_post(url, **kwargs):
+    async with search_limit():
+        with metrics.timed('cognitive_search', upstream='cognitive_search'):
+            resp = await get_http().post(url, **kwargs)
+        if resp.status_code >= 400:
+            metrics.UPSTREAM_ERRORS.inc('cognitive_search')
+        return resp
+
+
+async def close_all():
+    """앱 종료 시 커넥션 정리"""
+    global _openai_client, _blob_service, _http_client, _cpu_pool
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
+    if _blob_service is not None:
+        await _blob_service.close()
+        _blob_service = None
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    if _cpu_pool is not None:
+        _cpu_pool.shutdown(wait=False)
+        _cpu_pool = None
+    _semaphores.clear()
@@ -1,101 +1,21 @@
-import threading
-def update_faiss_index_single(doc):
-    """
-    단일 문서(doc: dict)만 임베딩하여 faiss_index.bin과 meta.json을 갱신
-    """
-    import numpy as np
-    import faiss
-    import os
-    import json
-    from pathlib import Path
-    import openai
-    try:
-        from filelock import FileLock
-    except ImportError:
-        FileLock = None
-    BASE_DIR = Path(__file__).parent
-    FAISS_INDEX_PATH = BASE_DIR / 'faiss_index.bin'
-    META_PATH = BASE_DIR / 'meta.json'
-    EMBED_MODEL = os.getenv('EMBED_MODEL') or os.getenv('EMBED_DEPLOYMENT')
-    OPENAI_API_KEY = os.getenv('OPENAI_API_KEY') or os.getenv('AZURE_OPENAI_KEY')
-    OPENAI_API_BASE = os.getenv('OPENAI_API_BASE') or os.getenv('AZURE_OPENAI_ENDPOINT')
-    openai.api_key = OPENAI_API_KEY
-    openai.api_base = OPENAI_API_BASE
-    def get_openai_embedding(text):
-        max_length = 8000
-        if text and len(text) > max_length:
-            text = text[:max_length]
-        response = openai.embeddings.create(
-            input=[text],
-            model=EMBED_MODEL
-        )
-        embedding = response.data[0].embedding
-        return np.array(embedding, dtype=np.float32)
-    # 락 사용(동시성 방지)
-    lock_path = str(FAISS_INDEX_PATH) + '.lock'
-    lock = FileLock(lock_path) if FileLock else None
-    try:
-        if lock:
-            lock.acquire(timeout=30)
-        # 메타 로드
-        if META_PATH.exists():
-            with open(META_PATH, encoding='utf-8') as f:
-                meta = json.load(f)
-        else:
-            meta = []
-        # 인덱스 로드/생성
-        if FAISS_INDEX_PATH.exists():
-            index = faiss.read_index(str(FAISS_INDEX_PATH))
-        else:
-            # 첫 벡터 shape 추정(임베딩 1회)
-            emb = get_openai_embedding(doc['text'])
-            index = faiss.IndexFlatL2(len(emb))
-            index.add(emb.reshape(1, -1))
-            meta.append(doc)
-            with open(META_PATH, 'w', encoding='utf-8') as f:
-                json.dump(meta, f, ensure_ascii=False, indent=2)
-            faiss.write_index(index, str(FAISS_INDEX_PATH))
-            print(f"[app.py] faiss_index.bin 새로 생성 및 1개 벡터 추가 완료!")
-            return
-        # 기존 인덱스 append
-        emb = get_openai_embedding(doc['text'])
-        index.add(emb.reshape(1, -1))
-        meta.append(doc)
-        with open(META_PATH, 'w', encoding='utf-8') as f:
-            json.dump(meta, f, ensure_ascii=False, indent=2)
-        faiss.write_index(index, str(FAISS_INDEX_PATH))
-        print(f"[app.py] faiss_index.bin 벡터 append 및 meta.json 동기화 완료!")
-    except Exception as e:
-        print(f"[app.py] faiss_index.bin 갱신 실패: {e}")
-    finally:
-        if lock:
-            lock.release()
-
-
 # ===== 정상 구조로 전체 재정리 =====
 
 import json
-import faiss
 import numpy as np
 import openai
 import os
 from fastapi import FastAPI, UploadFile, File, Form, Request, Query
-from fastapi.responses import JSONResponse, StreamingResponse
-from azure.storage.blob import BlobServiceClient
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
+import aio_clients
+import metrics
+from aio_clients import run_cpu
+from blob_upload import new_spool, stream_upload
+from cache_utils import AsyncSingleFlight, LRUTTLCache
+from embedding_cache import normalize_text, text_key
 from pathlib import Path
 from dotenv import load_dotenv
 
-# SuppressStderr 클래스를 파일 상단에 정의
-import sys
-class SuppressStderr:
-    def __enter__(self):
-        self._original_stderr = sys.stderr
-        sys.stderr = open(os.devnull, 'w')
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        sys.stderr.close()
-        sys.stderr = self._original_stderr
-
 load_dotenv()
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY') or os.getenv('AZURE_OPENAI_KEY')
 OPENAI_API_BASE = os.getenv('OPENAI_API_BASE') or os.getenv('AZURE_OPENAI_ENDPOINT')
@@ -104,129 +24,173 @@ openai.api_key = OPENAI_API_KEY
 openai.api_base = OPENAI_API_BASE
 
 app = FastAPI(title='문서 유사도 검색 API', description='요구사항 텍스트를 입력하면 유사한 기존 산출물을 찾아드립니다.')
+# 엔드포인트별 요청 수/응답 시간(GET /metrics)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Blob 속성(존재/ETag/크기) 캐시: 있으면 양성, 없으면 음성(None)으로 짧게 보관
+BLOB_PROPS_CACHE_TTL_SEC = float(os.getenv('BLOB_PROPS_CACHE_TTL_SEC', '60'))
+BLOB_NEGATIVE_CACHE_TTL_SEC = float(os.getenv('BLOB_NEGATIVE_CACHE_TTL_SEC', '10'))
+blob_props_cache = LRUTTLCache(4096, ttl=BLOB_PROPS_CACHE_TTL_SEC)
+_BLOB_MISSING = 'missing'
+
+DOWNLOAD_CONTENT_TYPES = {
+    'pdf': 'application/pdf',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'txt': 'text/plain',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+def parse_range_header(range_header, size):
+    """단일 'bytes=start-end' / 'bytes=-N' 범위 해석 → (start, end) 또는 None(전체), 잘못된 범위면 ValueError"""
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        # 다중 범위는 지원하지 않으므로 전체 전송
+        return None
+    start_s, _, end_s = spec.strip().partition('-')
+    if start_s == '':
+        length = int(end_s)
+        if length <= 0:
+            raise ValueError('invalid suffix range')
+        return max(0, size - length), size - 1
+    start = int(start_s)
+    end = int(end_s) if end_s else size - 1
+    if start >= size or end < start:
+        raise ValueError('unsatisfiable range')
+    return start, min(end, size - 1)
+
+async def get_blob_props(blob_client, blob_name):
+    props = blob_props_cache.get(blob_name)
+    if props is None:
+        from azure.core.exceptions import ResourceNotFoundError
+        try:
+            async with aio_clients.blob_limit():
+                with metrics.timed('blob_props'):
+                    p = await blob_client.get_blob_properties()
+            props = {
+                'etag': p.etag,
+                'size': p.size,
+                'last_modified': p.last_modified,
+            }
+            blob_props_cache.set(blob_name, props)
+        except ResourceNotFoundError:
+            props = _BLOB_MISSING
+            blob_props_cache.set(blob_name, props, ttl=BLOB_NEGATIVE_CACHE_TTL_SEC)
+        except Exception:
+            metrics.UPSTREAM_ERRORS.inc('blob')
+            raise
+    return None if props == _BLOB_MISSING else props
 
 # 파일 다운로드 API (Blob Storage)
 @app.get('/download')
-async def download_file(filename: str = Query(..., description="다운로드할 파일명")):
+async def download_file(request: Request, filename: str = Query(..., description="다운로드할 파일명")):
     try:
-        from urllib.parse import unquote
+        from urllib.parse import unquote, quote
+        from email.utils import format_datetime
+        from azure.core import MatchConditions
+        from azure.core.exceptions import ResourceModifiedError, ResourceNotFoundError
         filename_decoded = unquote(filename)
-        conn_str = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
         container = os.getenv('AZURE_STORAGE_CONTAINER')
-        if not conn_str or not container:
+        # 목록 순회 없이 이름으로 바로 조회 (한글/공백/특수문자도 그대로 blob 이름)
+        blob_client = aio_clients.get_blob_client(container, filename_decoded) if container else None
+        if blob_client is None:
             return JSONResponse({"error": "Azure Storage 연결 정보가 없습니다."}, status_code=400)
-        from azure.storage.blob import BlobServiceClient
-        blob_service = BlobServiceClient.from_connection_string(conn_str)
-        # 파일명 완전 일치하는 blob 찾기 (한글/공백/특수문자 대응)
-        container_client = blob_service.get_container_client(container)
-        blob_name = None
-        for blob in container_client.list_blobs():
-            if blob.name == filename_decoded:
-                blob_name = blob.name
-                break
-        if not blob_name:
-            return JSONResponse({"error": f"파일({filename_decoded})이 Blob Storage에 존재하지 않습니다."}, status_code=404)
-        blob_client = blob_service.get_blob_client(container=container, blob=blob_name)
-        stream = blob_client.download_blob()
-        file_data = stream.readall()
-        # 파일 확장자 추출
-        ext = blob_name.lower().split('.')[-1]
-        content_type = {
-            'pdf': 'application/pdf',
-            'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'txt': 'text/plain',
-            'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        }.get(ext, 'application/octet-stream')
-        from urllib.parse import quote
-        return StreamingResponse(
-            iter([file_data]),
-            media_type=content_type,
-            headers={
-                "Content-Disposition": f"attachment; filename*=UTF-8''{quote(blob_name)}"
+        not_found = JSONResponse({"error": f"파일({filename_decoded})이 Blob Storage에 존재하지 않습니다."}, status_code=404)
+        downloader = None
+        for attempt in range(2):
+            props = await get_blob_props(blob_client, filename_decoded)
+            if props is None:
+                return not_found
+            etag, size = props['etag'], props['size']
+            headers = {
+                "Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename_decoded)}",
+                "Accept-Ranges": "bytes",
+                "ETag": etag,
             }
-        )
+            if props['last_modified'] is not None:
+                headers["Last-Modified"] = format_datetime(props['last_modified'], usegmt=True)
+            if_none_match = request.headers.get('if-none-match')
+            if if_none_match and (if_none_match.strip() == '*' or etag in [t.strip() for t in if_none_match.split(',')]):
+                return Response(status_code=304, headers=headers)
+            # If-Range가 현재 ETag와 다르면 Range 무시하고 전체 전송
+            range_header = request.headers.get('range')
+            if_range = request.headers.get('if-range')
+            if if_range and if_range.strip() != etag:
+                range_header = None
+            try:
+                byte_range = parse_range_header(range_header, size)
+            except ValueError:
+                return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+            start, end = byte_range if byte_range else (0, size - 1)
+            length = max(0, end - start + 1)
+            try:
+                # ETag 조건으로 내려받아 캐시된 속성과 실제 blob이 어긋나지 않게 함
+                async with aio_clients.blob_limit():
+                    with metrics.timed('blob_download'):
+                        downloader = await blob_client.download_blob(
+                            offset=start, length=length if size else None,
+                            etag=etag, match_condition=MatchConditions.IfNotModified)
+                break
+            except (ResourceModifiedError, ResourceNotFoundError):
+                # 캐시 이후 blob이 바뀜/삭제됨 → 캐시 무효화 후 한 번 더 시도
+                blob_props_cache.pop(filename_decoded)
+        if downloader is None:
+            return not_found
+        ext = filename_decoded.lower().split('.')[-1]
+        content_type = DOWNLOAD_CONTENT_TYPES.get(ext, 'application/octet-stream')
+        headers["Content-Length"] = str(length)
+        status_code = 200
+        if byte_range:
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        async def iter_chunks():
+            # 청크 단위 전송: 파일 크기와 무관하게 워커 메모리는 청크 크기로 제한
+            async for chunk in downloader.chunks():
+                yield chunk
+
+        return StreamingResponse(iter_chunks(), status_code=status_code, media_type=content_type, headers=headers)
     except Exception as e:
+        metrics.UPSTREAM_ERRORS.inc('blob')
         print(f"[다운로드 오류] {e}")
         return JSONResponse({"error": str(e)}, status_code=500)
 BASE_DIR = Path(__file__).parent
 app.mount('/static', StaticFiles(directory=BASE_DIR / 'static'), name='static')
 
+import extraction
+
 @app.post('/upload')
 async def upload_file(file: UploadFile = File(...), overwrite: str = Form('0')):
     try:
-        conn_str = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
         container = os.getenv('AZURE_STORAGE_CONTAINER')
-        if not conn_str or not container:
+        blob_client = aio_clients.get_blob_client(container, file.filename) if container else None
+        if blob_client is None:
             return {"error": "Azure Storage 연결 정보가 없습니다."}
-        blob_service = BlobServiceClient.from_connection_string(conn_str)
-        blob_client = blob_service.get_blob_client(container=container, blob=file.filename)
-        if blob_client.exists() and overwrite != '1':
-            return {"error": f"동일한 이름의 파일({file.filename})이 이미 존재합니다."}
-        content = await file.read()
-        blob_client.upload_blob(content, overwrite=(overwrite=='1'))
-
-        # 파일 본문(text) 추출 (txt, docx, pdf 지원)
-        text_content = None
+        exists_error = {"error": f"동일한 이름의 파일({file.filename})이 이미 존재합니다."}
+        async with aio_clients.blob_limit():
+            if await blob_client.exists() and overwrite != '1':
+                return exists_error
+        # 블록 단위 병렬 업로드 + 같은 바이트를 본문 추출용 임시파일로 tee (전체 파일을 메모리에 두지 않음)
+        from azure.core.exceptions import ResourceExistsError
+        spool = new_spool()
         try:
-            ext = file.filename.lower().split('.')[-1]
-            if ext == 'txt':
-                text_content = content.decode('utf-8', errors='ignore')
-            elif ext == 'docx':
-                from io import BytesIO
-                from docx import Document
-                docx_file = BytesIO(content)
-                doc = Document(docx_file)
-                text_content = '\n'.join([p.text for p in doc.paragraphs])
-            elif ext == 'pdf':
-                from io import BytesIO
-                pdf_file = BytesIO(content)
-                text_content = ''
-                with SuppressStderr():
-                    # 1차: PyPDF2
-                    try:
-                        from PyPDF2 import PdfReader
-                        reader = PdfReader(pdf_file)
-                        text_content = '\n'.join([page.extract_text() or '' for page in reader.pages])
-                    except Exception as e1:
-                        print(f'PyPDF2 추출 실패: {e1}')
-                    # 2차: pdfplumber
-                    if not text_content.strip():
-                        try:
-                            import pdfplumber
-                            pdf_file.seek(0)
-                            with pdfplumber.open(pdf_file) as pdf:
-                                text_content = '\n'.join([page.extract_text() or '' for page in pdf.pages])
-                        except Exception as e2:
-                            print(f'pdfplumber 추출 실패: {e2}')
-                    # 3차: PyMuPDF(fitz)
-                    if not text_content.strip():
-                        try:
-                            import fitz  # PyMuPDF
-                            pdf_file.seek(0)
-                            doc = fitz.open(stream=pdf_file.read(), filetype="pdf")
-                            text_content = '\n'.join([page.get_text() for page in doc])
-                        except Exception as e3:
-                            print(f'PyMuPDF 추출 실패: {e3}')
-                    # 4차: OCR (이미지 기반 PDF, pytesseract 필요)
-                    if not text_content.strip():
-                        try:
-                            import pdfplumber
-                            import pytesseract
-                            pdf_file.seek(0)
-                            with pdfplumber.open(pdf_file) as pdf:
-                                ocr_texts = []
-                                for page in pdf.pages:
-                                    img = page.to_image(resolution=300)
-                                    ocr_text = pytesseract.image_to_string(img.original)
-                                    ocr_texts.append(ocr_text)
-                                text_content = '\n'.join(ocr_texts)
-                        except Exception as e4:
-                            print(f'OCR 추출 실패: {e4}')
-            else:
-                text_content = ''
-        except Exception as e:
-            print(f'본문 추출 오류: {e}')
-            text_content = ''
+            try:
+                with metrics.timed('blob_upload'):
+                    content_size = await stream_upload(blob_client, file, sink=spool, overwrite=(overwrite=='1'),
+                                                       content_type=file.content_type)
+            except ResourceExistsError:
+                return exists_error
+            except Exception:
+                metrics.UPSTREAM_ERRORS.inc('blob')
+                raise
+            finally:
+                blob_props_cache.pop(file.filename)
+
+            # 파일 본문(text) 추출 (txt, docx, pdf 지원) - pdf는 프로세스 풀에서 페이지 단위 병렬 처리
+            text_content, ext, extract_info, text_chunks = await extraction.extract_text(file.filename, spool)
+        finally:
+            spool.close()
 
         # Azure Cognitive Search 인덱스 자동 추가
         try:
@@ -234,7 +198,6 @@ async def upload_file(file: UploadFile = File(...), overwrite: str = Form('0')):
             search_api_key = os.getenv('AZURE_SEARCH_API_KEY')
             search_index = os.getenv('AZURE_SEARCH_INDEX')
             if search_endpoint and search_api_key and search_index:
-                import requests
                 from datetime import datetime
                 import base64
                 safe_path = base64.urlsafe_b64encode(file.filename.encode('utf-8')).decode('ascii')
@@ -244,7 +207,7 @@ async def upload_file(file: UploadFile = File(...), overwrite: str = Form('0')):
                     "metadata_storage_name": file.filename,
                     "metadata_storage_path": safe_path,
                     "metadata_storage_content_type": file.content_type,
-                    "metadata_storage_size": len(content),
+                    "metadata_storage_size": content_size,
                     "metadata_storage_last_modified": datetime.utcnow().isoformat() + 'Z',
                     "metadata_storage_file_extension": f'.{ext}'
                 }
@@ -254,7 +217,7 @@ async def upload_file(file: UploadFile = File(...), overwrite: str = Form('0')):
                     "api-key": search_api_key
                 }
                 payload = {"value": [doc]}
-                resp = requests.post(url, headers=headers, json=payload)
+                resp = await aio_clients.http_post(url, headers=headers, json=payload)
                 if resp.status_code == 200:
                     search_result = resp.json()
                 else:
@@ -264,183 +227,719 @@ async def upload_file(file: UploadFile = File(...), overwrite: str = Form('0')):
         except Exception as se:
             search_result = {"error": f"Search 인덱스 추가 오류: {str(se)}"}
 
-        # meta.json에 새 파일 정보 추가 (중복시 덮어쓰기) 및 faiss_index.bin 동기화
+        # 메타 저장소/인덱스에 추가(같은 파일명의 이전 문서는 인덱싱 시 tombstone 처리 = 덮어쓰기)
+        job_id = None
         try:
             doc = {
                 'source': file.filename,
                 'text': text_content if text_content else '',
                 'content_type': file.content_type,
-                'size': len(content)
+                'size': content_size
             }
-            # 기존 meta.json에서 동일 파일 제거 후 append, faiss_index.bin도 append
-            def run_update():
-                update_faiss_index_single(doc)
-            # 임베딩/인덱싱은 별도 스레드에서 실행(업로드 응답 지연 방지)
-            threading.Thread(target=run_update, daemon=True).start()
+            if text_chunks is not None:
+                # pdf: 추출하면서 페이지 단위로 나눈 청크 구간(인덱싱 시 본문 전체를 다시 나누지 않음)
+                doc['chunks'] = text_chunks
+            # 임베딩/인덱싱은 영속 작업 큐에 넣고 백그라운드 워커가 배치로 처리(업로드 응답 지연 방지)
+            job_id = await run_cpu(indexing_worker.submit, doc)
         except Exception as me:
-            print(f"meta/faiss_index 갱신 오류: {me}")
-        return {"message": "Azure Storage 업로드 성공", "filename": file.filename, "search_index": search_result}
+            print(f"meta/faiss_index 갱신 작업 등록 오류: {me}")
+        return {"message": "Azure Storage 업로드 성공", "filename": file.filename, "search_index": search_result,
+                "job_id": job_id, "extract": extract_info}
     except Exception as e:
         return {"error": str(e)}
 
+def select_relevant_chunks(snapshot, doc_idx, text, query_vec, max_length):
+    """문서의 청크 중 질의와 가까운 순으로 max_length까지 골라 원문 순서대로 이어 붙임"""
+    chunk_map = snapshot.chunk_map
+    rows = np.flatnonzero(chunk_map[:, 0] == doc_idx)
+    if len(rows) <= 1:
+        return None
+    # 원본 벡터(memmap)가 있으면 그대로, 없으면 인덱스에서 재구성(양자화 인덱스는 근사값)
+    if snapshot.vectors is not None:
+        vecs = np.asarray(snapshot.vectors[rows], dtype=np.float32)
+    else:
+        vecs = np.vstack([snapshot.index.reconstruct(int(r)) for r in rows])
+    query_vec = index_factory.prepare_for(snapshot.index, query_vec)
+    dists = ((vecs - query_vec) ** 2).sum(axis=1)
+    picked, total = [], 0
+    for r in rows[np.argsort(dists)]:
+        start, end = int(chunk_map[r, 2]), int(chunk_map[r, 3])
+        if picked and total + (end - start) > max_length:
+            continue
+        picked.append((start, end))
+        total += end - start
+    picked.sort()
+    return '\n...\n'.join(text[start:end].strip() for start, end in picked)[:max_length + 200]
+
+from embed_pipeline import estimate_tokens
+
+# 요약 캐시: (본문 해시, 정규화 질의, 배포명, 프롬프트 버전) → 키워드/요약
+SUMMARY_PROMPT_VERSION = 'v1'
+SUMMARY_CACHE_SIZE = int(os.getenv('SUMMARY_CACHE_SIZE', '512'))
+SUMMARY_CACHE_TTL_SEC = float(os.getenv('SUMMARY_CACHE_TTL_SEC', '86400'))
+# 1이면 스트리밍 응답에서도 서버 집계 토큰 사용량 요청(stream_options, 최신 API 버전 필요). 0이면 추정치 기록
+OPENAI_STREAM_USAGE = os.getenv('OPENAI_STREAM_USAGE', '0') == '1'
+summary_cache = LRUTTLCache(SUMMARY_CACHE_SIZE, ttl=SUMMARY_CACHE_TTL_SEC)
+summary_flight = AsyncSingleFlight()
+summary_stats = {'requests': 0, 'cache_hits': 0, 'streamed': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+
+async def prepare_summary_prompt(data, trace=None):
+    """요청 본문 → (문서명, 정규화 질의, 발췌 본문, 프롬프트). 본문이 없으면 프롬프트 None"""
+    text = data.get("text", "")
+    # 공백/유니코드 차이만 있는 질의는 같은 요약(캐시 키와 프롬프트 모두 정규화 질의 사용)
+    query = normalize_text(data.get('query', ''))
+    doc_title = data.get('source', '문서명없음')
+    max_length = 4000
+    relevant_text = None
+    # text가 없으면 메타 저장소에서 source로 본문 찾아서 사용
+    if not text:
+        # 문서명 색인으로 해당 문서 1건만 조회(현재 스냅샷에 반영된 문서 범위 내)
+        snapshot = await run_cpu(index_holder.get)
+        with metrics.timed('metadata_lookup', trace):
+            doc_idx, doc = await run_cpu(index_holder.store.find_by_source, doc_title, len(snapshot.meta))
+        if doc is not None:
+            text = doc.get('text', '')
+        # 긴 문서는 질의와 가까운 청크 위주로 발췌(질의 임베딩은 검색 때 캐시된 것 재사용)
+        if doc_idx is not None and query and len(text) > max_length:
+            try:
+                query_vec = await get_openai_embedding(query)
+                relevant_text = await run_cpu(select_relevant_chunks, snapshot, doc_idx, text, query_vec, max_length)
+            except Exception as ce:
+                print(f"[요약 요청] 관련 청크 선택 실패(앞/뒤 발췌로 대체): {ce}")
+    if trace is not None:
+        trace.event(f"text 길이: {len(text)}, 내용: {text[:100]}")  # 앞 100자만
+        trace.event(f"query: {query}, 관련 청크 발췌: {'예' if relevant_text else '아니오'}")
+    if relevant_text:
+        text = relevant_text
+    elif text and len(text) > max_length:
+        # 앞 2000자 + 뒤 2000자 합침
+        text = text[:2000] + '\n...\n' + text[-2000:]
+    if not text:
+        return doc_title, query, text, None
+    prompt = (
+        f"아래는 문서의 본문입니다. 문서명: {doc_title}\n"
+        f"본문을 충분히 읽고, 요구사항과 관련된 핵심 키워드 5개와 요약문을 각각 한글로 작성해줘.\n"
+        f"[요구사항]\n{query}\n[문서 본문]\n{text}\n---\n"
+        f"출력 형식:\n키워드: 키워드1, 키워드2, 키워드3, 키워드4, 키워드5\n요약: (2~3문장)"
+    )
+    return doc_title, query, text, prompt
+
+def summary_cache_key(doc_title, text, query, deployment):
+    # 본문 해시(문서명 + 실제로 보낸 발췌 본문): 문서가 바뀌면 자동으로 다른 키
+    content_hash = text_key(f"{doc_title}\n{text}")
+    return f"{content_hash}|{query}|{deployment}|{SUMMARY_PROMPT_VERSION}"
+
+def parse_summary(output):
+    import re
+    kw_match = re.search(r'키워드\s*[:：]\s*(.+)', output)
+    summary_match = re.search(r'요약\s*[:：]\s*(.+)', output)
+    keywords = kw_match.group(1).strip() if kw_match else ''
+    summary = summary_match.group(1).strip() if summary_match else output.strip()
+    return {"keywords": keywords, "summary": summary}
+
+def record_summary_usage(doc_title, cached, usage, elapsed_ms, streamed=False, trace=None):
+    summary_stats['requests'] += 1
+    if cached:
+        summary_stats['cache_hits'] += 1
+    if streamed:
+        summary_stats['streamed'] += 1
+    if usage:
+        summary_stats['prompt_tokens'] += usage.get('prompt_tokens', 0)
+        summary_stats['completion_tokens'] += usage.get('completion_tokens', 0)
+    # 요청별 상세는 추적이 켜진 경우에만 기록(집계는 /metrics, /cache/stats)
+    if trace is not None:
+        trace.event(f"요약 '{doc_title}' cache={'hit' if cached else 'miss'}, usage={usage}, {elapsed_ms:.0f}ms")
+
+def _usage_dict(usage):
+    if usage is None:
+        return None
+    return {'prompt_tokens': usage.prompt_tokens, 'completion_tokens': usage.completion_tokens,
+            'total_tokens': usage.total_tokens}
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def with_trace(response, trace):
+    """추적이 켜져 있으면 로그로 출력하고, 요청에서 켠 경우 응답 dict에도 포함"""
+    if trace is not None:
+        summary = trace.finish()
+        if trace.requested:
+            response['trace'] = summary
+    return response
+
 @app.post('/summarize')
 async def summarize(request: Request):
+    """
+    문서 키워드/요약 생성. 같은 본문·질의·배포·프롬프트 버전이면 캐시 결과 반환.
+    요청에 stream: true면 SSE(text/event-stream)로 응답: delta(생성 중 텍스트) → done(결과) / error
+    trace: true(또는 X-Trace: 1 헤더)면 단계별 시간을 응답(done 이벤트)에 포함
+    """
+    import time
+    started = time.perf_counter()
     try:
         data = await request.json()
-        text = data.get("text", "")
-        query = data.get('query', '')
-        doc_title = data.get('source', '문서명없음')
-        # text가 없으면 meta.json에서 source로 본문 찾아서 사용
-        if not text:
-            meta_path = BASE_DIR / 'meta.json'
-            if meta_path.exists():
-                with open(meta_path, encoding='utf-8') as f:
-                    meta = json.load(f)
-                for item in meta:
-                    if item.get('source') == doc_title:
-                        text = item.get('text', '')
-                        break
-        print(f"[요약 요청] text 길이: {len(text)}, 내용: {text[:100]}")  # 앞 100자만 출력
-        print(f"[요약 요청] query: {query}")
-        max_length = 4000
-        if text and len(text) > max_length:
-            # 앞 2000자 + 뒤 2000자 합침
-            text = text[:2000] + '\n...\n' + text[-2000:]
-        if not text:
-            return JSONResponse({"error": "본문이 없습니다."})
-        prompt = (
-            f"아래는 문서의 본문입니다. 문서명: {doc_title}\n"
-            f"본문을 충분히 읽고, 요구사항과 관련된 핵심 키워드 5개와 요약문을 각각 한글로 작성해줘.\n"
-            f"[요구사항]\n{query}\n[문서 본문]\n{text}\n---\n"
-            f"출력 형식:\n키워드: 키워드1, 키워드2, 키워드3, 키워드4, 키워드5\n요약: (2~3문장)"
-        )
+        stream = bool(data.get('stream'))
+        trace = metrics.start_trace('summarize', metrics.trace_requested(request, data.get('trace')))
+        doc_title, query, text, prompt = await prepare_summary_prompt(data, trace)
+        if prompt is None:
+            error = with_trace({"error": "본문이 없습니다."}, trace)
+            if stream:
+                return StreamingResponse(iter([_sse('error', error)]), media_type='text/event-stream')
+            return JSONResponse(error)
         gpt_deployment = os.getenv('GPT_DEPLOYMENT') or 'gpt-3.5-turbo'
-        completion = openai.chat.completions.create(
-            model=gpt_deployment,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=500,
-            temperature=1.0
-        )
-        output = completion.choices[0].message.content
-        import re
-        kw_match = re.search(r'키워드\s*[:：]\s*(.+)', output)
-        summary_match = re.search(r'요약\s*[:：]\s*(.+)', output)
-        keywords = kw_match.group(1).strip() if kw_match else ''
-        summary = summary_match.group(1).strip() if summary_match else output.strip()
-        return JSONResponse({"keywords": keywords, "summary": summary})
+        key = summary_cache_key(doc_title, text, query, gpt_deployment)
+        request_kwargs = dict(model=gpt_deployment, messages=[{"role": "user", "content": prompt}],
+                              max_tokens=500, temperature=1.0)
+        cached = summary_cache.get(key)
+        if cached is not None:
+            record_summary_usage(doc_title, True, None, (time.perf_counter() - started) * 1000, streamed=stream,
+                                 trace=trace)
+            result = with_trace(dict(cached, cached=True), trace)
+            if stream:
+                return StreamingResponse(iter([_sse('done', result)]), media_type='text/event-stream')
+            return JSONResponse(result)
+        if stream:
+            return StreamingResponse(stream_summary(doc_title, prompt, key, request_kwargs, started, trace),
+                                     media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+        async def load():
+            completion = await aio_clients.create_chat_completion(**request_kwargs)
+            result = parse_summary(completion.choices[0].message.content)
+            summary_cache.set(key, result)
+            return result, _usage_dict(getattr(completion, 'usage', None))
+        # 같은 요약을 동시에 요청하면 GPT 호출 1회로 병합
+        (result, usage), shared = await summary_flight.do(key, load)
+        record_summary_usage(doc_title, shared, None if shared else usage, (time.perf_counter() - started) * 1000,
+                             trace=trace)
+        return JSONResponse(with_trace(dict(result, cached=shared, usage=None if shared else usage), trace))
     except Exception as e:
         return JSONResponse({"error": str(e)})
+
+async def stream_summary(doc_title, prompt, key, request_kwargs, started, trace=None):
+    """GPT 스트리밍 응답을 SSE로 중계, 완료 시 결과를 캐시에 저장"""
+    import time
+    parts, usage = [], None
+    kwargs = dict(request_kwargs)
+    if OPENAI_STREAM_USAGE:
+        kwargs['stream_options'] = {'include_usage': True}
     try:
-        import re
-        data = await request.json()
-        text = data.get("text", "")
-        query = data.get('query', '')
-        doc_title = data.get('source', '문서명없음')
-        # text가 없으면 meta.json에서 source로 본문 찾아서 사용
-        if not text:
-            meta_path = BASE_DIR / 'meta.json'
-            if meta_path.exists():
-                with open(meta_path, encoding='utf-8') as f:
-                    meta = json.load(f)
-                found = False
-                for item in meta:
-                    # 공백 제거 후 비교
-                    if item.get('source', '').strip() == doc_title.strip():
-                        text = item.get('text', '')
-                        print(f"[매칭된 문서명] {doc_title} -> [본문 길이] {len(text)}")
-                        found = True
-                        break
-                if not found:
-                    print(f"[매칭 실패] 요청 문서명: {doc_title}, meta.json 내 source 목록: {[item.get('source') for item in meta]}")
-                    return JSONResponse({"error": "본문이 없습니다. (문서명 매칭 실패)"})
-                if not text or not text.strip():
-                    print(f"[본문 없음] 문서명: {doc_title}, 실제 본문: '{text}'")
-                    return JSONResponse({"error": "본문이 없습니다. (text 필드 비어있음)"})
-        print(f"[요약 요청] text 길이: {len(text)}, 내용: {text[:100]}")  # 앞 100자만 출력
-        print(f"[요약 요청] query: {query}")
-        max_length = 4000
-        if text and len(text) > max_length:
-            # 앞 2000자 + 뒤 2000자 합침
-            text = text[:2000] + '\n...\n' + text[-2000:]
-        prompt = (
-            f"아래는 문서의 본문입니다. 문서명: {doc_title}\n"
-            f"본문을 충분히 읽고, 요구사항과 관련된 핵심 키워드 5개와 요약문을 각각 한글로 작성해줘.\n"
-            f"[요구사항]\n{query}\n[문서 본문]\n{text}\n---\n"
-            f"출력 형식:\n키워드: 키워드1, 키워드2, 키워드3, 키워드4, 키워드5\n요약: (2~3문장)"
-        )
-        gpt_deployment = os.getenv('GPT_DEPLOYMENT') or 'gpt-3.5-turbo'
-        completion = openai.chat.completions.create(
-            model=gpt_deployment,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=500,
-            temperature=1.0
-        )
-        output = completion.choices[0].message.content
-        kw_match = re.search(r'키워드\s*[:：]\s*(.+)', output)
-        summary_match = re.search(r'요약\s*[:：]\s*(.+)', output)
-        keywords = kw_match.group(1).strip() if kw_match else ''
-        summary = summary_match.group(1).strip() if summary_match else output.strip()
-        return JSONResponse({"keywords": keywords, "summary": summary})
+        async for chunk in aio_clients.stream_chat_completion(**kwargs):
+            if getattr(chunk, 'usage', None) is not None:
+                usage = _usage_dict(chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield _sse('delta', {'text': delta})
     except Exception as e:
-        return JSONResponse({"error": str(e)})
+        print(f"[요약 요청] 스트리밍 오류: {e}")
+        yield _sse('error', with_trace({'error': str(e)}, trace))
+        return
+    output = ''.join(parts)
+    if usage is None:
+        # 스트리밍 응답에 사용량이 없으면 토큰 수 추정치 기록
+        usage = {'prompt_tokens': estimate_tokens(prompt), 'completion_tokens': estimate_tokens(output),
+                 'estimated': True}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+    result = parse_summary(output)
+    summary_cache.set(key, result)
+    record_summary_usage(doc_title, False, usage, (time.perf_counter() - started) * 1000, streamed=True, trace=trace)
+    yield _sse('done', with_trace(dict(result, cached=False, usage=usage), trace))
 
 
-FAISS_INDEX_PATH = BASE_DIR / 'faiss_index.bin'
-META_PATH = BASE_DIR / 'meta.json'
+from index_store import IndexHolder
+import index_factory
+import doc_filters
 
-def get_openai_embedding(text):
-    response = openai.embeddings.create(
-        input=[text],
-        model=EMBED_MODEL
-    )
-    return np.array(response.data[0].embedding, dtype=np.float32).reshape(1, -1)
+# 인덱스/메타는 워커당 한 번 로드해 상주, 갱신 시 핫스왑
+index_holder = IndexHolder()
 
-def vector_search(query, top_k=5):
-    # 검색 시마다 최신 인덱스/메타 로딩 및 상세 로그 출력
-    print("[vector_search] --- 검색 시작 ---")
-    print(f"[vector_search] faiss_index.bin: {FAISS_INDEX_PATH}, meta.json: {META_PATH}")
-    faiss_index = faiss.read_index(str(FAISS_INDEX_PATH))
-    with open(META_PATH, encoding='utf-8') as f:
-        meta = json.load(f)
-    print(f"[vector_search] meta.json 문서 개수: {len(meta)}")
-    query_vec = get_openai_embedding(query)
-    print(f"[vector_search] 쿼리 임베딩 shape: {query_vec.shape}")
+@app.on_event('startup')
+def load_index_on_startup():
     try:
-        index_ntotal = faiss_index.ntotal
+        index_holder.load()
     except Exception as e:
-        index_ntotal = '알 수 없음'
-    print(f"[vector_search] faiss_index.bin 벡터 개수: {index_ntotal}")
-    D, I = faiss_index.search(query_vec, top_k)
-    print(f"[vector_search] faiss_index.search 결과 D: {D}, I: {I}")
-    results = []
-    for idx, score in zip(I[0], D[0]):
-        print(f"[vector_search] 결과 idx: {idx}, score: {score}")
-        if idx < 0 or idx >= len(meta):
-            print(f"[vector_search] idx {idx}가 meta 범위({len(meta)})를 벗어남, continue")
+        print(f"[app.py] 시작 시 인덱스 로드 실패(첫 검색 시 재시도): {e}")
+
+from indexer import IndexingWorker
+
+# 업로드 문서 인덱싱 작업 큐/워커(미완료 작업은 시작 시 복구)
+indexing_worker = IndexingWorker()
+
+@app.on_event('startup')
+def start_indexing_worker():
+    indexing_worker.start()
+
+@app.on_event('shutdown')
+def stop_indexing_worker():
+    indexing_worker.stop()
+
+@app.get('/jobs/{job_id}')
+async def job_status(job_id: str):
+    job = await run_cpu(indexing_worker.queue.get, job_id)
+    if job is None:
+        return JSONResponse({"error": f"작업({job_id})을 찾을 수 없습니다."}, status_code=404)
+    return job
+
+@app.get('/index/status')
+async def index_status():
+    # 워커별 현재 스냅샷(generation/로드 시각) 확인용
+    return index_holder.status()
+
+from index_store import delete_documents
+
+@app.delete('/index/documents')
+async def delete_indexed_document(filename: str = Query(..., description="검색 인덱스에서 삭제할 파일명")):
+    """
+    문서를 벡터/키워드 검색에서 삭제(tombstone, Blob 원본은 유지). 인덱스 파일은 다시 쓰지 않고
+    삭제 비율이 INDEX_COMPACT_RATIO를 넘으면 백그라운드 워커가 압축
+    """
+    try:
+        deleted, stamp = await run_cpu(delete_documents, [filename])
+        if not deleted:
+            return JSONResponse({"error": f"인덱스에 문서({filename})가 없습니다."}, status_code=404)
+        indexing_worker.check_compaction(stamp)
+        return {"message": "인덱스에서 삭제되었습니다.", "filename": filename, "doc_ids": deleted,
+                "generation": stamp['generation']}
+    except Exception as e:
+        return {"error": str(e)}
+
+from embed_pipeline import EMBED_DIMENSIONS
+
+# 질의 임베딩 캐시(정규화 텍스트 기준 LRU + TTL) 및 동일 질의 동시 요청 병합
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', '2048'))
+QUERY_CACHE_TTL_SEC = float(os.getenv('QUERY_CACHE_TTL_SEC', '3600'))
+query_embedding_cache = LRUTTLCache(QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL_SEC)
+query_embedding_flight = AsyncSingleFlight()
+query_embedding_stats = {'api_calls': 0, 'api_ms_total': 0.0, 'saved_ms_total': 0.0}
+
+async def _embed_query_uncached(text):
+    import time
+    started = time.perf_counter()
+    response = await aio_clients.create_embeddings([text], model=EMBED_MODEL, dimensions=EMBED_DIMENSIONS)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    query_embedding_stats['api_calls'] += 1
+    query_embedding_stats['api_ms_total'] += elapsed_ms
+    return np.array(response.data[0].embedding, dtype=np.float32).reshape(1, -1)
+
+def _avg_embed_ms():
+    calls = query_embedding_stats['api_calls']
+    return query_embedding_stats['api_ms_total'] / calls if calls else 0.0
+
+async def get_openai_embedding(text):
+    key = normalize_text(text)
+    cached = query_embedding_cache.get(key)
+    if cached is not None:
+        # 캐시 적중 시 평균 API 지연만큼 절약한 것으로 집계
+        query_embedding_stats['saved_ms_total'] += _avg_embed_ms()
+        return cached
+    async def load():
+        vec = await _embed_query_uncached(key)
+        query_embedding_cache.set(key, vec)
+        return vec
+    vec, shared = await query_embedding_flight.do(key, load)
+    if shared:
+        query_embedding_stats['saved_ms_total'] += _avg_embed_ms()
+    return vec
+
+# 배치 검색 시 임베딩 요청 1건에 묶을 질의 수
+SEARCH_BATCH_EMBED_ITEMS = int(os.getenv('SEARCH_BATCH_EMBED_ITEMS', '256'))
+
+async def get_openai_embeddings(texts):
+    """
+    여러 질의 임베딩 (n, d). 캐시 적중분과 중복 질의는 제외하고
+    나머지를 요청당 SEARCH_BATCH_EMBED_ITEMS건씩 묶어 동시에 호출
+    """
+    import asyncio
+    import time
+    keys = [normalize_text(t) for t in texts]
+    found, missing = {}, []
+    for key in dict.fromkeys(keys):
+        cached = query_embedding_cache.get(key)
+        if cached is not None:
+            found[key] = cached
+            query_embedding_stats['saved_ms_total'] += _avg_embed_ms()
+        else:
+            missing.append(key)
+
+    async def embed_batch(batch):
+        started = time.perf_counter()
+        response = await aio_clients.create_embeddings(batch, model=EMBED_MODEL, dimensions=EMBED_DIMENSIONS)
+        query_embedding_stats['api_calls'] += 1
+        query_embedding_stats['api_ms_total'] += (time.perf_counter() - started) * 1000
+        for item in response.data:
+            vec = np.array(item.embedding, dtype=np.float32).reshape(1, -1)
+            query_embedding_cache.set(batch[item.index], vec)
+            found[batch[item.index]] = vec
+
+    await asyncio.gather(*(embed_batch(missing[i:i + SEARCH_BATCH_EMBED_ITEMS])
+                           for i in range(0, len(missing), SEARCH_BATCH_EMBED_ITEMS)))
+    return np.vstack([found[key] for key in keys])
+
+@app.get('/cache/stats')
+async def cache_stats():
+    stats = query_embedding_cache.stats()
+    stats.update({
+        'coalesced': query_embedding_flight.coalesced,
+        'embedding_api_calls': query_embedding_stats['api_calls'],
+        'embedding_avg_ms': round(_avg_embed_ms(), 2),
+        'embedding_saved_ms_total': round(query_embedding_stats['saved_ms_total'], 1),
+    })
+    summary = summary_cache.stats()
+    summary.update(summary_stats)
+    return {'query_embedding': stats, 'summary': summary, 'search_filter': doc_filters.cache_stats()}
+
+# 청크 단위로 top_k × 배수만큼 찾은 뒤 문서 단위로 합산
+CHUNK_SEARCH_EXPANSION = int(os.getenv('CHUNK_SEARCH_EXPANSION', '4'))
+
+def search_scope(snapshot, filters=None, trace=None):
+    """검색 범위(삭제 문서 + 필터 불일치 문서 제외). 필터별 비트맵은 generation마다 한 번만 만듦"""
+    if not filters:
+        return doc_filters.unfiltered(snapshot)
+    with metrics.timed('filter_resolve', trace):
+        scope = doc_filters.resolve(snapshot, index_holder.store, filters)
+    if trace is not None:
+        trace.event(f"필터 {doc_filters.describe(filters)}: 문서 {scope.docs}건, 벡터 {scope.rows}개")
+    return scope
+
+def rank_documents(snapshot, query_vec, top_k=5, agg='max', nprobe=None, ef_search=None, trace=None, scope=None):
+    """FAISS 검색 + 청크→문서 집계, 유사도 내림차순 [(문서 번호, 유사도)]"""
+    faiss_index = snapshot.index
+    scope = scope or doc_filters.unfiltered(snapshot)
+    if trace is not None:
+        trace.event(f"generation: {snapshot.generation}, 메타 문서 {len(snapshot.meta)}개, "
+                    f"벡터 {faiss_index.ntotal}개, 쿼리 임베딩 shape: {query_vec.shape}")
+    if not scope.rows:
+        return []
+    k = max(top_k, min(top_k * CHUNK_SEARCH_EXPANSION, scope.rows))
+    # ANN 인덱스(IVF/HNSW)는 요청별 nprobe/efSearch 적용, flat은 그대로 정확 검색
+    # 삭제(tombstone) 문서와 필터에 맞지 않는 문서의 청크는 FAISS 검색 단계에서 제외
+    with metrics.timed('faiss_search', trace):
+        D, I = index_factory.search(faiss_index, query_vec, k, nprobe=nprobe, ef_search=ef_search,
+                                    vectors=snapshot.vectors, row_filter=scope.row_filter)
+    with metrics.timed('metadata_lookup', trace):
+        return aggregate_hits(snapshot, I[0], D[0], agg, trace, scope.exclude)
+
+def aggregate_hits(snapshot, ids, scores, agg='max', trace=None, exclude=None):
+    """청크 검색 결과(id/점수 한 행) → 문서 단위 [(문서 번호, 유사도)] 내림차순. exclude: 제외할 문서(기본은 삭제 문서)"""
+    meta = snapshot.meta
+    chunk_map = snapshot.chunk_map
+    exclude = snapshot.deleted if exclude is None else exclude
+    doc_scores = {}
+    for idx, score in zip(ids, scores):
+        if trace is not None:
+            trace.event(f"결과 idx: {idx}, score: {score}")
+        if idx < 0 or idx >= len(chunk_map):
+            continue
+        doc_idx = int(chunk_map[idx, 0])
+        if doc_idx >= len(meta):
+            if trace is not None:
+                trace.event(f"idx {idx}의 문서 {doc_idx}가 meta 범위({len(meta)})를 벗어남, 제외")
             continue
-        item = meta[idx]
-        similarity = 1 / (1 + float(score))
-        results.append({
-            '문서명': item.get('source', '제목없음'),
-            '유사도': similarity
-        })
-    print(f"[vector_search] 최종 결과 개수: {len(results)}")
-    print("[vector_search] --- 검색 종료 ---")
-    results = sorted(results, key=lambda x: -x['유사도'])
-    return results
+        if exclude[doc_idx]:
+            continue
+        similarity = index_factory.similarity(snapshot.index, score)
+        if agg == 'sum':
+            doc_scores[doc_idx] = doc_scores.get(doc_idx, 0.0) + similarity
+        else:
+            doc_scores[doc_idx] = max(doc_scores.get(doc_idx, 0.0), similarity)
+    return sorted(doc_scores.items(), key=lambda x: -x[1])
+
+def rank_documents_batch(snapshot, query_vecs, top_k=5, agg='max', nprobe=None, ef_search=None, scope=None):
+    """여러 질의를 행렬 검색 1회로 처리, 질의별 [(문서 번호, 유사도)]"""
+    scope = scope or doc_filters.unfiltered(snapshot)
+    if not scope.rows:
+        return [[] for _ in range(len(query_vecs))]
+    k = max(top_k, min(top_k * CHUNK_SEARCH_EXPANSION, scope.rows))
+    with metrics.timed('faiss_search'):
+        D, I = index_factory.search(snapshot.index, query_vecs, k, nprobe=nprobe, ef_search=ef_search,
+                                    vectors=snapshot.vectors, row_filter=scope.row_filter)
+    with metrics.timed('metadata_lookup'):
+        return [aggregate_hits(snapshot, I[row], D[row], agg, exclude=scope.exclude) for row in range(len(I))]
+
+def format_results(meta, ranked, top_k):
+    return [{'문서명': meta[doc_idx].get('source', '제목없음'), '유사도': score} for doc_idx, score in ranked[:top_k]]
+
+def search_snapshot(query_vec, top_k=5, agg='max', nprobe=None, ef_search=None, trace=None, filters=None):
+    """벡터 검색(CPU 작업, 스레드 풀에서 실행)"""
+    # 상주 스냅샷 사용(파일이 갱신된 경우에만 재로딩)
+    snapshot = index_holder.get()
+    scope = search_scope(snapshot, filters, trace)
+    ranked = rank_documents(snapshot, query_vec, top_k, agg, nprobe, ef_search, trace, scope)
+    return format_results(snapshot.meta, ranked, top_k)
+
+from lexical_index import LexicalIndex, rrf_fuse
+
+# 키워드(BM25) 색인: 상주 스냅샷의 meta 기준, 업로드로 문서가 추가되면 새 문서만 색인
+lexical_index = LexicalIndex()
+SEARCH_MODE = os.getenv('SEARCH_MODE', 'vector')
+# 질의 임베딩 대기 한도(초과 시 키워드 검색 결과로 응답, 임베딩은 계속 진행되어 캐시에 저장)
+SEARCH_EMBED_TIMEOUT_SEC = float(os.getenv('SEARCH_EMBED_TIMEOUT_SEC', '2.0'))
+# 하이브리드 병합 시 각 목록에서 가져올 후보 수(top_k 배수)
+HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', '4'))
+
+def lexical_snapshot():
+    snapshot = index_holder.get()
+    lexical_index.sync(snapshot.meta, snapshot.generation, load_docs=index_holder.store.iter_docs)
+    return snapshot
+
+def _build_lexical_index():
+    try:
+        lexical_snapshot()
+    except Exception as e:
+        print(f"[app.py] 키워드 색인 생성 실패(요청 시 재시도): {e}")
+
+@app.on_event('startup')
+def build_lexical_index_on_startup():
+    # 색인 구성은 문서 수에 비례 → 백그라운드 스레드에서 처리해 워커 기동을 막지 않음
+    # (그동안 벡터 검색은 바로 처리, 키워드/하이브리드 검색은 구성이 끝날 때까지 대기)
+    import threading
+    threading.Thread(target=_build_lexical_index, name='lexical-build', daemon=True).start()
+
+def lexical_search(query, top_k=5, trace=None, filters=None):
+    snapshot = lexical_snapshot()
+    scope = search_scope(snapshot, filters, trace)
+    with metrics.timed('lexical_search', trace):
+        ranked = lexical_index.search(query, top_k, exclude=scope.exclude)
+    return format_results(snapshot.meta, ranked, top_k)
+
+def hybrid_search_snapshot(query, query_vec, top_k=5, agg='max', nprobe=None, ef_search=None, trace=None,
+                           filters=None):
+    """벡터 순위 + BM25 순위를 RRF로 병합"""
+    snapshot = lexical_snapshot()
+    scope = search_scope(snapshot, filters, trace)
+    depth = max(top_k * HYBRID_CANDIDATES, 20)
+    vector_ranked = rank_documents(snapshot, query_vec, depth, agg, nprobe, ef_search, trace, scope)[:depth]
+    with metrics.timed('lexical_search', trace):
+        lexical_ranked = lexical_index.search(query, depth, exclude=scope.exclude)
+    return format_results(snapshot.meta, rrf_fuse([vector_ranked, lexical_ranked], top_k), top_k)
+
+def _discard_result(task):
+    # 타임아웃 후 백그라운드에서 끝난 임베딩의 예외는 무시(다음 요청이 다시 시도)
+    if not task.cancelled():
+        task.exception()
+
+async def embedding_with_deadline(query):
+    """질의 임베딩(SEARCH_EMBED_TIMEOUT_SEC 초과/실패 시 None)"""
+    import asyncio
+    task = asyncio.ensure_future(get_openai_embedding(query))
+    try:
+        # shield: 타임아웃이어도 임베딩 요청은 끝까지 진행 → 같은 질의 재요청 시 캐시 적중
+        return await asyncio.wait_for(asyncio.shield(task), SEARCH_EMBED_TIMEOUT_SEC)
+    except asyncio.TimeoutError:
+        task.add_done_callback(_discard_result)
+        print(f"[app.py] 질의 임베딩 {SEARCH_EMBED_TIMEOUT_SEC}초 초과 → 키워드 검색으로 대체")
+    except Exception as e:
+        print(f"[app.py] 질의 임베딩 실패 → 키워드 검색으로 대체: {e}")
+    return None
 
 # 검색 API 추가
-from fastapi import Query
 @app.get('/search')
-async def search(q: str = Query(..., description="검색 질의"), top_k: int = Query(5, description="결과 수")):
+async def search(q: str = Query(..., description="검색 질의"), top_k: int = Query(5, description="결과 수"),
+                 agg: str = Query('max', description="청크 점수 집계 방식(max/sum)"),
+                 nprobe: int = Query(None, description="IVF 인덱스 탐색 클러스터 수(미지정 시 기본값)"),
+                 ef_search: int = Query(None, description="HNSW 인덱스 efSearch(미지정 시 기본값)"),
+                 mode: str = Query(None, description="검색 방식(vector/lexical/hybrid, 미지정 시 SEARCH_MODE)"),
+                 trace_on: bool = Query(False, alias='trace', description="상세 추적(단계별 시간/검색 결과 id를 응답에 포함)"),
+                 year: str = Query(None, description="DR 연도 필터(쉼표 구분, 2024-2025 범위 가능)"),
+                 dr: str = Query(None, description="DR 번호 필터(쉼표 구분, 예: DR-2025-12349)"),
+                 menu: str = Query(None, description="메뉴 경로 필터(쉼표 구분, 상위 메뉴 지정 시 하위 포함, 예: KRDS>수수료)"),
+                 ext: str = Query(None, description="확장자 필터(쉼표 구분, 예: docx,pdf)"),
+                 content_type: str = Query(None, description="Content-Type 필터(쉼표 구분)"),
+                 request: Request = None):
     try:
-        results = vector_search(q, top_k)
+        mode = (mode or SEARCH_MODE).lower()
+        if mode not in ('vector', 'lexical', 'hybrid'):
+            return {"error": f"지원하지 않는 검색 방식: {mode}"}
+        # 같은 속성의 값은 OR, 속성 간은 AND. 필터는 FAISS/BM25 검색 단계에서 적용(검색 후 걸러내지 않음)
+        filters = doc_filters.parse_filters(year, dr, menu, ext, content_type)
+        # 추적이 꺼져 있으면 trace=None(검색 경로에서 로그/문자열 생성 없음)
+        trace = metrics.start_trace('search', metrics.trace_requested(request, trace_on))
+        if trace is not None:
+            trace.event(f"질의: {q}, mode={mode}, top_k={top_k}, agg={agg}")
+        message = None
+        if mode == 'lexical':
+            results = await run_cpu(lexical_search, q, top_k, trace, filters)
+        else:
+            with metrics.timed('query_embedding', trace):
+                query_vec = await embedding_with_deadline(q)
+            if query_vec is None:
+                # 임베딩 지연/실패(스로틀링 등) 시 키워드 검색만으로 응답
+                results = await run_cpu(lexical_search, q, top_k, trace, filters)
+                mode, message = 'lexical', "임베딩 응답 지연으로 키워드 검색 결과를 반환합니다."
+            elif mode == 'hybrid':
+                results = await run_cpu(hybrid_search_snapshot, q, query_vec, top_k, agg, nprobe, ef_search, trace,
+                                        filters)
+            else:
+                results = await run_cpu(search_snapshot, query_vec, top_k, agg, nprobe, ef_search, trace, filters)
+        if trace is not None:
+            trace.event(f"최종 결과 {len(results)}건")
         if not results:
-            return {"질의": q, "결과": [], "메시지": "검색 결과가 없습니다."}
-        return {"질의": q, "결과": results}
+            response = {"질의": q, "결과": [], "검색방식": mode, "메시지": "검색 결과가 없습니다."}
+            if filters:
+                response["필터"] = doc_filters.describe(filters)
+            return with_trace(response, trace)
+        response = {"질의": q, "결과": results, "검색방식": mode}
+        if filters:
+            response["필터"] = doc_filters.describe(filters)
+        if message:
+            response["메시지"] = message
+        return with_trace(response, trace)
     except Exception as e:
         return {"error": str(e)}
 
+# 배치 검색: 최대 질의 수, NDJSON 스트리밍 시 한 번에 처리할 질의 수
+SEARCH_BATCH_MAX = int(os.getenv('SEARCH_BATCH_MAX', '500'))
+SEARCH_BATCH_STREAM_CHUNK = int(os.getenv('SEARCH_BATCH_STREAM_CHUNK', '32'))
+
+def batch_search_snapshot(queries, query_vecs, top_k=5, agg='max', mode='vector', nprobe=None, ef_search=None,
+                          filters=None):
+    """여러 질의 검색(CPU 작업). query_vecs가 None이면 키워드 검색만. filters는 모든 질의에 공통 적용"""
+    snapshot = lexical_snapshot() if mode != 'vector' else index_holder.get()
+    scope = search_scope(snapshot, filters)
+    if mode == 'lexical' or query_vecs is None:
+        with metrics.timed('lexical_search'):
+            ranked = [lexical_index.search(q, top_k, exclude=scope.exclude) for q in queries]
+    elif mode == 'hybrid':
+        depth = max(top_k * HYBRID_CANDIDATES, 20)
+        vector_ranked = rank_documents_batch(snapshot, query_vecs, depth, agg, nprobe, ef_search, scope)
+        with metrics.timed('lexical_search'):
+            ranked = [rrf_fuse([v[:depth], lexical_index.search(q, depth, exclude=scope.exclude)], top_k)
+                      for q, v in zip(queries, vector_ranked)]
+    else:
+        ranked = rank_documents_batch(snapshot, query_vecs, top_k, agg, nprobe, ef_search, scope)
+    return [format_results(snapshot.meta, r, top_k) for r in ranked]
+
+async def run_batch_search(queries, top_k, agg, mode, nprobe, ef_search, filters=None):
+    """임베딩 1회(배치) + 행렬 검색 1회. 임베딩 실패 시 키워드 검색으로 대체"""
+    query_vecs, message = None, None
+    if mode != 'lexical':
+        try:
+            query_vecs = await get_openai_embeddings(queries)
+        except Exception as e:
+            print(f"[app.py] 배치 질의 임베딩 실패 → 키워드 검색으로 대체: {e}")
+            mode, message = 'lexical', "임베딩 실패로 키워드 검색 결과를 반환합니다."
+    results = await run_cpu(batch_search_snapshot, queries, query_vecs, top_k, agg, mode, nprobe, ef_search, filters)
+    return results, mode, message
+
+async def iter_batch_ndjson(queries, top_k, agg, mode, nprobe, ef_search, filters=None):
+    """질의를 SEARCH_BATCH_STREAM_CHUNK개씩 처리해 끝나는 대로 한 줄씩 전송(다음 묶음은 미리 시작)"""
+    import asyncio
+    chunk = max(1, SEARCH_BATCH_STREAM_CHUNK)
+    starts = list(range(0, len(queries), chunk))
+    pending = asyncio.ensure_future(run_batch_search(queries[:chunk], top_k, agg, mode, nprobe, ef_search, filters))
+    try:
+        for i, start in enumerate(starts):
+            try:
+                results, used_mode, message = await pending
+            except Exception as e:
+                results, used_mode, message = None, mode, str(e)
+            if i + 1 < len(starts):
+                nxt = starts[i + 1]
+                pending = asyncio.ensure_future(
+                    run_batch_search(queries[nxt:nxt + chunk], top_k, agg, mode, nprobe, ef_search, filters))
+            for j, q in enumerate(queries[start:start + chunk]):
+                line = {"번호": start + j, "질의": q, "검색방식": used_mode}
+                if results is None:
+                    line["error"] = message
+                else:
+                    line["결과"] = results[j]
+                    if message:
+                        line["메시지"] = message
+                yield json.dumps(line, ensure_ascii=False) + '\n'
+    finally:
+        if not pending.done():
+            pending.cancel()
+
+@app.post('/search/batch')
+async def search_batch(request: Request):
+    """
+    여러 질의를 한 번에 검색. 요청: {"queries": [...], "top_k", "agg", "mode", "nprobe", "ef_search", "stream", "filters"}
+    filters: {"year", "dr", "menu", "ext", "content_type"}(값은 문자열 또는 목록, 모든 질의에 공통 적용)
+    stream이 true면 NDJSON(application/x-ndjson)으로 질의별 결과를 완료되는 대로 전송
+    """
+    try:
+        data = await request.json()
+        queries = data.get('queries') or []
+        if not isinstance(queries, list) or not queries:
+            return JSONResponse({"error": "queries(질의 목록)가 필요합니다."}, status_code=400)
+        if len(queries) > SEARCH_BATCH_MAX:
+            return JSONResponse({"error": f"질의는 최대 {SEARCH_BATCH_MAX}개까지 가능합니다."}, status_code=400)
+        queries = [str(q) for q in queries]
+        if any(not q.strip() for q in queries):
+            return JSONResponse({"error": "빈 질의가 포함되어 있습니다."}, status_code=400)
+        top_k = int(data.get('top_k', 5))
+        agg = data.get('agg', 'max')
+        mode = (data.get('mode') or SEARCH_MODE).lower()
+        if mode not in ('vector', 'lexical', 'hybrid'):
+            return JSONResponse({"error": f"지원하지 않는 검색 방식: {mode}"}, status_code=400)
+        nprobe, ef_search = data.get('nprobe'), data.get('ef_search')
+        try:
+            filters = doc_filters.filters_from_body(data.get('filters'))
+        except (TypeError, ValueError) as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        if data.get('stream'):
+            return StreamingResponse(iter_batch_ndjson(queries, top_k, agg, mode, nprobe, ef_search, filters),
+                                     media_type='application/x-ndjson')
+        results, mode, message = await run_batch_search(queries, top_k, agg, mode, nprobe, ef_search, filters)
+        response = {"결과": [{"질의": q, "결과": r} for q, r in zip(queries, results)], "검색방식": mode}
+        if filters:
+            response["필터"] = doc_filters.describe(filters)
+        if message:
+            response["메시지"] = message
+        return response
+    except Exception as e:
+        return JSONResponse({"error": str(e)})
+
+@app.get('/search/filters')
+async def search_filters(attr: str = Query(None, description="속성(year/dr/menu/ext/content_type, 미지정 시 year/ext/content_type)")):
+    """필터에 쓸 수 있는 속성 값별 문서 수(현재 스냅샷 기준, 삭제 문서 제외)"""
+    if attr is not None and attr not in doc_filters.ATTRS:
+        return JSONResponse({"error": f"지원하지 않는 속성: {attr}"}, status_code=400)
+    attrs = [attr] if attr else [a for a in doc_filters.ATTRS if a not in ('menu', 'dr')]
+
+    def collect():
+        limit = len(index_holder.get().meta)
+        return {a: index_holder.store.attr_values(a, limit) for a in attrs}
+
+    return await run_cpu(collect)
+
+@app.get('/lexical/status')
+async def lexical_status():
+    return lexical_index.stats()
+
+def _cache_counts():
+    counts = {}
+    caches = {'query_embedding': query_embedding_cache, 'summary': summary_cache, 'blob_props': blob_props_cache}
+    for name, cache in caches.items():
+        counts[(name, 'hit')] = cache.hits
+        counts[(name, 'miss')] = cache.misses
+    counts[('query_embedding', 'coalesced')] = query_embedding_flight.coalesced
+    return counts
+
+# 이미 집계 중인 값은 /metrics 조회 시점에 읽어 노출(요청 경로에 추가 비용 없음)
+metrics.CallbackMetric('app_cache_requests_total', '캐시 조회 수(result=hit/miss/coalesced)', 'counter',
+                       ['cache', 'result'], _cache_counts)
+metrics.CallbackMetric('app_gpt_tokens_total', '요약 GPT 토큰 사용량', 'counter', ['kind'],
+                       lambda: {('prompt',): summary_stats['prompt_tokens'],
+                                ('completion',): summary_stats['completion_tokens']})
+for _field, _help in (('ntotal', '인덱스 벡터 수'), ('meta_count', '메타 문서 수'),
+                      ('deleted_docs', '삭제(tombstone) 문서 수'), ('tombstone_rows', '삭제 문서 벡터 수'),
+                      ('load_count', '인덱스 로드 횟수')):
+    metrics.CallbackMetric(f'app_index_{_field}', _help, 'gauge', [],
+                           lambda field=_field: {(): index_holder.status().get(field, 0)})
+
+@app.get('/metrics')
+async def prometheus_metrics():
+    """Prometheus 텍스트 형식 지표(워커 프로세스별 값)"""
+    return Response(metrics.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.on_event('shutdown')
+async def close_upstream_clients():
+    await aio_clients.close_all()
+    extraction.shutdown_pool()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app:app", host="127.0.0.1", port=8000, reload=True)
@@ -0,0 +1,528 @@
+"""
+성능 벤치마크(Azure 서비스 없이 재현 가능)
+
+- 업스트림은 fake_azure.FakeAzure로 대체(결정적 임베딩/채팅, 로컬 디렉터리 blob, Search 색인 요청 무시)
+- 작업 디렉터리(--workdir)에 인덱스/meta.db/jobs.db/임베딩 캐시를 두므로 운영 파일은 건드리지 않음
+- 단계(--phases, 기본 전부)
+  · corpus  : 합성 문서 N건(1k~1M) 생성 → meta.db (고정 seed, 실행마다 같은 문서)
+  · ingest  : ingest.py 실행(하위 프로세스) → 문서/청크 처리량, 인덱스 생성 시간, 최대 메모리
+  · build   : ingest 결과 벡터로 --build-modes 인덱스별 생성 시간/벡터당 바이트
+  · search  : app.py를 프로세스 내(ASGI)에서 기동해 /search 동시 부하 → p50/p95/p99, QPS, 업스트림 임베딩 호출 수
+              --search-filters를 주면 필터별로 같은 부하를 한 번 더 측정(결과 키: 검색방식[필터])
+  · upload / download : 큰 파일 /upload, /download 처리 시간과 처리 중 최대 메모리(RSS) 증가량
+- --url을 주면 이미 실행 중인 서버에 search/upload/download만 측정(--server-pid로 해당 프로세스 메모리 측정)
+- 결과는 JSON(--out), compare로 두 결과를 비교해 기준 대비 --threshold 이상 나빠진 지표를 회귀로 표시(종료 코드 1)
+
+사용 예)
+  python bench.py run --docs 10000 --concurrency 16 --requests 2000 --out bench_results/base.json
+  python bench.py run --docs 1000000 --phases corpus,ingest,build --build-modes flat,hnsw,sq8
+  python bench.py run --workdir bench_work --phases search --search-modes vector,hybrid   # 기존 작업 디렉터리 재사용
+  python bench.py compare bench_results/base.json bench_results/new.json --threshold 0.1
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).parent
+PHASES = ('corpus', 'ingest', 'build', 'search', 'upload', 'download')
+
+# 합성 문서 어휘(업무 요청서 문체, 앞쪽 단어일수록 자주 등장)
+_KO_TERMS = (
+    '요청 개발 보완 화면 조회 등록 수정 고객 정책 수수료 계약 모바일 분류 정산 결제 승인 심사 배치 데이터 연동 '
+    '인터페이스 권한 알림 보고서 통계 검증 오류 이관 시스템 메뉴 버튼 항목 추가 삭제 변경 기준 조건 처리 결과 '
+    '대상 일자 금액 상품 보험 청구 지급 고지 안내 문자 발송 로그 이력 관리자 사용자 부서 영업 지점 설계사 '
+    '조직 실적 마감 월별 일별 엑셀 다운로드 업로드 파일 양식 출력 인쇄 팝업 검색 필터 정렬 페이지 성능 개선'
+).split()
+_EN_TERMS = 'API batch ERP CRM SSO mobile web report interface Oracle SAP REST JSON XML EAI MCI'.split()
+# 합성 메뉴 경로(KRDS>대메뉴>중메뉴>화면), 문서 연도(DR 번호)
+_MENU_TOP = ('수수료', '정산', '고객', '상품', '영업')
+_MENU_MID = ('관리', '조회', '등록', '통계', '마감')
+_YEARS = (2021, 2022, 2023, 2024, 2025)
+
+
+def say(msg):
+    # 프로세스 내 app.py 로그는 파일로 돌리므로 진행 상황은 원래 표준출력에 씀
+    print(msg, file=sys.__stdout__, flush=True)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+class PeakRSS:
+    """프로세스 RSS를 주기적으로 읽어 최대값 기록(/proc 사용, 없으면 None)"""
+
+    def __init__(self, pid=None, interval=0.01):
+        self.path = f'/proc/{pid or os.getpid()}/status'
+        self.interval = interval
+        self.baseline = self.peak = self._read()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = self._read()
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self):
+        if self.peak is None:
+            return {'rss_peak_mb': None, 'rss_peak_delta_mb': None}
+        return {'rss_peak_mb': round(self.peak, 1),
+                'rss_peak_delta_mb': round(self.peak - self.baseline, 1) if self.baseline is not None else None}
+
+
+def latency_summary(latencies, errors, elapsed):
+    lat = np.asarray(latencies, dtype=np.float64)
+    if not len(lat):
+        return {'requests': 0, 'errors': errors}
+    return {
+        'requests': len(lat),
+        'errors': errors,
+        'qps': round(len(lat) / elapsed, 1),
+        'p50_ms': round(float(np.percentile(lat, 50)), 2),
+        'p95_ms': round(float(np.percentile(lat, 95)), 2),
+        'p99_ms': round(float(np.percentile(lat, 99)), 2),
+        'mean_ms': round(float(lat.mean()), 2),
+        'max_ms': round(float(lat.max()), 2),
+    }
+
+
+# ----- 합성 데이터 -----
+def _vocab(seed):
+    terms = _KO_TERMS + _EN_TERMS
+    # Zipf 비슷한 빈도(앞쪽 단어가 자주 나옴)
+    weights = 1.0 / np.arange(1, len(terms) + 1) ** 0.8
+    return terms, weights / weights.sum()
+
+
+def generate_docs(n, doc_chars, seed, start=0):
+    """
+    합성 문서(문서명 = DR 번호 + 제목 단어, 본문 = 메뉴 위치 + 문장 나열)를 start번째부터 n건 생성.
+    연도는 5개, 메뉴는 대메뉴 5개 × 중메뉴 5개(필터 선택 비율 20% / 4%)
+    """
+    terms, probs = _vocab(seed)
+    rng = np.random.default_rng(seed + start)
+    words_per_doc = max(8, doc_chars // 4)
+    for i in range(start, start + n):
+        words = [terms[j] for j in rng.choice(len(terms), words_per_doc, p=probs)]
+        sentences = [' '.join(words[k:k + 12]) + '.' for k in range(0, len(words), 12)]
+        title = ' '.join(words[:4])
+        top, mid = rng.integers(len(_MENU_TOP)), rng.integers(len(_MENU_MID))
+        menu = f'KRDS>{_MENU_TOP[top]}>{_MENU_TOP[top]}{_MENU_MID[mid]}>{words[0]}{words[1]}'
+        dr = f'DR-{_YEARS[i % len(_YEARS)]}-{10000 + i}'
+        yield {
+            'source': f'{dr} {title} 요청.docx',
+            'text': f'{dr} {title}\n메뉴 위치 {menu}\n' + ' '.join(sentences),
+            'content_type': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        }
+
+
+def make_queries(n, seed):
+    terms, probs = _vocab(seed)
+    rng = np.random.default_rng(seed + 7)
+    return [' '.join(terms[j] for j in rng.choice(len(terms), int(rng.integers(2, 5)), p=probs, replace=False))
+            for _ in range(n)]
+
+
+# ----- 단계별 측정 -----
+def phase_corpus(args, env):
+    from meta_store import MetaStore
+    db_path = Path(env['META_DB_PATH'])
+    for p in db_path.parent.glob(db_path.name + '*'):
+        p.unlink()
+    store = MetaStore(db_path, migrate_from=None)
+    started = time.perf_counter()
+    batch, written = [], 0
+    for doc in generate_docs(args.docs, args.doc_chars, args.seed):
+        batch.append(doc)
+        if len(batch) >= 5000:
+            store.append(batch, written)
+            written += len(batch)
+            batch = []
+    if batch:
+        store.append(batch, written)
+        written += len(batch)
+    elapsed = time.perf_counter() - started
+    say(f"[bench] 합성 문서 {written}건 생성({elapsed:.1f}초)")
+    return {'docs': written, 'doc_chars': args.doc_chars, 'generate_sec': round(elapsed, 2)}
+
+
+def phase_ingest(args, env):
+    for name in ('faiss_index.bin', 'faiss_index.version', 'faiss_index.chunks.npy', 'faiss_index.vectors.npy'):
+        (Path(env['INDEX_DIR']) / name).unlink(missing_ok=True)
+    shutil.rmtree(env['EMBED_CACHE_DIR'], ignore_errors=True)
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, str(BASE_DIR / 'ingest.py')], cwd=env['INDEX_DIR'], env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    with PeakRSS(proc.pid, interval=0.05) as rss:
+        output, _ = proc.communicate()
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"ingest.py 실패(코드 {proc.returncode}):\n{output[-2000:]}")
+    chunks = int(np.load(Path(env['INDEX_DIR']) / 'faiss_index.chunks.npy').shape[0])
+    build = re.search(r'인덱스 생성: (.+), ([\d.]+)초', output)
+    stamp = json.loads((Path(env['INDEX_DIR']) / 'faiss_index.version').read_text(encoding='utf-8'))
+    docs = stamp.get('meta_count') or 0
+    say(f"[bench] ingest: 문서 {docs}건, 청크 {chunks}개, {elapsed:.1f}초")
+    return {
+        'docs': docs, 'chunks': chunks, 'elapsed_sec': round(elapsed, 2),
+        'docs_per_sec': round(docs / elapsed, 1), 'chunks_per_sec': round(chunks / elapsed, 1),
+        'index_type': build.group(1) if build else None,
+        'index_build_sec': float(build.group(2)) if build else None,
+        'rss_peak_mb': rss.summary()['rss_peak_mb'],
+    }
+
+
+def phase_build(args, env):
+    import faiss
+    import index_factory
+    index = faiss.read_index(str(Path(env['INDEX_DIR']) / 'faiss_index.bin'))
+    vectors = index_factory.reconstruct_rows(index, np.arange(index.ntotal))
+    results = {}
+    for mode in args.build_modes:
+        started = time.perf_counter()
+        built = index_factory.build_index(vectors, mode=mode)
+        elapsed = time.perf_counter() - started
+        size = len(faiss.serialize_index(built))
+        results[mode] = {'vectors': int(built.ntotal), 'build_sec': round(elapsed, 3),
+                         'bytes_per_vector': round(size / max(1, built.ntotal), 1),
+                         'index_type': index_factory.describe(built)}
+        say(f"[bench] build {mode}: {elapsed:.2f}초, {results[mode]['bytes_per_vector']} bytes/vector")
+    return results
+
+
+async def run_load(request, total, concurrency):
+    """동시 요청 concurrency개로 total건 처리(닫힌 루프) → 지연시간 요약"""
+    counter = itertools.count()
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        while True:
+            i = next(counter)
+            if i >= total:
+                return
+            started = time.perf_counter()
+            try:
+                ok = await request(i)
+            except Exception:
+                ok = False
+            latencies.append((time.perf_counter() - started) * 1000)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return latency_summary(latencies, errors, time.perf_counter() - started)
+
+
+async def phase_search(args, client, fake):
+    queries = make_queries(args.distinct_queries, args.seed)
+    results = {}
+    # 키워드 색인은 기동 후 백그라운드에서 구성됨 → 키워드 검색 1건으로 구성 완료까지 기다린 뒤 측정(정상 상태 기준)
+    started = time.perf_counter()
+    await client.get('/search', params={'q': queries[0], 'mode': 'lexical'})
+    results['lexical_ready_sec'] = round(time.perf_counter() - started, 2)
+    # 필터 없음('') + --search-filters(URL 질의 형식, 예: year=2024&menu=KRDS>정산)
+    for spec in [''] + args.search_filters:
+        filters = dict(urllib.parse.parse_qsl(spec))
+        for mode in args.search_modes:
+            async def request(i, mode=mode, filters=filters):
+                r = await client.get('/search', params={'q': queries[i % len(queries)], 'top_k': args.top_k,
+                                                        'mode': mode, **filters})
+                return r.status_code == 200 and 'error' not in r.json()
+
+            # 워밍업(첫 요청의 인덱스/색인 로드 제외)
+            await run_load(request, min(len(queries), args.concurrency * 2), args.concurrency)
+            before = fake.stats() if fake else {}
+            summary = await run_load(request, args.requests, args.concurrency)
+            if fake:
+                summary['upstream_embedding_requests'] = fake.stats().get('embedding_requests', 0) - \
+                    before.get('embedding_requests', 0)
+            key = f'{mode}[{spec}]' if spec else mode
+            results[key] = summary
+            say(f"[bench] search {key}: {summary}")
+    return results
+
+
+def _write_upload_file(path, size_mb, seed):
+    """업로드용 텍스트 파일(합성 문서 본문 반복)"""
+    target = size_mb * 1024 * 1024
+    texts = [(doc['text'] + '\n').encode('utf-8') for doc in generate_docs(50, 4000, seed)]
+    with open(path, 'wb') as f:
+        written = 0
+        for data in itertools.cycle(texts):
+            written += f.write(data[:target - written])
+            if written >= target:
+                break
+    return path.stat().st_size
+
+
+async def phase_upload(args, client, workdir, pid):
+    path = Path(workdir) / args.upload_name
+    size = _write_upload_file(path, args.upload_mb, args.seed)
+    with open(path, 'rb') as f, PeakRSS(pid) as rss:
+        started = time.perf_counter()
+        r = await client.post('/upload', files={'file': (args.upload_name, f, 'text/plain')},
+                              data={'overwrite': '1'}, timeout=600)
+        elapsed = time.perf_counter() - started
+    body = r.json()
+    if 'error' in body:
+        raise RuntimeError(f"/upload 실패: {body['error']}")
+    result = dict({'size_mb': round(size / 1024 / 1024, 1), 'elapsed_sec': round(elapsed, 2),
+                   'mb_per_sec': round(size / 1024 / 1024 / elapsed, 1)}, **rss.summary())
+    say(f"[bench] upload: {result}")
+    return result
+
+
+async def phase_download(args, client, pid, in_process):
+    params = {'filename': args.upload_name}
+    result = {}
+    with PeakRSS(pid) as rss:
+        started = time.perf_counter()
+        size = 0
+        async with client.stream('GET', '/download', params=params, timeout=600) as r:
+            if r.status_code != 200:
+                raise RuntimeError(f"/download 실패: {r.status_code}")
+            async for chunk in r.aiter_bytes():
+                size += len(chunk)
+        elapsed = time.perf_counter() - started
+    result.update({'size_mb': round(size / 1024 / 1024, 1), 'elapsed_sec': round(elapsed, 2),
+                   'mb_per_sec': round(size / 1024 / 1024 / elapsed, 1)})
+    # 프로세스 내 ASGI 전송은 응답 본문을 클라이언트 쪽에서 한꺼번에 모으므로 메모리 수치가 의미 없음
+    result.update(rss.summary() if not in_process else {'rss_peak_mb': None, 'rss_peak_delta_mb': None})
+
+    async def ranged(i):
+        start = (i * 7919 * 4096) % max(1, size - 65536)
+        r = await client.get('/download', params=params, headers={'Range': f'bytes={start}-{start + 65535}'})
+        return r.status_code == 206 and len(r.content) == 65536
+
+    result['range_64k'] = await run_load(ranged, args.range_requests, args.concurrency)
+    say(f"[bench] download: {result}")
+    return result
+
+
+async def run_app_phases(args, env, phases, fake, results):
+    import httpx
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+        pid, in_process, app_ctx = args.server_pid, False, None
+    else:
+        # 환경변수 설정 후 import(모듈 상수가 작업 디렉터리/대체 서버를 가리키도록)
+        started = time.perf_counter()
+        import app as app_module
+        app_ctx = app_module.app.router.lifespan_context(app_module.app)
+        await app_ctx.__aenter__()
+        results['startup'] = {'elapsed_sec': round(time.perf_counter() - started, 2)}
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app_module.app), base_url='http://bench',
+                                   timeout=60)
+        pid, in_process = None, True
+    try:
+        if 'search' in phases:
+            results['search'] = await phase_search(args, client, fake)
+        if 'upload' in phases:
+            results['upload'] = await phase_upload(args, client, env['INDEX_DIR'], pid)
+        if 'download' in phases:
+            results['download'] = await phase_download(args, client, pid, in_process)
+    finally:
+        await client.aclose()
+        if app_ctx is not None:
+            await app_ctx.__aexit__(None, None, None)
+
+
+def cmd_run(args):
+    phases = [p for p in args.phases.split(',') if p]
+    unknown = set(phases) - set(PHASES)
+    if unknown:
+        raise SystemExit(f"알 수 없는 단계: {', '.join(sorted(unknown))} (지원: {', '.join(PHASES)})")
+    args.build_modes = [m for m in args.build_modes.split(',') if m]
+    args.search_modes = [m for m in args.search_modes.split(',') if m]
+    workdir = Path(args.workdir).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    fake = None
+    env = dict(os.environ)
+    if not args.url:
+        from fake_azure import FakeAzure
+        fake = FakeAzure(workdir / 'blob', dim=args.dim, embed_latency_ms=args.embed_latency_ms,
+                         chat_latency_ms=args.chat_latency_ms).start()
+        env.update(fake.env())
+    env.update({
+        'INDEX_DIR': str(workdir),
+        'META_DB_PATH': str(workdir / 'meta.db'),
+        'JOBS_DB_PATH': str(workdir / 'jobs.db'),
+        'EMBED_CACHE_DIR': str(workdir / 'embed_cache'),
+    })
+    os.environ.update(env)
+    results = {}
+    try:
+        if 'corpus' in phases:
+            results['corpus'] = phase_corpus(args, env)
+        if 'ingest' in phases:
+            results['ingest'] = phase_ingest(args, env)
+        if 'build' in phases:
+            results['build'] = phase_build(args, env)
+        app_phases = [p for p in phases if p in ('search', 'upload', 'download')]
+        if app_phases:
+            # app.py의 요청별 로그는 작업 디렉터리의 app.log로
+            with open(workdir / 'app.log', 'a', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+                asyncio.run(run_app_phases(args, env, app_phases, fake, results))
+    finally:
+        if fake is not None:
+            results.setdefault('upstream', fake.stats())
+            fake.stop()
+    report = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'server': args.url or 'in-process',
+            'phases': phases,
+            'args': {k: v for k, v in vars(args).items() if k != 'func'},
+            'env': {k: os.environ[k] for k in sorted(os.environ)
+                    if k.startswith(('INDEX_', 'HNSW_', 'IVF_', 'PQ_', 'SEARCH_', 'EMBED_', 'CHUNK_'))
+                    and k not in ('INDEX_DIR', 'EMBED_CACHE_DIR')},
+        },
+        'results': results,
+    }
+    out = Path(args.out or f"bench_results/{time.strftime('%Y%m%d-%H%M%S')}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+    say(f"[bench] 결과 저장: {out}")
+
+
+# ----- 비교 -----
+def flatten(obj, prefix=''):
+    items = {}
+    for k, v in obj.items():
+        key = f'{prefix}.{k}' if prefix else k
+        if isinstance(v, dict):
+            items.update(flatten(v, key))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            items[key] = v
+    return items
+
+
+def direction(metric):
+    """1: 클수록 좋음, -1: 작을수록 좋음, 0: 비교 제외(건수 등)"""
+    name = metric.rsplit('.', 1)[-1]
+    if name == 'qps' or name.endswith('_per_sec'):
+        return 1
+    if name.endswith(('_ms', '_sec', '_mb')) or name in ('bytes_per_vector', 'errors'):
+        return -1
+    return 0
+
+
+def cmd_compare(args):
+    base = json.loads(Path(args.base).read_text(encoding='utf-8'))
+    new = json.loads(Path(args.new).read_text(encoding='utf-8'))
+    for key in ('server', 'cpu_count'):
+        if base['meta'].get(key) != new['meta'].get(key):
+            say(f"[bench] 주의: {key}가 다름({base['meta'].get(key)} → {new['meta'].get(key)})")
+    for key in ('docs', 'doc_chars', 'concurrency', 'requests', 'dim'):
+        b, n = base['meta']['args'].get(key), new['meta']['args'].get(key)
+        if b != n:
+            say(f"[bench] 주의: 실행 조건 {key}가 다름({b} → {n})")
+    b_metrics, n_metrics = flatten(base['results']), flatten(new['results'])
+    regressions = []
+    print(f"{'지표':<48} {'기준':>12} {'비교':>12} {'변화':>9}")
+    for metric in sorted(set(b_metrics) & set(n_metrics)):
+        sign = direction(metric)
+        if not sign:
+            continue
+        b, n = b_metrics[metric], n_metrics[metric]
+        if b == 0:
+            change = 0.0 if n == 0 else float('inf')
+        else:
+            change = (n - b) / abs(b)
+        worse = -sign * change
+        # 절대 차이가 --min-delta 미만이면 잡음으로 보고 회귀에서 제외
+        flag = worse > args.threshold and abs(n - b) >= args.min_delta
+        if flag:
+            regressions.append(metric)
+        print(f"{metric:<48} {b:>12g} {n:>12g} {change:>+8.1%}{'  ← 회귀' if flag else ''}")
+    if regressions:
+        say(f"[bench] 회귀 {len(regressions)}건(기준 대비 {args.threshold:.0%} 이상 악화): {', '.join(regressions)}")
+        return 1
+    print('[bench] 회귀 없음')
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='검색/인덱싱 성능 벤치마크(Azure 대체 서버 사용)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('run', help='벤치마크 실행')
+    run.add_argument('--workdir', default='bench_work', help='인덱스/DB/blob 작업 디렉터리')
+    run.add_argument('--phases', default=','.join(PHASES), help=f"실행 단계({','.join(PHASES)})")
+    run.add_argument('--docs', type=int, default=10000, help='합성 문서 수(1k~1M)')
+    run.add_argument('--doc-chars', type=int, default=1500, help='문서당 본문 길이(대략)')
+    run.add_argument('--dim', type=int, default=1536, help='대체 임베딩 차원')
+    run.add_argument('--embed-latency-ms', type=float, default=20.0, help='대체 임베딩 요청당 지연')
+    run.add_argument('--chat-latency-ms', type=float, default=300.0, help='대체 채팅 응답 지연')
+    run.add_argument('--build-modes', default='flat,hnsw,sq8', help='build 단계 인덱스 종류')
+    run.add_argument('--search-modes', default='vector,lexical,hybrid', help='search 단계 검색 방식')
+    run.add_argument('--search-filters', nargs='*', default=[],
+                     help='필터 검색 측정(URL 질의 형식, 여러 개 가능. 예: year=2024 "menu=KRDS>정산>정산관리")')
+    run.add_argument('--concurrency', type=int, default=16, help='동시 요청 수')
+    run.add_argument('--requests', type=int, default=2000, help='검색 방식별 요청 수')
+    run.add_argument('--distinct-queries', type=int, default=500, help='서로 다른 질의 수(반복 시 캐시 적중)')
+    run.add_argument('--top-k', type=int, default=5)
+    run.add_argument('--upload-mb', type=int, default=32, help='업로드/다운로드 파일 크기(MB)')
+    run.add_argument('--upload-name', default='bench_upload.txt')
+    run.add_argument('--range-requests', type=int, default=200, help='Range 다운로드 요청 수')
+    run.add_argument('--url', help='실행 중인 서버 주소(지정 시 search/upload/download만 측정)')
+    run.add_argument('--server-pid', type=int, help='--url 서버 프로세스 pid(메모리 측정용)')
+    run.add_argument('--seed', type=int, default=42)
+    run.add_argument('--out', help='결과 JSON 경로(기본 bench_results/<시각>.json)')
+    run.set_defaults(func=cmd_run)
+    cmp = sub.add_parser('compare', help='두 결과 비교(회귀 시 종료 코드 1)')
+    cmp.add_argument('base')
+    cmp.add_argument('new')
+    cmp.add_argument('--threshold', type=float, default=0.10, help='회귀로 볼 악화 비율(기본 10%%)')
+    cmp.add_argument('--min-delta', type=float, default=1.0, help='이보다 작은 절대 차이는 무시')
+    cmp.set_defaults(func=cmd_compare)
+    args = parser.parse_args()
+    sys.exit(args.func(args) or 0)
+
+
+if __name__ == '__main__':
+    main()
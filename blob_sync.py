@@ -0,0 +1,395 @@
+"""
+Blob 컨테이너 증분 동기화(ingest.py --sync)
+
+- 컨테이너 목록을 한 번 조회해 manifest(blob_sync.db)의 ETag와 비교 → 새 blob / 변경 / 삭제 / 그대로
+- 새 blob·변경된 blob을 SYNC_BATCH_SIZE개씩 처리: 배치 하나를 병렬로 내려받아 본문 추출(SYNC_CONCURRENCY개 동시,
+  PDF는 extraction 프로세스 풀) → 임베딩 → 색인 반영 → manifest 갱신 후 다음 배치를 내려받음(메모리에는 배치 하나의 본문만 둠).
+  추출 결과는 blob마다 바로 staged 테이블에 기록 → 중단 후 다시 실행하면 ETag가 같은 blob은 다시 내려받지 않음
+- 임베딩은 BatchEmbedder + 임베딩 캐시(배치마다 저장) → 중단 전에 임베딩한 청크는 API를 다시 호출하지 않음
+- 배치마다 append_to_index 1회(메타 트랜잭션 1회 + publish 1회)로 반영한 뒤 manifest를 트랜잭션 1회로 갱신,
+  컨테이너에서 사라진 blob은 마지막 배치와 함께 삭제.
+  publish 후 manifest 갱신 전에 중단되면 다음 실행에서 그 blob들을 다시 반영(덮어쓰기, 임베딩은 캐시 재사용)
+- manifest에 없던 문서(meta.json에서 옮긴 문서 등)는 삭제하지 않음. 처음 보는 blob이라도 같은 이름·크기의 문서가
+  이미 색인되어 있으면(/upload로 올린 파일) 다시 처리하지 않고 manifest에만 기록
+- 실행 시간은 목록 조회(blob 수에 비례, 요청당 최대 5000건)를 빼면 바뀐 blob 수에만 비례
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).parent
+INDEX_DIR = Path(os.getenv('INDEX_DIR') or BASE_DIR)
+SYNC_DB_PATH = Path(os.getenv('SYNC_DB_PATH') or (INDEX_DIR / 'blob_sync.db'))
+# 동시에 내려받아 추출할 blob 수
+SYNC_CONCURRENCY = int(os.getenv('SYNC_CONCURRENCY', '8'))
+# 한 번에 내려받아 색인에 반영할 blob 수(이 수만큼의 본문만 메모리에 둠)
+SYNC_BATCH_SIZE = int(os.getenv('SYNC_BATCH_SIZE', '200'))
+# 동기화 대상 확장자(본문 추출을 지원하는 형식)
+SYNC_EXTENSIONS = tuple(e.strip().lower() for e in os.getenv('SYNC_EXTENSIONS', 'txt,docx,pdf').split(',') if e.strip())
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS blobs (
+    name TEXT PRIMARY KEY,
+    etag TEXT NOT NULL,
+    last_modified TEXT,
+    size INTEGER,
+    status TEXT NOT NULL,
+    synced_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS staged (
+    name TEXT PRIMARY KEY,
+    etag TEXT NOT NULL,
+    text TEXT NOT NULL,
+    staged_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    container TEXT,
+    started_at REAL NOT NULL,
+    finished_at REAL NOT NULL,
+    counts TEXT NOT NULL
+);
+'''
+
+BlobInfo = namedtuple('BlobInfo', ['name', 'etag', 'last_modified', 'size', 'content_type'])
+# new/changed: 처리할 blob, removed: 컨테이너에서 사라진 blob 이름, adopted: 이미 색인된 blob(manifest에만 기록)
+SyncPlan = namedtuple('SyncPlan', ['new', 'changed', 'removed', 'adopted', 'unchanged', 'unsupported'])
+
+COUNT_KEYS = ('listed', 'skipped', 'adopted', 'added', 'updated', 'deleted', 'empty', 'unsupported', 'failed',
+              'resumed')
+
+
+class BlobManifest:
+    """동기화한 blob의 ETag 기록 + 추출 결과 임시 보관(재개용)"""
+
+    def __init__(self, db_path=SYNC_DB_PATH):
+        self.db_path = str(db_path)
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def entries(self, prefix=''):
+        """{blob 이름: ETag}(prefix로 시작하는 것만)"""
+        rows = self._conn().execute('SELECT name, etag FROM blobs WHERE substr(name, 1, ?) = ?',
+                                    (len(prefix), prefix))
+        return {row['name']: row['etag'] for row in rows}
+
+    def staged_etags(self):
+        return {row['name']: row['etag'] for row in self._conn().execute('SELECT name, etag FROM staged')}
+
+    def staged_text(self, name):
+        row = self._conn().execute('SELECT text FROM staged WHERE name = ?', (name,)).fetchone()
+        return row['text'] if row else None
+
+    def stage(self, blob, text):
+        self._conn().execute('INSERT OR REPLACE INTO staged (name, etag, text, staged_at) VALUES (?, ?, ?, ?)',
+                             (blob.name, blob.etag, text, time.time()))
+
+    def commit(self, synced, removed):
+        """synced: [(BlobInfo, 상태)] 기록, removed: 이름 목록 삭제. 반영한 blob의 staged 행도 정리(트랜잭션 1회)"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO blobs (name, etag, last_modified, size, status, synced_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(b.name, b.etag, b.last_modified, b.size, status, now) for b, status in synced])
+            conn.executemany('DELETE FROM blobs WHERE name = ?', [(name,) for name in removed])
+            conn.executemany('DELETE FROM staged WHERE name = ?',
+                             [(b.name,) for b, _ in synced] + [(name,) for name in removed])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def discard_staged(self, keep):
+        """이번 변경 목록에 없는 staged 행(그 사이 삭제/원복된 blob) 정리"""
+        stale = [(name,) for name in self.staged_etags() if name not in keep]
+        self._conn().executemany('DELETE FROM staged WHERE name = ?', stale)
+        return len(stale)
+
+    def record_run(self, container, started_at, counts):
+        self._conn().execute('INSERT INTO runs (container, started_at, finished_at, counts) VALUES (?, ?, ?, ?)',
+                             (container, started_at, time.time(), json.dumps(counts)))
+
+    def last_run(self):
+        row = self._conn().execute('SELECT * FROM runs ORDER BY id DESC LIMIT 1').fetchone()
+        if row is None:
+            return None
+        return {'container': row['container'], 'started_at': row['started_at'], 'finished_at': row['finished_at'],
+                'counts': json.loads(row['counts'])}
+
+
+def indexable_text(text):
+    """ingest.py와 같은 기준: 20자 미만/http(s) 링크만 있는 본문은 색인하지 않음"""
+    text = (text or '').strip()
+    return len(text) >= 20 and not text.lower().startswith(('http://', 'https://'))
+
+
+def _ext(name):
+    return name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+
+
+async def list_container(container, prefix=''):
+    """컨테이너 전체 목록(페이지 단위 조회) → [BlobInfo]"""
+    import aio_clients
+    import metrics
+    container_client = aio_clients.get_blob_service().get_container_client(container)
+    blobs = []
+    with metrics.timed('blob_list', upstream='blob'):
+        async for item in container_client.list_blobs(name_starts_with=prefix or None):
+            settings = item.content_settings
+            blobs.append(BlobInfo(item.name, item.etag,
+                                  item.last_modified.isoformat() if item.last_modified else None,
+                                  int(item.size or 0), settings.content_type if settings else None))
+    return blobs
+
+
+def plan_changes(listing, manifest_etags, store=None, meta_count=None):
+    """목록 ↔ manifest 비교 → SyncPlan. store를 주면 처음 보는 blob 중 이미 색인된 것(같은 이름·크기)은 adopted"""
+    new, changed, adopted, unchanged, unsupported = [], [], [], [], []
+    listed = set()
+    for blob in listing:
+        listed.add(blob.name)
+        if _ext(blob.name) not in SYNC_EXTENSIONS:
+            unsupported.append(blob)
+            continue
+        etag = manifest_etags.get(blob.name)
+        if etag == blob.etag:
+            unchanged.append(blob)
+        elif etag is not None:
+            changed.append(blob)
+        else:
+            doc = store.find_by_source(blob.name, limit=meta_count, with_text=False)[1] if store is not None else None
+            if doc is not None and doc.get('size') == blob.size:
+                adopted.append(blob)
+            else:
+                new.append(blob)
+    removed = sorted(name for name in manifest_etags if name not in listed)
+    return SyncPlan(new, changed, removed, adopted, unchanged, unsupported)
+
+
+async def fetch_texts(container, blobs, manifest, concurrency=SYNC_CONCURRENCY, log=print):
+    """
+    blob을 병렬로 내려받아 본문 추출 → ({이름: 본문}, {이름: 오류}, 재사용 수).
+    같은 ETag로 이미 추출해 둔(staged) blob은 내려받지 않음. 추출 결과는 blob마다 바로 staged에 기록
+    """
+    import aio_clients
+    import extraction
+    import metrics
+    from azure.core import MatchConditions
+    from blob_upload import new_spool
+
+    staged = manifest.staged_etags()
+    texts, errors = {}, {}
+    resumed = 0
+    slots = asyncio.Semaphore(max(1, concurrency))
+    done = 0
+
+    async def fetch(blob):
+        nonlocal done
+        async with slots:
+            blob_client = aio_clients.get_blob_client(container, blob.name)
+            spool = new_spool()
+            try:
+                async with aio_clients.blob_limit():
+                    with metrics.timed('blob_download', upstream='blob'):
+                        # 목록 조회 이후 바뀐 blob은 412 → 실패로 세고 다음 동기화에서 새 ETag로 처리
+                        downloader = await blob_client.download_blob(etag=blob.etag,
+                                                                     match_condition=MatchConditions.IfNotModified)
+                        async for chunk in downloader.chunks():
+                            spool.write(chunk)
+                text, _, _, _ = await extraction.extract_text(blob.name, spool)
+            finally:
+                spool.close()
+            await aio_clients.run_cpu(manifest.stage, blob, text)
+            texts[blob.name] = text
+            done += 1
+            if done % 100 == 0:
+                log(f"[blob_sync] 내려받기/추출 진행: {done}/{len(pending)}")
+
+    pending = []
+    for blob in blobs:
+        if staged.get(blob.name) == blob.etag:
+            texts[blob.name] = manifest.staged_text(blob.name)
+            resumed += 1
+        else:
+            pending.append(blob)
+    results = await asyncio.gather(*(fetch(blob) for blob in pending), return_exceptions=True)
+    for blob, result in zip(pending, results):
+        if isinstance(result, BaseException):
+            errors[blob.name] = str(result) or type(result).__name__
+            log(f"[blob_sync] 실패: '{blob.name}' 내려받기/추출 오류: {errors[blob.name]}")
+    return texts, errors, resumed
+
+
+async def _plan(container, prefix, manifest, store, meta_count):
+    """목록 조회 + 변경 목록(비동기 클라이언트는 이 이벤트 루프 안에서만 사용)"""
+    import aio_clients
+    try:
+        listing = await list_container(container, prefix)
+        return listing, plan_changes(listing, manifest.entries(prefix), store, meta_count)
+    finally:
+        await aio_clients.close_all()
+
+
+async def _fetch_batch(container, blobs, manifest, log):
+    """배치 하나 내려받기/추출(비동기 클라이언트는 이 이벤트 루프 안에서만 사용)"""
+    import aio_clients
+    try:
+        return await fetch_texts(container, blobs, manifest, log=log)
+    finally:
+        await aio_clients.close_all()
+
+
+def embed_documents(docs):
+    """문서 청크 임베딩 → (성공 문서 위치 목록, 청크 행, 벡터, {문서 위치: 오류})"""
+    import metrics
+    from chunking import chunk_documents
+    from embed_pipeline import BatchEmbedder, EmbedStats, cache_namespace
+    from embedding_cache import get_embedding_cache
+    from indexer import embed_model, get_sync_openai_client
+
+    texts, rows = chunk_documents(docs)
+    embedder = BatchEmbedder(get_sync_openai_client(), embed_model(),
+                             cache=get_embedding_cache(cache_namespace(embed_model())))
+    stats = EmbedStats()
+    with metrics.timed('index_embedding', upstream='openai'):
+        vectors = embedder.embed(texts, stats=stats)
+    failed = {}
+    for i, ((doc_pos, _, _, _), vec) in enumerate(zip(rows, vectors)):
+        if vec is None and doc_pos not in failed:
+            failed[doc_pos] = embedder.errors.get(i) or '임베딩 실패'
+    ok_positions = [pos for pos in range(len(docs)) if pos not in failed]
+    new_pos = {pos: i for i, pos in enumerate(ok_positions)}
+    ok_rows = [(new_pos[r[0]],) + tuple(r[1:]) for r in rows if r[0] in new_pos]
+    ok_vectors = [vec for r, vec in zip(rows, vectors) if r[0] in new_pos]
+    return ok_positions, ok_rows, ok_vectors, failed, stats
+
+
+def _apply_batch(blobs, texts, changed_names, delete_sources, synced, store, counts, log):
+    """
+    추출한 배치를 임베딩 → append_to_index 1회(delete_sources도 같은 publish에서 삭제)로 반영.
+    반영한 blob은 synced에 추가, 반환: 새 스냅샷 stamp(반영할 것이 없으면 None)
+    """
+    from index_store import append_to_index, delete_documents
+
+    docs, doc_blobs = [], []
+    # 색인에서 뺄 문서명: 컨테이너에서 사라진 blob + 본문이 비게 된 blob(이전 버전 삭제)
+    delete_sources = list(delete_sources)
+    for blob in blobs:
+        if blob.name not in texts:
+            continue
+        text = texts[blob.name]
+        if not indexable_text(text):
+            log(f"[blob_sync] 제외: '{blob.name}' (텍스트 20자 미만 또는 없음)")
+            counts['empty'] += 1
+            synced.append((blob, 'empty'))
+            delete_sources.append(blob.name)
+            continue
+        docs.append({'source': blob.name, 'text': text, 'content_type': blob.content_type, 'size': blob.size,
+                     'etag': blob.etag, 'last_modified': blob.last_modified})
+        doc_blobs.append(blob)
+
+    stamp = None
+    if docs:
+        ok_positions, ok_rows, ok_vectors, failed, stats = embed_documents(docs)
+        for pos, error in failed.items():
+            log(f"[blob_sync] 실패: '{docs[pos]['source']}' 임베딩 오류: {error}")
+        counts['failed'] += len(failed)
+        log(f"[blob_sync] 임베딩: 문서 {len(ok_positions)}건, 청크 {len(ok_rows)}개"
+            f"(캐시 재사용 {stats.cache_hits}개), 실패 {len(failed)}건")
+        if ok_positions:
+            stamp = append_to_index([docs[pos] for pos in ok_positions], ok_rows, np.vstack(ok_vectors),
+                                    store=store, delete_sources=delete_sources)
+            for pos in ok_positions:
+                blob = doc_blobs[pos]
+                counts['updated' if blob.name in changed_names else 'added'] += 1
+                synced.append((blob, 'indexed'))
+            delete_sources = []
+    if delete_sources:
+        stamp = delete_documents(delete_sources, store=store)[1] or stamp
+    return stamp
+
+
+def run_sync(container=None, prefix='', dry_run=False, store=None, manifest=None, batch_size=SYNC_BATCH_SIZE,
+             log=print):
+    """
+    컨테이너 증분 동기화 1회. 반환: 건수 dict(COUNT_KEYS + elapsed_sec, generation)
+    바뀐 blob은 batch_size개씩 내려받기/추출 → 색인 반영 → manifest 갱신
+    동시에 두 번 실행되지 않도록 manifest 파일 락 사용(이미 실행 중이면 filelock.Timeout)
+    """
+    import aio_clients
+    import extraction
+    from filelock import FileLock
+    from index_store import INDEX_COMPACT_RATIO, compact_index, published_meta_count, tombstone_ratio
+    from meta_store import get_meta_store
+
+    container = container or os.getenv('AZURE_STORAGE_CONTAINER')
+    if not container or aio_clients.get_blob_service() is None:
+        raise RuntimeError('Azure Storage 연결 정보가 없습니다(AZURE_STORAGE_CONNECTION_STRING, AZURE_STORAGE_CONTAINER).')
+    store = store or get_meta_store()
+    manifest = manifest or BlobManifest()
+    started_at, started = time.time(), time.perf_counter()
+    counts = dict.fromkeys(COUNT_KEYS, 0)
+    with FileLock(manifest.db_path + '.lock', timeout=0):
+        listing, plan = asyncio.run(_plan(container, prefix, manifest, store, published_meta_count(store)))
+        counts.update(listed=len(listing), skipped=len(plan.unchanged), adopted=len(plan.adopted),
+                      unsupported=len(plan.unsupported))
+        log(f"[blob_sync] '{container}' 목록 {len(listing)}건: 새 blob {len(plan.new)}, 변경 {len(plan.changed)}, "
+            f"삭제 {len(plan.removed)}, 그대로 {len(plan.unchanged)}, 기존 색인 {len(plan.adopted)}, "
+            f"지원하지 않는 형식 {len(plan.unsupported)}")
+        if dry_run:
+            counts.update(added=len(plan.new), updated=len(plan.changed), deleted=len(plan.removed))
+            counts['elapsed_sec'] = round(time.perf_counter() - started, 2)
+            return counts
+        todo = plan.new + plan.changed
+        manifest.discard_staged({b.name for b in todo})
+
+        changed_names = {b.name for b in plan.changed}
+        batch_size = max(1, batch_size)
+        stamp = None
+        try:
+            # 바뀐 blob이 없어도 삭제/기존 색인 기록을 위해 빈 배치 1회는 실행
+            for start in range(0, max(len(todo), 1), batch_size):
+                batch = todo[start:start + batch_size]
+                last = start + batch_size >= len(todo)
+                texts, errors, resumed = {}, {}, 0
+                if batch:
+                    texts, errors, resumed = asyncio.run(_fetch_batch(container, batch, manifest, log))
+                counts['failed'] += len(errors)
+                counts['resumed'] += resumed
+                # 컨테이너에서 사라진 blob 삭제와 기존 색인 blob 기록은 마지막 배치와 함께 반영
+                removed = plan.removed if last else []
+                synced = [(b, 'adopted') for b in plan.adopted] if last else []
+                stamp = _apply_batch(batch, texts, changed_names, removed, synced, store, counts, log) or stamp
+                manifest.commit(synced, removed)
+                if len(todo) > batch_size:
+                    log(f"[blob_sync] 배치 반영: {min(start + batch_size, len(todo))}/{len(todo)}")
+        finally:
+            extraction.shutdown_pool()
+        counts['deleted'] = len(plan.removed)
+        if stamp is not None:
+            counts['generation'] = stamp['generation']
+            if tombstone_ratio(stamp) >= INDEX_COMPACT_RATIO:
+                compact_index(store)
+        counts['elapsed_sec'] = round(time.perf_counter() - started, 2)
+        manifest.record_run(container, started_at, counts)
+    return counts
@@ -0,0 +1,87 @@
+"""
+대용량 파일 스트리밍 업로드
+
+- 업로드 스트림을 블록 단위로 읽어 stage_block으로 병렬 업로드 후 commit_block_list
+- 동시에 진행 중인 블록 수를 제한해 파일 크기와 무관하게 메모리 상한 유지
+- 읽은 바이트는 sink(본문 추출용 임시파일)에도 그대로 기록(tee)
+- 표준 Blob SDK 호출만 사용하므로 Azurite 연결 문자열(UseDevelopmentStorage=true)로 로컬 테스트 가능
+"""
+import asyncio
+import base64
+import os
+import tempfile
+
+from aio_clients import blob_limit, run_cpu
+
+BLOB_BLOCK_SIZE = int(os.getenv('BLOB_BLOCK_SIZE', str(4 * 1024 * 1024)))
+BLOB_UPLOAD_CONCURRENCY = int(os.getenv('BLOB_UPLOAD_CONCURRENCY', '4'))
+# 본문 추출용 사본을 메모리에 둘 최대 크기(초과 시 디스크 임시파일로 전환)
+UPLOAD_SPOOL_MAX_MEMORY = int(os.getenv('UPLOAD_SPOOL_MAX_MEMORY', str(8 * 1024 * 1024)))
+
+
+def new_spool():
+    return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_MEMORY)
+
+
+def _block_id(i):
+    # 블록 ID는 blob 내에서 길이가 모두 같아야 함
+    return base64.b64encode(f'{i:08d}'.encode('ascii')).decode('ascii')
+
+
+async def stream_upload(blob_client, source, sink=None, overwrite=False, content_type=None,
+                        block_size=BLOB_BLOCK_SIZE, max_concurrency=BLOB_UPLOAD_CONCURRENCY):
+    """
+    source(await source.read(n) 지원, 예: UploadFile)를 블록 업로드하고 전체 바이트 수 반환.
+    overwrite=False면 커밋 시 If-None-Match:* 조건으로 기존 blob을 덮어쓰지 않음.
+    """
+    from azure.core import MatchConditions
+    from azure.storage.blob import BlobBlock, ContentSettings
+
+    slots = asyncio.Semaphore(max(1, max_concurrency))
+    tasks = []
+    block_ids = []
+    total = 0
+
+    async def stage(block_id, data):
+        try:
+            async with blob_limit():
+                await blob_client.stage_block(block_id=block_id, data=data, length=len(data))
+        finally:
+            slots.release()
+
+    try:
+        i = 0
+        while True:
+            # 빈 슬롯이 생길 때까지 다음 블록을 읽지 않음 → 메모리 = 블록 크기 × 동시 블록 수
+            await slots.acquire()
+            data = await source.read(block_size)
+            if not data:
+                slots.release()
+                break
+            if sink is not None:
+                await run_cpu(sink.write, data)
+            block_id = _block_id(i)
+            block_ids.append(block_id)
+            tasks.append(asyncio.create_task(stage(block_id, data)))
+            total += len(data)
+            i += 1
+            # 완료된 블록 태스크의 예외를 빨리 드러냄
+            done = [t for t in tasks if t.done()]
+            for t in done:
+                t.result()
+                tasks.remove(t)
+        if tasks:
+            await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        raise
+
+    commit_kwargs = {}
+    if content_type:
+        commit_kwargs['content_settings'] = ContentSettings(content_type=content_type)
+    if not overwrite:
+        commit_kwargs['match_condition'] = MatchConditions.IfMissing
+    async with blob_limit():
+        await blob_client.commit_block_list([BlobBlock(block_id=b) for b in block_ids], **commit_kwargs)
+    return total
@@ -0,0 +1,159 @@
+"""
+문서 청크 분할
+
+- 추출된 본문을 문단/문장 단위로 나눈 뒤 토큰 한도(CHUNK_MAX_TOKENS)까지 묶어 청크 생성
+- 이웃 청크는 CHUNK_OVERLAP_TOKENS만큼 겹치게 해서 경계에 걸친 문장도 검색되도록 함
+- 청크마다 원문 내 위치(start, end)를 기록 → 청크 벡터 행 ↔ 문서 매핑(chunk_map)에 사용
+"""
+import os
+import re
+
+import numpy as np
+
+from embed_pipeline import estimate_tokens
+
+CHUNK_MAX_TOKENS = int(os.getenv('CHUNK_MAX_TOKENS', '500'))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', '80'))
+
+# 줄바꿈 또는 문장 끝(., ?, !, 다.) 뒤 공백을 경계로 분할
+_UNIT_RE = re.compile(r'[^\n]*?(?:[.?!。](?=\s)|\n|$)\s*')
+
+
+def _units(text):
+    """(start, end) 문장/줄 단위 구간"""
+    pos = 0
+    for m in _UNIT_RE.finditer(text):
+        if m.end() == m.start():
+            if m.end() >= len(text):
+                break
+            continue
+        yield m.start(), m.end()
+        pos = m.end()
+    if pos < len(text):
+        yield pos, len(text)
+
+
+def _hard_split(text, start, end, max_tokens):
+    """한 단위가 토큰 한도를 넘으면 글자 수 비율로 강제 분할"""
+    tokens = estimate_tokens(text[start:end])
+    if tokens <= max_tokens:
+        return [(start, end)]
+    step = max(1, int((end - start) * max_tokens / tokens))
+    return [(s, min(s + step, end)) for s in range(start, end, step)]
+
+
+class ChunkStream:
+    """
+    본문을 조각(PDF 페이지 등) 단위로 받아 청크 구간을 만드는 대로 반환(조각 사이는 sep로 이어 붙인 위치 기준).
+    전체 본문을 한 문자열로 들고 있지 않고 아직 청크로 확정되지 않은 꼬리 부분만 보관.
+    결과는 이어 붙인 본문에 split_into_chunks()를 적용한 것과 같음
+    """
+
+    def __init__(self, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, sep='\n'):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.sep = sep
+        self._tail = ''      # 본문[self._base:]
+        self._base = 0
+        self._scanned = 0    # 문장/줄 단위 분할이 끝난 위치(절대 위치)
+        self._units = []     # 다음 청크 시작부터의 단위 [(start, end, tokens)]
+        self._started = False
+
+    def feed(self, piece):
+        """조각 추가 → 새로 확정된 청크 [(start, end, chunk_text)]"""
+        if self._started:
+            self._tail += self.sep
+        self._started = True
+        self._tail += piece or ''
+        return self._advance(final=False)
+
+    def finish(self):
+        """남은 청크 반환(마지막 조각 뒤 호출)"""
+        return self._advance(final=True)
+
+    def _advance(self, final):
+        text, base = self._tail, self._base
+        units = list(_units(text[self._scanned - base:]))
+        # 마지막 단위는 다음 조각과 이어질 수 있으므로(줄 끝 공백 등) 끝날 때까지 보류
+        if not final and units:
+            units.pop()
+        offset = self._scanned
+        for start, end in units:
+            for s, e in _hard_split(text, start + offset - base, end + offset - base, self.max_tokens):
+                self._units.append((s + base, e + base, estimate_tokens(text[s:e])))
+            self._scanned = end + offset
+        chunks = []
+        pending = self._units
+        i = 0
+        while i < len(pending):
+            j, total = i, 0
+            while j < len(pending) and (j == i or total + pending[j][2] <= self.max_tokens):
+                total += pending[j][2]
+                j += 1
+            if j >= len(pending) and not final:
+                break
+            start, end = pending[i][0], pending[j - 1][1]
+            chunk_text = text[start - base:end - base].strip()
+            if chunk_text:
+                chunks.append((start, end, chunk_text))
+            if j >= len(pending):
+                i = len(pending)
+                break
+            # 다음 청크 시작점: 끝에서부터 overlap 토큰만큼 되돌아감(최소 1단위 전진)
+            back, k = 0, j
+            while k - 1 > i and back + pending[k - 1][2] <= self.overlap_tokens:
+                k -= 1
+                back += pending[k][2]
+            i = k
+        self._units = pending[i:]
+        keep = self._units[0][0] if self._units else self._scanned
+        self._tail = text[keep - base:]
+        self._base = keep
+        return chunks
+
+
+def split_into_chunks(text, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """[(start, end, chunk_text), ...] 반환. 빈 텍스트면 빈 목록"""
+    if not text or not text.strip():
+        return []
+    stream = ChunkStream(max_tokens, overlap_tokens)
+    return stream.feed(text) + stream.finish()
+
+
+def chunk_documents(docs):
+    """
+    문서 목록을 청크로 분할.
+    반환: (청크 텍스트 목록, 행 정보 목록[(문서 위치, chunk_id, start, end)])
+    """
+    texts, rows = [], []
+    for doc_pos, doc in enumerate(docs):
+        if doc.get('chunks') is not None:
+            # 추출 단계에서 페이지 단위로 미리 나눈 청크 구간(ChunkStream)
+            text = doc.get('text') or ''
+            chunks = [(start, end, text[start:end].strip()) for start, end in doc['chunks']]
+            chunks = [c for c in chunks if c[2]]
+        else:
+            chunks = split_into_chunks(doc.get('text', ''))
+        if not chunks:
+            # 본문이 없으면 문서명으로라도 1개 벡터 생성(기존 동작과 동일하게 검색 대상 유지)
+            chunks = [(0, 0, doc.get('source', '') or ' ')]
+        for chunk_id, (start, end, chunk_text) in enumerate(chunks):
+            texts.append(chunk_text)
+            rows.append((doc_pos, chunk_id, start, end))
+    return texts, rows
+
+
+def rows_to_array(rows, doc_offset=0):
+    """행 정보 → int64 배열(n, 4): [문서 번호, chunk_id, start, end]"""
+    arr = np.asarray(rows, dtype=np.int64).reshape(-1, 4)
+    if doc_offset:
+        arr[:, 0] += doc_offset
+    return arr
+
+
+def legacy_chunk_map(ntotal):
+    """chunk_map이 없는 기존 인덱스: 벡터 i = 문서 i 전체(end는 본문 끝까지, 메타를 읽지 않음)"""
+    arr = np.zeros((ntotal, 4), dtype=np.int64)
+    arr[:, 0] = np.arange(ntotal)
+    arr[:, 3] = np.iinfo(np.int64).max
+    return arr
@@ -0,0 +1,214 @@
+"""
+문서 속성 추출 / 메타데이터 필터 검색
+
+- extract_attrs(doc): 색인 시 문서 하나에서 (속성, 값) 목록 추출 → meta.db doc_attrs(속성·값별 doc_id 역리스트)에 저장
+  · year / dr : 문서명의 DR 번호(DR-2025-12349 → year=2025, dr=DR-2025-12349)
+  · menu      : 본문의 KRDS 메뉴 경로("KRDS>수수료>수수료관리", "KOS RDS -> 수수료 -> ..." 모두 같은 형식으로 정규화).
+                상위 경로도 함께 저장 → menu=KRDS>수수료 로 하위 메뉴 전체 검색(접두어 일치)
+  · ext       : 문서명 확장자, content_type: 업로드 시 Content-Type(파라미터 제외)
+- parse_filters(...): 검색 파라미터(쉼표 구분) → 정규화된 필터. 같은 속성의 값은 OR, 속성 간은 AND
+- resolve(snapshot, store, filters): 스냅샷 기준 검색 범위(SearchScope). 문서 제외 마스크(BM25/집계용)와
+  벡터 행 RowFilter(FAISS IDSelectorBitmap)를 만들어 (generation, 필터)별로 캐시 → 같은 필터의 반복 검색은 조회 비용 없음
+"""
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+
+from cache_utils import LRUTTLCache
+from index_factory import RowFilter
+
+# 추출 규칙 버전(바뀌면 기존 meta.db의 속성을 한 번 다시 추출)
+ATTRS_VERSION = '1'
+ATTRS = ('year', 'dr', 'menu', 'ext', 'content_type')
+# (generation, 필터)별 검색 범위 캐시 크기(워커당, 항목당 문서 수 + 벡터 수×1.1바이트 내외)
+FILTER_CACHE_SIZE = int(os.getenv('FILTER_CACHE_SIZE', '32'))
+# 메뉴 경로 최대 깊이/필터 값 최대 개수
+MENU_MAX_DEPTH = 8
+FILTER_MAX_VALUES = 50
+
+_DR_RE = re.compile(r'DR-?(\d{4})-?(\d+)', re.IGNORECASE)
+# 필터 값은 DR 접두어 생략 허용(2025-12349)
+_DR_VALUE_RE = re.compile(r'(?:DR-?)?(\d{4})-(\d+)', re.IGNORECASE)
+_MENU_ROOT = r'(?:KRDS|K-RDS|KOS[ -]?RDS)'
+_MENU_SEP = r'\s*(?:->|→|>)\s*'
+# 메뉴명 한 단어('->' 앞의 '-'는 구분자로 취급, On-Demand 같은 '-'는 포함)
+_MENU_WORD = r'(?:[^\s>→-]|-(?!>))+'
+# 붙여 쓴 경로(KRDS>수수료>수수료관리)는 단계 안에 공백 없음.
+# 띄어 쓴 경로(KOS RDS -> 정책 및 수수료 관리 -> ...)의 중간 단계는 다음 구분자까지(최대 4단어),
+# 마지막 단계는 한 단어까지(뒤에 이어지는 설명문 제외)
+_MENU_PATH_RE = re.compile(
+    rf'{_MENU_ROOT}(?:(?:->|→|>){_MENU_WORD})+'
+    rf'|{_MENU_ROOT}(?:\s+(?:->|→|>)\s+(?:{_MENU_WORD}(?: (?!{_MENU_ROOT}){_MENU_WORD}){{0,3}}(?=\s+(?:->|→|>)\s)'
+    rf'|{_MENU_WORD}))+')
+_MENU_SPLIT_RE = re.compile(_MENU_SEP)
+_MENU_ROOT_RE = re.compile(rf'^{_MENU_ROOT}$', re.IGNORECASE)
+
+# exclude: 문서 번호별 제외 여부(삭제 문서 + 필터 불일치), row_filter: 제외 문서의 청크 벡터를 빼는 RowFilter(없으면 None)
+# rows: 검색 대상 벡터 수, docs: 대상 문서 수
+SearchScope = namedtuple('SearchScope', ['exclude', 'row_filter', 'rows', 'docs'])
+
+_scope_cache = LRUTTLCache(FILTER_CACHE_SIZE)
+
+
+def normalize_menu(path):
+    """메뉴 경로 → 'KRDS>수수료>수수료관리' 형식(단계 내 공백 제거, 루트 표기 통일). 루트를 생략하면 KRDS로 간주"""
+    parts = [re.sub(r'\s+', '', p) for p in _MENU_SPLIT_RE.split(path.strip())]
+    parts = [p for p in parts if p]
+    if not parts:
+        return ''
+    if _MENU_ROOT_RE.match(parts[0]):
+        parts[0] = 'KRDS'
+    else:
+        parts.insert(0, 'KRDS')
+    return '>'.join(parts[:MENU_MAX_DEPTH])
+
+
+def menu_paths(text):
+    """본문의 메뉴 경로와 그 상위 경로(루트만 있는 경로 제외) 집합"""
+    paths = set()
+    for m in _MENU_PATH_RE.finditer(text or ''):
+        parts = normalize_menu(m.group(0)).split('>')
+        for depth in range(2, len(parts) + 1):
+            paths.add('>'.join(parts[:depth]))
+    return paths
+
+
+def normalize_dr(value):
+    m = _DR_VALUE_RE.fullmatch(value.strip())
+    return f'DR-{m.group(1)}-{m.group(2)}' if m else None
+
+
+def normalize_content_type(value):
+    return (value or '').split(';')[0].strip().lower()
+
+
+def extract_attrs(doc):
+    """문서 dict → [(속성, 값)] (중복 없음)"""
+    source = doc.get('source') or ''
+    attrs = set()
+    m = _DR_RE.search(source)
+    if m:
+        attrs.add(('year', m.group(1)))
+        attrs.add(('dr', f'DR-{m.group(1)}-{m.group(2)}'))
+    name = source.rsplit('/', 1)[-1]
+    if '.' in name:
+        ext = name.rsplit('.', 1)[1].lower()
+        if ext and len(ext) <= 10 and ' ' not in ext:
+            attrs.add(('ext', ext))
+    content_type = normalize_content_type(doc.get('content_type'))
+    if content_type:
+        attrs.add(('content_type', content_type))
+    attrs.update(('menu', path) for path in menu_paths(doc.get('text')))
+    return sorted(attrs)
+
+
+def _split_values(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        items = [str(v) for v in value]
+    else:
+        items = str(value).split(',')
+    return [v.strip() for v in items if v.strip()]
+
+
+def _years(value):
+    m = re.fullmatch(r'(\d{4})\s*[-~]\s*(\d{4})', value)
+    if m:
+        first, last = sorted((int(m.group(1)), int(m.group(2))))
+        return [str(y) for y in range(first, last + 1)]
+    if not re.fullmatch(r'\d{4}', value):
+        raise ValueError(f"연도 형식이 올바르지 않습니다: {value}")
+    return [value]
+
+
+def parse_filters(year=None, dr=None, menu=None, ext=None, content_type=None):
+    """
+    검색 파라미터 → 정규화된 필터 {속성: (값, ...)}(조건이 없으면 None). 값은 쉼표 구분 문자열 또는 목록
+    year는 2024-2025 같은 범위도 허용, menu는 접두어 일치(상위 메뉴 지정 시 하위 메뉴 포함)
+    """
+    filters = {}
+    for attr, raw in (('year', year), ('dr', dr), ('menu', menu), ('ext', ext), ('content_type', content_type)):
+        values = set()
+        for value in _split_values(raw):
+            if attr == 'year':
+                values.update(_years(value))
+            elif attr == 'dr':
+                normalized = normalize_dr(value)
+                if normalized is None:
+                    raise ValueError(f"DR 번호 형식이 올바르지 않습니다: {value}")
+                values.add(normalized)
+            elif attr == 'menu':
+                values.add(normalize_menu(value))
+            elif attr == 'ext':
+                values.add(value.lower().lstrip('.'))
+            else:
+                values.add(normalize_content_type(value))
+        values.discard('')
+        if len(values) > FILTER_MAX_VALUES:
+            raise ValueError(f"{attr} 필터 값은 최대 {FILTER_MAX_VALUES}개까지 가능합니다.")
+        if values:
+            filters[attr] = tuple(sorted(values))
+    return filters or None
+
+
+def filters_from_body(data):
+    """배치 검색 본문의 "filters": {"year": ..., "menu": [...]} → parse_filters 결과"""
+    if not data:
+        return None
+    if not isinstance(data, dict):
+        raise ValueError("filters는 {속성: 값} 형식이어야 합니다.")
+    unknown = set(data) - set(ATTRS)
+    if unknown:
+        raise ValueError(f"지원하지 않는 필터: {', '.join(sorted(unknown))}")
+    return parse_filters(**data)
+
+
+def describe(filters):
+    """응답/추적용 필터 표시 {속성: [값...]}"""
+    return {attr: list(values) for attr, values in filters.items()}
+
+
+def unfiltered(snapshot):
+    """필터 없는 검색 범위(삭제 문서만 제외, 스냅샷 로드 시 만든 RowFilter 재사용)"""
+    row_filter = snapshot.row_filter
+    ntotal = snapshot.index.ntotal
+    rows = ntotal - row_filter.excluded if row_filter is not None else ntotal
+    return SearchScope(snapshot.deleted, row_filter, rows, len(snapshot.deleted))
+
+
+def _build_scope(snapshot, store, filters):
+    meta_count = len(snapshot.deleted)
+    match = np.ones(meta_count, dtype=bool)
+    for attr, values in filters.items():
+        attr_match = np.zeros(meta_count, dtype=bool)
+        ids = store.doc_ids_with(attr, values, limit=meta_count)
+        if ids:
+            attr_match[np.asarray(ids, dtype=np.int64)] = True
+        match &= attr_match
+    exclude = snapshot.deleted | ~match
+    # 청크 벡터 행 → 문서 번호 → 제외 여부(chunk_map 범위 밖 문서는 제외)
+    doc_ids = np.asarray(snapshot.chunk_map[:snapshot.index.ntotal, 0], dtype=np.int64)
+    valid = doc_ids < meta_count
+    live_rows = np.zeros(len(doc_ids), dtype=bool)
+    live_rows[valid] = ~exclude[doc_ids[valid]]
+    row_filter = RowFilter(live_rows)
+    return SearchScope(exclude, row_filter, row_filter.ntotal - row_filter.excluded, int((~exclude).sum()))
+
+
+def resolve(snapshot, store, filters):
+    """스냅샷 + 필터 → SearchScope(필터가 없으면 unfiltered). generation이 같으면 캐시 재사용"""
+    if not filters:
+        return unfiltered(snapshot)
+    key = (snapshot.generation, tuple(sorted(filters.items())))
+    scope = _scope_cache.get(key)
+    if scope is None:
+        scope = _build_scope(snapshot, store, filters)
+        _scope_cache.set(key, scope)
+    return scope
+
+
+def cache_stats():
+    return {'size': len(_scope_cache), 'hits': _scope_cache.hits, 'misses': _scope_cache.misses}
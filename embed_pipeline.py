@@ -0,0 +1,209 @@
+"""
+배치/동시 임베딩 파이프라인
+
+- 여러 텍스트를 요청 1건에 묶어서 전송(요청당 항목 수/토큰 수 한도 준수)
+- 배치 여러 개를 제한된 워커 풀로 동시에 실행
+- 429/5xx/연결 오류는 지수 백오프로 재시도(Retry-After 헤더 우선)
+- 진행률/처리량(docs/sec, tokens/sec) 콜백 보고
+- cache(EmbeddingCache)를 주면 이미 임베딩된 텍스트는 호출하지 않고 재사용
+
+client는 embeddings.create(input=[...], model=...)를 제공하는 OpenAI/AzureOpenAI 호환 객체면 된다.
+(azure_endpoint를 로컬 가짜 임베딩 서버로 지정해 테스트 가능)
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+# Azure OpenAI 임베딩 한도: 입력 항목 2048개, 입력당 8191토큰
+EMBED_BATCH_ITEMS = int(os.getenv('EMBED_BATCH_ITEMS', '256'))
+EMBED_BATCH_TOKENS = int(os.getenv('EMBED_BATCH_TOKENS', '100000'))
+EMBED_CONCURRENCY = int(os.getenv('EMBED_CONCURRENCY', '4'))
+EMBED_MAX_RETRIES = int(os.getenv('EMBED_MAX_RETRIES', '6'))
+EMBED_MAX_CHARS = 8000
+# text-embedding-3 계열 축소 차원(0이면 모델 기본 차원). 인덱스/질의/캐시 모두 같은 값이어야 함
+EMBED_DIMENSIONS = int(os.getenv('EMBED_DIMENSIONS', '0'))
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding('cl100k_base')
+except Exception:
+    _encoding = None
+
+
+def estimate_tokens(text):
+    """토큰 수 추정(tiktoken 없으면 글자 수 기준 - 한글은 대략 글자당 1토큰 이상이므로 보수적)"""
+    if not text:
+        return 1
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text)
+
+
+def cache_namespace(model, dimensions=EMBED_DIMENSIONS):
+    """임베딩 캐시 네임스페이스(차원이 다르면 다른 캐시)"""
+    return f'{model}@{dimensions}' if dimensions else model
+
+
+def _is_retryable(e):
+    status = getattr(e, 'status_code', None)
+    if status is None and getattr(e, 'response', None) is not None:
+        status = getattr(e.response, 'status_code', None)
+    if status is not None:
+        return status == 429 or status >= 500
+    # 상태코드 없는 연결/타임아웃 오류
+    name = type(e).__name__
+    return name in ('APIConnectionError', 'APITimeoutError', 'ConnectError', 'ReadTimeout', 'ConnectionError')
+
+
+def _retry_after(e):
+    response = getattr(e, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    value = headers.get('retry-after') or headers.get('Retry-After')
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class EmbedStats:
+    def __init__(self):
+        self.docs = 0
+        self.tokens = 0
+        self.requests = 0
+        self.retries = 0
+        self.failed = 0
+        self.cache_hits = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, docs=0, tokens=0, requests=0, retries=0, failed=0, cache_hits=0):
+        with self._lock:
+            self.cache_hits += cache_hits
+            self.docs += docs
+            self.tokens += tokens
+            self.requests += requests
+            self.retries += retries
+            self.failed += failed
+
+    @property
+    def elapsed(self):
+        return max(time.monotonic() - self.started, 1e-9)
+
+    def summary(self):
+        return {
+            'docs': self.docs,
+            'tokens': self.tokens,
+            'requests': self.requests,
+            'retries': self.retries,
+            'failed': self.failed,
+            'cache_hits': self.cache_hits,
+            'elapsed_sec': round(self.elapsed, 3),
+            'docs_per_sec': round(self.docs / self.elapsed, 2),
+            'tokens_per_sec': round(self.tokens / self.elapsed, 1),
+        }
+
+
+class BatchEmbedder:
+    def __init__(self, client, model, max_batch_items=EMBED_BATCH_ITEMS, max_batch_tokens=EMBED_BATCH_TOKENS,
+                 concurrency=EMBED_CONCURRENCY, max_retries=EMBED_MAX_RETRIES, max_chars=EMBED_MAX_CHARS,
+                 progress=None, cache=None, dimensions=EMBED_DIMENSIONS):
+        self.client = client
+        self.model = model
+        self.dimensions = dimensions
+        self.max_batch_items = max(1, min(max_batch_items, 2048))
+        self.max_batch_tokens = max_batch_tokens
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.max_chars = max_chars
+        self.progress = progress
+        self.cache = cache
+        self.errors = {}
+
+    def _prepare(self, text):
+        text = text or ' '
+        if self.max_chars and len(text) > self.max_chars:
+            text = text[:self.max_chars]
+        return text
+
+    def make_batches(self, texts, positions=None):
+        """(원래 위치, 텍스트, 추정 토큰) 목록을 요청 한도에 맞게 묶음"""
+        batches, current, current_tokens = [], [], 0
+        if positions is None:
+            positions = range(len(texts))
+        for i in positions:
+            text = texts[i]
+            tokens = estimate_tokens(text)
+            if current and (len(current) >= self.max_batch_items or current_tokens + tokens > self.max_batch_tokens):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append((i, text, tokens))
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _call_with_retry(self, inputs, stats):
+        attempt = 0
+        while True:
+            try:
+                stats.add(requests=1)
+                if self.dimensions:
+                    return self.client.embeddings.create(input=inputs, model=self.model, dimensions=self.dimensions)
+                return self.client.embeddings.create(input=inputs, model=self.model)
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = min(60.0, (2 ** attempt) * 0.5) * (0.5 + random.random())
+                attempt += 1
+                stats.add(retries=1)
+                time.sleep(delay)
+
+    def _embed_batch(self, batch, stats):
+        inputs = [text for _, text, _ in batch]
+        response = self._call_with_retry(inputs, stats)
+        data = sorted(response.data, key=lambda d: d.index)
+        vectors = [np.asarray(d.embedding, dtype=np.float32) for d in data]
+        usage = getattr(response, 'usage', None)
+        tokens = getattr(usage, 'total_tokens', None) or sum(t for _, _, t in batch)
+        return vectors, tokens
+
+    def embed(self, texts, stats=None):
+        """
+        texts 순서대로 벡터 목록 반환. 재시도 후에도 실패한 배치의 항목은 None.
+        (stats에 누적 처리량 기록)
+        """
+        stats = stats or EmbedStats()
+        prepared = [self._prepare(t) for t in texts]
+        results = [None] * len(prepared)
+        errors = {}
+        if self.cache is not None:
+            results = self.cache.get_many(prepared)
+            hits = sum(1 for r in results if r is not None)
+            stats.add(docs=hits, cache_hits=hits)
+        missing = [i for i, r in enumerate(results) if r is None]
+        batches = self.make_batches(prepared, missing)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {pool.submit(self._embed_batch, batch, stats): batch for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    vectors, tokens = future.result()
+                    for (i, _, _), vec in zip(batch, vectors):
+                        results[i] = vec
+                    stats.add(docs=len(batch), tokens=tokens)
+                    if self.cache is not None:
+                        self.cache.put_many([text for _, text, _ in batch], vectors)
+                except Exception as e:
+                    for i, _, _ in batch:
+                        errors[i] = e
+                    stats.add(failed=len(batch))
+                if self.progress:
+                    self.progress(stats, len(prepared))
+        self.errors = errors
+        return results
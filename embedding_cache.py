@@ -0,0 +1,310 @@
+"""
+콘텐츠 해시 기반 임베딩 캐시
+
+- 키: (임베딩 배포명, 정규화 텍스트의 sha256) → 배포명별 파일로 분리
+- 저장: embed_cache/<배포명>.f32 (float32 행렬, np.memmap) + <배포명>.keys.db (SQLite: 키 → 행 번호/최근 사용)
+- 최대 항목 수 초과 시 가장 오래 사용되지 않은 항목부터 교체(LRU)
+- ingest.py와 업로드 경로가 같이 쓰므로 읽기/쓰기 모두 같은 파일 락 안에서 수행
+- 쓰기 순서: (1) 교체할 키 삭제 + 행을 빈 행 목록으로 이동(커밋) → (2) 행렬에 벡터 기록 → (3) 새 키 등록(커밋)
+  → 어느 단계에서 중단되어도 키가 다른 텍스트의 벡터를 가리키지 않음(중단된 행은 빈 행으로 남아 다음에 재사용)
+- 키 등록은 추가분만 INSERT(배치마다 전체 키 목록을 다시 쓰지 않음)
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from filelock import FileLock
+except ImportError:
+    FileLock = None
+
+BASE_DIR = Path(__file__).parent
+INDEX_DIR = Path(os.getenv('INDEX_DIR') or BASE_DIR)
+EMBED_CACHE_DIR = Path(os.getenv('EMBED_CACHE_DIR') or (INDEX_DIR / 'embed_cache'))
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv('EMBED_CACHE_MAX_ENTRIES', '200000'))
+EMBED_CACHE_ENABLED = os.getenv('EMBED_CACHE_ENABLED', '1') == '1'
+
+_WS_RE = re.compile(r'\s+')
+_SAFE_NAME_RE = re.compile(r'[^0-9A-Za-z._-]+')
+# SQLite IN (...) 파라미터 묶음 크기
+_SQL_BATCH = 500
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    row INTEGER NOT NULL UNIQUE,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_used ON entries(used);
+CREATE TABLE IF NOT EXISTS free_rows (
+    row INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS cache_info (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+
+def normalize_text(text):
+    """유니코드 정규화 + 공백 정리(줄바꿈/중복 공백 차이로 재임베딩하지 않도록)"""
+    text = unicodedata.normalize('NFC', text or '')
+    return _WS_RE.sub(' ', text).strip()
+
+
+def text_key(text):
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()[:32]
+
+
+def _chunks(items, size=_SQL_BATCH):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class _NullLock:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class EmbeddingCache:
+    def __init__(self, namespace, cache_dir=EMBED_CACHE_DIR, max_entries=EMBED_CACHE_MAX_ENTRIES):
+        self.namespace = namespace or 'default'
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        safe = _SAFE_NAME_RE.sub('_', self.namespace)
+        self.matrix_path = self.cache_dir / f'{safe}.f32'
+        self.db_path = self.cache_dir / f'{safe}.keys.db'
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._file_lock = FileLock(str(self.db_path) + '.lock') if FileLock else None
+        self._matrix = None
+        self._matrix_shape = None
+        self._conn().executescript(_SCHEMA)
+        with self._locked():
+            self._migrate_json(self.cache_dir / f'{safe}.keys.json')
+
+    # ----- 파일 입출력 -----
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _locked(self):
+        """프로세스 간 파일 락(읽기/쓰기 공통)"""
+        if self._file_lock is None:
+            return _NullLock()
+        return self._file_lock.acquire(timeout=30)
+
+    def _info(self):
+        """(dim, capacity, next_row). 아직 아무것도 저장하지 않았으면 dim은 None"""
+        info = dict(self._conn().execute('SELECT key, value FROM cache_info'))
+        dim = int(info['dim']) if 'dim' in info else None
+        return dim, int(info.get('capacity', 0)), int(info.get('next_row', 0))
+
+    def _set_info(self, conn, **values):
+        conn.executemany('INSERT OR REPLACE INTO cache_info (key, value) VALUES (?, ?)',
+                         [(k, str(v)) for k, v in values.items()])
+
+    def _open_matrix(self, dim, capacity):
+        """행렬 memmap(다른 프로세스가 크기를 늘렸으면 다시 매핑)"""
+        if not dim or not capacity:
+            return None
+        if self._matrix is None or self._matrix_shape != (capacity, dim):
+            if self._matrix is not None:
+                self._matrix.flush()
+            self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r+', shape=(capacity, dim))
+            self._matrix_shape = (capacity, dim)
+        return self._matrix
+
+    def _migrate_json(self, keys_path):
+        """이전 형식(<배포명>.keys.json)이 있으면 키를 한 번 옮겨 오고 삭제"""
+        if not keys_path.exists():
+            return
+        try:
+            with open(keys_path, encoding='utf-8') as f:
+                data = json.load(f)
+            conn = self._conn()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if self._info()[0] is None and self.matrix_path.exists():
+                    used = {row for row, _ in data['entries'].values()}
+                    conn.executemany('INSERT OR IGNORE INTO entries (key, row, used) VALUES (?, ?, ?)',
+                                     [(k, row, tick) for k, (row, tick) in data['entries'].items()])
+                    conn.executemany('INSERT OR IGNORE INTO free_rows (row) VALUES (?)',
+                                     [(r,) for r in range(data['next_row']) if r not in used])
+                    self._set_info(conn, dim=data['dim'], capacity=data['capacity'], next_row=data['next_row'])
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            print(f"[embedding_cache] {keys_path.name} → {self.db_path.name} 이전 완료: {len(data['entries'])}건")
+        except (ValueError, KeyError) as e:
+            print(f"[embedding_cache] 이전 키 인덱스 손상, 무시: {e}")
+        os.remove(keys_path)
+
+    def _grow(self, dim, capacity, needed_rows):
+        """행렬 파일을 needed_rows 이상(최대 max_entries)으로 확장 → 새 capacity"""
+        new_capacity = max(1024, capacity)
+        while new_capacity < needed_rows:
+            new_capacity *= 2
+        new_capacity = min(new_capacity, self.max_entries)
+        if new_capacity <= capacity:
+            return capacity
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(self.matrix_path, 'ab') as f:
+            f.truncate(new_capacity * dim * 4)
+        return new_capacity
+
+    def _reserve_rows(self, count, dim):
+        """
+        새 항목용 행 count개 확보(빈 행 → 뒤에 추가 → LRU 교체 순) 후 커밋. 반환: (행 번호 목록, capacity)
+        교체된 키는 이 트랜잭션에서 삭제되므로 벡터를 덮어쓰기 전에 더 이상 조회되지 않음
+        """
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            stored_dim, capacity, next_row = self._info()
+            free = conn.execute('SELECT COUNT(*) FROM free_rows').fetchone()[0]
+            remaining = count - free
+            if remaining > 0:
+                take = min(remaining, self.max_entries - next_row)
+                if take > 0:
+                    capacity = self._grow(dim, capacity, next_row + take)
+                    conn.executemany('INSERT INTO free_rows (row) VALUES (?)',
+                                     [(r,) for r in range(next_row, next_row + take)])
+                    next_row += take
+                    remaining -= take
+            if remaining > 0:
+                victims = conn.execute('SELECT key, row FROM entries ORDER BY used LIMIT ?', (remaining,)).fetchall()
+                conn.executemany('DELETE FROM entries WHERE key = ?', [(key,) for key, _ in victims])
+                conn.executemany('INSERT INTO free_rows (row) VALUES (?)', [(row,) for _, row in victims])
+                self.evictions += len(victims)
+            self._set_info(conn, dim=dim, capacity=capacity, next_row=next_row)
+            rows = [r for (r,) in conn.execute('SELECT row FROM free_rows ORDER BY row LIMIT ?', (count,))]
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return rows, capacity
+
+    # ----- 공개 API -----
+    def get_many(self, texts):
+        """texts 순서대로 캐시된 벡터(없으면 None) 반환"""
+        keys = [text_key(t) for t in texts]
+        results = [None] * len(keys)
+        with self._lock, self._locked():
+            dim, capacity, _ = self._info()
+            matrix = self._open_matrix(dim, capacity)
+            if matrix is not None and keys:
+                conn = self._conn()
+                found = {}
+                for part in _chunks(sorted(set(keys))):
+                    found.update(conn.execute(
+                        f'SELECT key, row FROM entries WHERE key IN ({",".join("?" * len(part))})', part))
+                for i, key in enumerate(keys):
+                    row = found.get(key)
+                    if row is not None:
+                        results[i] = np.array(matrix[row], dtype=np.float32)
+                if found:
+                    now = time.time()
+                    conn.executemany('UPDATE entries SET used = ? WHERE key = ?', [(now, k) for k in found])
+        hits = sum(1 for r in results if r is not None)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def get(self, text):
+        return self.get_many([text])[0]
+
+    def put_many(self, texts, vectors):
+        pairs = [(text_key(t), np.asarray(v, dtype=np.float32).ravel()) for t, v in zip(texts, vectors) if v is not None]
+        if not pairs:
+            return
+        with self._lock, self._locked():
+            conn = self._conn()
+            dim = self._info()[0] or int(pairs[0][1].shape[0])
+            # 중복 키 제거 및 이미 있는 키는 건너뜀
+            new_pairs = {}
+            for key, vec in pairs:
+                if vec.shape[0] != dim:
+                    print(f"[embedding_cache] 차원 불일치로 저장 생략: {vec.shape[0]} != {dim}")
+                    continue
+                new_pairs[key] = vec
+            for part in _chunks(list(new_pairs)):
+                for (key,) in conn.execute(
+                        f'SELECT key FROM entries WHERE key IN ({",".join("?" * len(part))})', part):
+                    del new_pairs[key]
+            new_pairs = list(new_pairs.items())[-self.max_entries:]
+            if not new_pairs:
+                return
+            rows, capacity = self._reserve_rows(len(new_pairs), dim)
+            matrix = self._open_matrix(dim, capacity)
+            for (_, vec), row in zip(new_pairs, rows):
+                matrix[row] = vec
+            matrix.flush()
+            now = time.time()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany('DELETE FROM free_rows WHERE row = ?', [(row,) for row in rows])
+                conn.executemany('INSERT INTO entries (key, row, used) VALUES (?, ?, ?)',
+                                 [(key, row, now) for (key, _), row in zip(new_pairs, rows)])
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def put(self, text, vector):
+        self.put_many([text], [vector])
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'namespace': self.namespace,
+            'entries': self._conn().execute('SELECT COUNT(*) FROM entries').fetchone()[0],
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            'evictions': self.evictions,
+        }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(namespace):
+    """배포명별 캐시 인스턴스(프로세스 내 공유). EMBED_CACHE_ENABLED=0이면 None"""
+    if not EMBED_CACHE_ENABLED:
+        return None
+    with _caches_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            try:
+                cache = EmbeddingCache(namespace)
+            except Exception as e:
+                print(f"[embedding_cache] 캐시 열기 실패(캐시 없이 진행): {e}")
+                return None
+            _caches[namespace] = cache
+        return cache
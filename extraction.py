@@ -0,0 +1,255 @@
+"""
+업로드 문서 본문 추출
+
+- txt/docx: 가볍기 때문에 스레드 풀(run_cpu)에서 바로 처리
+- pdf: 별도 프로세스 풀에서 처리(이벤트 루프/검색 스레드와 GIL 경쟁 없음)
+  1) 빠른 1차 추출: PyMuPDF로 전체 페이지 텍스트(없으면 PyPDF2, pdfplumber 순으로 대체)
+  2) 텍스트가 없는 페이지(스캔 이미지)만 골라 페이지 단위 OCR을 프로세스 풀에 병렬 제출
+  3) 문서별 예산: 전체 시간(EXTRACT_TIME_BUDGET_SEC), OCR 페이지 수(EXTRACT_MAX_OCR_PAGES),
+     결과 글자 수(EXTRACT_MAX_CHARS), 워커 프로세스 메모리 상한(EXTRACT_WORKER_MEMORY_MB)
+  4) iter_pdf_pages()는 페이지 순서대로 준비되는 즉시 반환 → 페이지마다 바로 청크 분할(chunking.ChunkStream)하고
+     본문은 임시파일에 이어 씀(페이지 목록과 합친 본문을 동시에 메모리에 두지 않음)
+- 예산 초과로 처리하지 못한 페이지는 빈 페이지로 두고 info['truncated']에 기록
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+
+EXTRACT_WORKERS = int(os.getenv('EXTRACT_WORKERS', str(min(4, os.cpu_count() or 1))))
+EXTRACT_TIME_BUDGET_SEC = float(os.getenv('EXTRACT_TIME_BUDGET_SEC', '120'))
+EXTRACT_MAX_OCR_PAGES = int(os.getenv('EXTRACT_MAX_OCR_PAGES', '200'))
+EXTRACT_MAX_CHARS = int(os.getenv('EXTRACT_MAX_CHARS', '2000000'))
+EXTRACT_WORKER_MEMORY_MB = int(os.getenv('EXTRACT_WORKER_MEMORY_MB', '0'))  # 0이면 제한 없음
+# 이 글자 수 미만인 페이지는 텍스트 레이어가 없는 것으로 보고 OCR
+EXTRACT_MIN_PAGE_CHARS = int(os.getenv('EXTRACT_MIN_PAGE_CHARS', '10'))
+OCR_DPI = int(os.getenv('OCR_DPI', '300'))
+OCR_LANG = os.getenv('OCR_LANG') or None  # 예: kor+eng (미지정 시 tesseract 기본)
+
+_pool = None
+
+
+class _SuppressStderr:
+    """PDF 라이브러리의 경고 출력 억제"""
+    def __enter__(self):
+        self._stderr = sys.stderr
+        sys.stderr = open(os.devnull, 'w')
+
+    def __exit__(self, *args):
+        sys.stderr.close()
+        sys.stderr = self._stderr
+
+
+# ----- 워커 프로세스에서 실행되는 함수(모듈 최상위 함수여야 pickle 가능) -----
+def _init_worker(memory_mb):
+    if memory_mb:
+        try:
+            import resource
+            limit = memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except Exception as e:
+            print(f"[extraction] 워커 메모리 제한 설정 실패: {e}")
+
+
+def _fast_pass(path):
+    """페이지별 텍스트 레이어 추출 → (페이지 텍스트 목록, 사용한 추출기)"""
+    with _SuppressStderr():
+        try:
+            import fitz  # PyMuPDF
+            with fitz.open(path) as doc:
+                return [page.get_text() or '' for page in doc], 'pymupdf'
+        except ImportError:
+            pass
+        except Exception as e:
+            print(f'PyMuPDF 추출 실패: {e}')
+        try:
+            from PyPDF2 import PdfReader
+            reader = PdfReader(path)
+            return [page.extract_text() or '' for page in reader.pages], 'pypdf2'
+        except Exception as e:
+            print(f'PyPDF2 추출 실패: {e}')
+        try:
+            import pdfplumber
+            with pdfplumber.open(path) as pdf:
+                return [page.extract_text() or '' for page in pdf.pages], 'pdfplumber'
+        except Exception as e:
+            print(f'pdfplumber 추출 실패: {e}')
+    return [], None
+
+
+def _ocr_page(path, page_no, dpi=OCR_DPI, lang=OCR_LANG):
+    """한 페이지만 렌더링해 OCR(페이지 이미지 1장만 메모리에 올림)"""
+    import pytesseract
+    with _SuppressStderr():
+        try:
+            import fitz
+            from PIL import Image
+            with fitz.open(path) as doc:
+                pix = doc[page_no].get_pixmap(dpi=dpi)
+                img = Image.frombytes('RGB', (pix.width, pix.height), pix.samples)
+        except ImportError:
+            import pdfplumber
+            with pdfplumber.open(path) as pdf:
+                img = pdf.pages[page_no].to_image(resolution=dpi).original
+    return pytesseract.image_to_string(img, lang=lang) if lang else pytesseract.image_to_string(img)
+
+
+# ----- API 프로세스 측 -----
+def get_pool():
+    global _pool
+    if _pool is None:
+        import multiprocessing
+        # fork 대신 spawn: 서버 프로세스의 스레드/소켓 상태를 복제하지 않음
+        _pool = ProcessPoolExecutor(max_workers=max(1, EXTRACT_WORKERS),
+                                    mp_context=multiprocessing.get_context('spawn'),
+                                    initializer=_init_worker, initargs=(EXTRACT_WORKER_MEMORY_MB,))
+    return _pool
+
+
+def _reset_pool():
+    """워커가 메모리 초과 등으로 죽으면 풀을 새로 만듦"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _spool_to_file(fileobj, suffix):
+    """업로드 임시파일(메모리/디스크) → 워커 프로세스가 열 수 있는 경로"""
+    fileobj.seek(0)
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    with tmp:
+        shutil.copyfileobj(fileobj, tmp, 1024 * 1024)
+    return tmp.name
+
+
+def extract_simple(ext, fileobj):
+    """txt/docx 본문(run_cpu로 호출)"""
+    fileobj.seek(0)
+    if ext == 'txt':
+        return fileobj.read().decode('utf-8', errors='ignore')
+    if ext == 'docx':
+        from docx import Document
+        doc = Document(fileobj)
+        return '\n'.join([p.text for p in doc.paragraphs])
+    return ''
+
+
+async def _run(fn, *args):
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_pool(), fn, *args)
+    except BrokenProcessPool:
+        _reset_pool()
+        raise
+
+
+async def iter_pdf_pages(path, info, time_budget=EXTRACT_TIME_BUDGET_SEC, max_ocr_pages=EXTRACT_MAX_OCR_PAGES):
+    """
+    (페이지 번호, 텍스트)를 페이지 순서대로 반환. 텍스트가 없는 페이지는 OCR 결과가 나오는 대로 반환.
+    info에 페이지 수/OCR 페이지 수/예산 초과 여부 기록
+    """
+    deadline = time.monotonic() + time_budget
+    pages, extractor = await asyncio.wait_for(_run(_fast_pass, path), time_budget)
+    info.update(pages=len(pages), extractor=extractor, ocr_pages=0, ocr_failed=0, truncated=False)
+    empty = [i for i, text in enumerate(pages) if len(text.strip()) < EXTRACT_MIN_PAGE_CHARS]
+    if len(empty) > max_ocr_pages:
+        info['truncated'] = True
+        print(f"[extraction] OCR 대상 {len(empty)}페이지 중 {max_ocr_pages}페이지만 처리(EXTRACT_MAX_OCR_PAGES)")
+        empty = empty[:max_ocr_pages]
+    # OCR 대상 페이지를 한꺼번에 제출 → 워커 수만큼 병렬 처리
+    ocr_tasks = {i: asyncio.ensure_future(_run(_ocr_page, path, i)) for i in empty}
+    try:
+        for i, text in enumerate(pages):
+            task = ocr_tasks.pop(i, None)
+            if task is not None:
+                try:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError
+                    text = await asyncio.wait_for(asyncio.shield(task), remaining)
+                    info['ocr_pages'] += 1
+                except asyncio.TimeoutError:
+                    task.cancel()
+                    print(f"[extraction] 시간 예산({time_budget}초) 초과: {i + 1}페이지 이후 OCR 생략")
+                    info['truncated'] = True
+                    # 남은 OCR은 기다리지 않음(아직 시작 안 한 작업은 취소, 실행 중인 페이지는 워커에서 끝까지 처리됨)
+                    for t in ocr_tasks.values():
+                        t.cancel()
+                    ocr_tasks.clear()
+                except Exception as e:
+                    info['ocr_failed'] += 1
+                    print(f'OCR 추출 실패({i + 1}페이지): {e}')
+            yield i, text
+    finally:
+        # 중단(예외/클라이언트 종료) 시 아직 시작 안 한 OCR 작업 취소
+        for task in ocr_tasks.values():
+            task.cancel()
+
+
+async def extract_text(filename, fileobj):
+    """
+    업로드 파일 본문 추출 → (본문, 확장자, 추출 정보, 청크 구간)
+    fileobj: 업로드 중 tee된 임시파일
+    청크 구간: pdf는 페이지가 나오는 대로 나눈 [(start, end)], 그 외는 None(인덱싱 시 본문으로 분할)
+    """
+    ext = filename.lower().split('.')[-1]
+    info = {'ext': ext}
+    chunks = None
+    started = time.perf_counter()
+    from aio_clients import run_cpu
+    try:
+        if ext != 'pdf':
+            text = await run_cpu(extract_simple, ext, fileobj)
+        else:
+            path = await run_cpu(_spool_to_file, fileobj, '.pdf')
+            try:
+                text, chunks = await _extract_pdf(path, info)
+            finally:
+                os.remove(path)
+    except Exception as e:
+        print(f'본문 추출 오류: {e}')
+        text, chunks = '', None
+    elapsed = time.perf_counter() - started
+    metrics.STAGE_SECONDS.observe(elapsed, 'extraction')
+    info['elapsed_sec'] = round(elapsed, 2)
+    if ext == 'pdf':
+        print(f"[extraction] {filename}: {info}")
+    return text, ext, info, chunks
+
+
+async def _extract_pdf(path, info):
+    """페이지 순서대로 청크 분할 + 임시파일에 본문 기록 → (본문, 청크 구간)"""
+    from chunking import ChunkStream
+    stream = ChunkStream()
+    chunks, total = [], 0
+    with tempfile.TemporaryFile('w+', encoding='utf-8', newline='') as body:
+        async for page_no, page_text in iter_pdf_pages(path, info):
+            over = total + len(page_text) > EXTRACT_MAX_CHARS
+            if over:
+                page_text = page_text[:EXTRACT_MAX_CHARS - total]
+                info['truncated'] = True
+                print(f"[extraction] 본문 {EXTRACT_MAX_CHARS}자 초과: 이후 페이지 생략")
+            if page_no:
+                body.write('\n')
+            body.write(page_text)
+            total += len(page_text)
+            chunks.extend((start, end) for start, end, _ in stream.feed(page_text))
+            if over:
+                break
+        chunks.extend((start, end) for start, end, _ in stream.finish())
+        body.seek(0)
+        return body.read(), chunks
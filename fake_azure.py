@@ -0,0 +1,441 @@
+"""
+벤치마크/로컬 실행용 Azure 서비스 대체 서버(단일 HTTP 서버, 표준 라이브러리만 사용)
+
+- Azure OpenAI: /openai/deployments/{배포}/embeddings, /chat/completions(stream 포함)
+  · 임베딩은 결정적: 토큰(lexical_index.tokenize)별 고정 난수 벡터의 합을 정규화 → 같은 텍스트 = 같은 벡터,
+    단어가 겹치는 텍스트끼리 가까움(검색 결과가 실행마다 동일)
+  · 지연시간은 요청당 고정값 + 항목당 값으로 흉내(FAKE_EMBED_LATENCY_MS, FAKE_EMBED_ITEM_MS, FAKE_CHAT_LATENCY_MS)
+- Azure Blob Storage: 로컬 디렉터리에 저장하는 Block Blob REST 일부(Put Block/Put Block List/Put Blob,
+  Get Blob(Range), Get Blob Properties, Delete Blob, List Blobs). 인증 서명은 검사하지 않음
+- Azure Cognitive Search: /indexes/{인덱스}/docs/index 는 항상 성공 응답
+- GET /_stats: 경로별 요청 수/임베딩 항목 수(벤치마크에서 업스트림 호출 수 확인용)
+
+단독 실행: python fake_azure.py --port 8900 --root ./fake_blob  → 출력된 환경변수를 app.py/ingest.py에 지정
+"""
+import argparse
+import base64
+import email.utils
+import hashlib
+import json
+import os
+import re
+import shutil
+import socket
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from lexical_index import tokenize
+
+FAKE_EMBED_DIM = int(os.getenv('FAKE_EMBED_DIM', '1536'))
+FAKE_EMBED_LATENCY_MS = float(os.getenv('FAKE_EMBED_LATENCY_MS', '20'))
+FAKE_EMBED_ITEM_MS = float(os.getenv('FAKE_EMBED_ITEM_MS', '0.05'))
+FAKE_CHAT_LATENCY_MS = float(os.getenv('FAKE_CHAT_LATENCY_MS', '300'))
+# 토큰 → 벡터 표의 행 수(해시 충돌은 허용)
+FAKE_VOCAB_ROWS = 4096
+BLOB_ACCOUNT = 'devstoreaccount1'
+# Azurite 공개 개발용 키(서명은 검사하지 않지만 SDK가 base64 키를 요구)
+BLOB_ACCOUNT_KEY = 'Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw=='
+
+
+class FakeEmbedder:
+    """결정적 임베딩(토큰 해시 → 고정 난수 벡터 합)"""
+
+    def __init__(self, dim=FAKE_EMBED_DIM, seed=0):
+        self.dim = dim
+        self.table = np.random.default_rng(seed).standard_normal((FAKE_VOCAB_ROWS, dim)).astype(np.float32)
+
+    def embed(self, texts, dimensions=None):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            rows = [zlib.crc32(t.encode('utf-8')) % FAKE_VOCAB_ROWS for t in tokenize(text)]
+            if not rows:
+                rows = [zlib.crc32(text.encode('utf-8')) % FAKE_VOCAB_ROWS]
+            out[i] = self.table[rows].sum(axis=0)
+        if dimensions and dimensions < self.dim:
+            out = np.ascontiguousarray(out[:, :dimensions])
+        out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-6)
+        return out
+
+
+def fake_summary(prompt):
+    """요약 프롬프트 → 결정적 응답(본문 앞쪽 단어로 키워드/요약 구성)"""
+    body = prompt.split('[문서 본문]', 1)[-1]
+    words = []
+    for w in re.findall(r'[가-힣A-Za-z0-9\-]{2,}', body):
+        if w not in words:
+            words.append(w)
+        if len(words) >= 5:
+            break
+    summary = ' '.join(body.split())[:160]
+    return f"키워드: {', '.join(words)}\n요약: {summary}"
+
+
+def _http_date(ts):
+    return email.utils.formatdate(ts, usegmt=True)
+
+
+class FakeAzureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeAzure/1.0'
+
+    def setup(self):
+        super().setup()
+        # 헤더/본문을 따로 쓰므로 Nagle 알고리즘을 끄지 않으면 응답마다 지연(ACK 대기)이 생김
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, fmt, *args):
+        pass
+
+    # ----- 공통 -----
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status, body=b'', headers=None, content_type='application/json'):
+        self.send_response(status)
+        if content_type and body is not None:
+            self.send_header('Content-Type', content_type)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _json(self, status, payload):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+
+    def _route(self):
+        parts = urlsplit(self.path)
+        return unquote(parts.path), parse_qs(parts.query)
+
+    def _count(self, key, n=1):
+        stats = self.server.stats
+        with self.server.stats_lock:
+            stats[key] = stats.get(key, 0) + n
+
+    def do_GET(self):
+        path, query = self._route()
+        if path == '/_stats':
+            return self._json(200, self.server.stats)
+        return self._blob('GET', path, query)
+
+    def do_HEAD(self):
+        path, query = self._route()
+        return self._blob('HEAD', path, query)
+
+    def do_PUT(self):
+        path, query = self._route()
+        return self._blob('PUT', path, query)
+
+    def do_DELETE(self):
+        path, query = self._route()
+        return self._blob('DELETE', path, query)
+
+    def do_POST(self):
+        path, _ = self._route()
+        m = re.match(r'^/openai/deployments/([^/]+)/(embeddings|chat/completions)$', path)
+        if m:
+            payload = json.loads(self._body() or b'{}')
+            if m.group(2) == 'embeddings':
+                return self._embeddings(m.group(1), payload)
+            return self._chat(m.group(1), payload)
+        if re.match(r'^/indexes/[^/]+/docs/index$', path):
+            docs = json.loads(self._body() or b'{}').get('value', [])
+            self._count('search_index_docs', len(docs))
+            return self._json(200, {'value': [{'key': d.get('metadata_storage_path'), 'status': True,
+                                               'statusCode': 200} for d in docs]})
+        self._json(404, {'error': {'code': 'NotFound', 'message': path}})
+
+    # ----- Azure OpenAI -----
+    def _embeddings(self, deployment, payload):
+        texts = payload.get('input') or []
+        if isinstance(texts, str):
+            texts = [texts]
+        self._count('embedding_requests')
+        self._count('embedding_items', len(texts))
+        time.sleep((self.server.embed_latency_ms + self.server.embed_item_ms * len(texts)) / 1000)
+        vectors = self.server.embedder.embed(texts, payload.get('dimensions'))
+        as_base64 = payload.get('encoding_format') == 'base64'
+        data = []
+        for i, vec in enumerate(vectors):
+            emb = base64.b64encode(vec.astype('<f4').tobytes()).decode('ascii') if as_base64 else vec.tolist()
+            data.append({'object': 'embedding', 'index': i, 'embedding': emb})
+        tokens = sum(max(1, len(t) // 2) for t in texts)
+        self._json(200, {'object': 'list', 'data': data, 'model': deployment,
+                         'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}})
+
+    def _chat(self, deployment, payload):
+        self._count('chat_requests')
+        prompt = ''.join(m.get('content') or '' for m in payload.get('messages', []))
+        content = fake_summary(prompt)
+        usage = {'prompt_tokens': max(1, len(prompt) // 2), 'completion_tokens': max(1, len(content) // 2)}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        base = {'id': 'chatcmpl-fake', 'created': int(time.time()), 'model': deployment}
+        if not payload.get('stream'):
+            time.sleep(self.server.chat_latency_ms / 1000)
+            return self._json(200, dict(base, object='chat.completion', usage=usage, choices=[
+                {'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}]))
+        # 스트리밍: 연결 종료로 본문 끝을 알림(chunked 인코딩 없이)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        pieces = re.findall(r'\S+\s*', content)
+        delay = self.server.chat_latency_ms / 1000 / max(1, len(pieces))
+
+        def event(obj):
+            self.wfile.write(f"data: {json.dumps(obj, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        for piece in pieces:
+            time.sleep(delay)
+            event(dict(base, object='chat.completion.chunk',
+                       choices=[{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]))
+        event(dict(base, object='chat.completion.chunk', choices=[{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]))
+        if (payload.get('stream_options') or {}).get('include_usage'):
+            event(dict(base, object='chat.completion.chunk', choices=[], usage=usage))
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
+
+    # ----- Azure Blob Storage -----
+    def _blob_error(self, status, code):
+        body = f'<?xml version="1.0" encoding="utf-8"?><Error><Code>{code}</Code><Message>{code}</Message></Error>'
+        self._send(status, body.encode('utf-8'), {'x-ms-error-code': code}, content_type='application/xml')
+
+    def _blob_paths(self, container, blob):
+        root = self.server.blob_root
+        name = quote(blob, safe='')
+        return (root / container / name, root / '.props' / container / f'{name}.json',
+                root / '.blocks' / container / name)
+
+    def _props_headers(self, data_path, props_path):
+        st = data_path.stat()
+        try:
+            props = json.loads(props_path.read_text(encoding='utf-8'))
+        except (FileNotFoundError, ValueError):
+            props = {}
+        return st.st_size, {
+            'ETag': f'"0x{st.st_mtime_ns:X}{st.st_size:X}"',
+            'Last-Modified': _http_date(st.st_mtime),
+            'x-ms-blob-type': 'BlockBlob',
+            'x-ms-creation-time': _http_date(props.get('created', st.st_mtime)),
+            'Accept-Ranges': 'bytes',
+        }, props.get('content_type') or 'application/octet-stream'
+
+    def _list_blobs(self, container, query):
+        """List Blobs(이름순, prefix/marker/maxresults 페이지 지원)"""
+        prefix = (query.get('prefix') or [''])[0]
+        marker = (query.get('marker') or [''])[0]
+        max_results = int((query.get('maxresults') or ['5000'])[0])
+        root = self.server.blob_root / container
+        names = sorted(unquote(p.name) for p in root.iterdir()
+                       if p.is_file() and '.tmp.' not in p.name) if root.is_dir() else []
+        names = [n for n in names if n.startswith(prefix) and n > marker] if marker else \
+            [n for n in names if n.startswith(prefix)]
+        page, rest = names[:max_results], names[max_results:]
+        items = []
+        for name in page:
+            data_path, props_path, _ = self._blob_paths(container, name)
+            try:
+                size, headers, content_type = self._props_headers(data_path, props_path)
+            except FileNotFoundError:
+                continue
+            items.append(
+                f'<Blob><Name>{escape(name)}</Name><Properties>'
+                f'<Creation-Time>{headers["x-ms-creation-time"]}</Creation-Time>'
+                f'<Last-Modified>{headers["Last-Modified"]}</Last-Modified><Etag>{headers["ETag"]}</Etag>'
+                f'<Content-Length>{size}</Content-Length><Content-Type>{escape(content_type)}</Content-Type>'
+                f'<BlobType>BlockBlob</BlobType></Properties></Blob>')
+        next_marker = escape(page[-1]) if rest else ''
+        body = (f'<?xml version="1.0" encoding="utf-8"?><EnumerationResults ServiceEndpoint="{self.server_url}/" '
+                f'ContainerName="{escape(container)}"><Prefix>{escape(prefix)}</Prefix><Marker>{escape(marker)}</Marker>'
+                f'<MaxResults>{max_results}</MaxResults><Blobs>{"".join(items)}</Blobs>'
+                f'<NextMarker>{next_marker}</NextMarker></EnumerationResults>')
+        return self._send(200, body.encode('utf-8'), content_type='application/xml')
+
+    @property
+    def server_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/{BLOB_ACCOUNT}'
+
+    def _blob(self, method, path, query):
+        parts = path.strip('/').split('/', 2)
+        if len(parts) < 2 or parts[0] != BLOB_ACCOUNT:
+            return self._blob_error(400, 'InvalidUri')
+        self._count(f'blob_{method.lower()}')
+        container = parts[1]
+        if len(parts) == 2 and method == 'GET' and (query.get('comp') or [''])[0] == 'list':
+            return self._list_blobs(container, query)
+        if len(parts) == 2:
+            # 컨테이너 생성/조회: 디렉터리만 만듦
+            (self.server.blob_root / container).mkdir(parents=True, exist_ok=True)
+            self._body()
+            return self._send(201 if method == 'PUT' else 200, b'', content_type=None)
+        data_path, props_path, blocks_dir = self._blob_paths(container, parts[2])
+        comp = (query.get('comp') or [''])[0]
+        if method == 'PUT' and comp == 'block':
+            block_id = (query.get('blockid') or [''])[0]
+            blocks_dir.mkdir(parents=True, exist_ok=True)
+            data = self._body()
+            (blocks_dir / hashlib.sha1(block_id.encode('ascii')).hexdigest()).write_bytes(data)
+            self._count('blob_block_bytes', len(data))
+            return self._send(201, b'', {'Content-MD5': base64.b64encode(hashlib.md5(data).digest()).decode()},
+                              content_type=None)
+        if method == 'PUT':
+            body = self._body()
+            if self.headers.get('If-None-Match') == '*' and data_path.exists():
+                return self._blob_error(409, 'BlobAlreadyExists')
+            data_path.parent.mkdir(parents=True, exist_ok=True)
+            props_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = data_path.with_name(data_path.name + f'.tmp.{threading.get_ident()}')
+            if comp == 'blocklist':
+                ids = re.findall(r'<(?:Latest|Committed|Uncommitted)>([^<]*)</', body.decode('utf-8'))
+                with open(tmp, 'wb') as out:
+                    for block_id in ids:
+                        with open(blocks_dir / hashlib.sha1(block_id.encode('ascii')).hexdigest(), 'rb') as f:
+                            shutil.copyfileobj(f, out, 1024 * 1024)
+                shutil.rmtree(blocks_dir, ignore_errors=True)
+                content_type = self.headers.get('x-ms-blob-content-type')
+            else:
+                tmp.write_bytes(body)
+                content_type = self.headers.get('x-ms-blob-content-type') or self.headers.get('Content-Type')
+            os.replace(tmp, data_path)
+            props_path.write_text(json.dumps({'content_type': content_type, 'created': time.time()}), encoding='utf-8')
+            _, headers, _ = self._props_headers(data_path, props_path)
+            return self._send(201, b'', {k: headers[k] for k in ('ETag', 'Last-Modified')}, content_type=None)
+        if not data_path.exists():
+            return self._blob_error(404, 'BlobNotFound')
+        if method == 'DELETE':
+            data_path.unlink()
+            props_path.unlink(missing_ok=True)
+            return self._send(202, b'', content_type=None)
+        size, headers, content_type = self._props_headers(data_path, props_path)
+        if_match = self.headers.get('If-Match')
+        if if_match and if_match not in ('*', headers['ETag']):
+            return self._blob_error(412, 'ConditionNotMet')
+        if method == 'HEAD':
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(size))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            return
+        start, end, status = 0, size - 1, 200
+        range_header = self.headers.get('x-ms-range') or self.headers.get('Range')
+        if range_header:
+            m = re.match(r'bytes=(\d+)-(\d*)', range_header)
+            start = int(m.group(1))
+            end = min(int(m.group(2)) if m.group(2) else size - 1, size - 1)
+            if start >= size:
+                return self._send(416, b'', {'Content-Range': f'bytes */{size}', 'x-ms-error-code': 'InvalidRange'},
+                                  content_type=None)
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        length = end - start + 1
+        self._count('blob_read_bytes', length)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(length))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        with open(data_path, 'rb') as f:
+            f.seek(start)
+            remaining = length
+            while remaining > 0:
+                chunk = f.read(min(remaining, 1024 * 1024))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+
+class FakeAzure:
+    """대체 서버를 백그라운드 스레드로 실행"""
+
+    def __init__(self, blob_root, host='127.0.0.1', port=0, dim=FAKE_EMBED_DIM,
+                 embed_latency_ms=FAKE_EMBED_LATENCY_MS, embed_item_ms=FAKE_EMBED_ITEM_MS,
+                 chat_latency_ms=FAKE_CHAT_LATENCY_MS):
+        self.server = ThreadingHTTPServer((host, port), FakeAzureHandler)
+        self.server.daemon_threads = True
+        self.server.blob_root = Path(blob_root)
+        self.server.blob_root.mkdir(parents=True, exist_ok=True)
+        self.server.embedder = FakeEmbedder(dim)
+        self.server.embed_latency_ms = embed_latency_ms
+        self.server.embed_item_ms = embed_item_ms
+        self.server.chat_latency_ms = chat_latency_ms
+        self.server.stats = {}
+        self.server.stats_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-azure', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def env(self, container='bench', embed_model='fake-embedding', chat_model='fake-gpt'):
+        """app.py/ingest.py가 이 서버를 쓰도록 하는 환경변수"""
+        return {
+            'OPENAI_API_BASE': self.url,
+            'OPENAI_API_KEY': 'fake-key',
+            'OPENAI_API_VERSION': '2024-02-01',
+            'EMBED_MODEL': embed_model,
+            'EMBED_DEPLOYMENT': embed_model,
+            'GPT_DEPLOYMENT': chat_model,
+            'AZURE_STORAGE_CONNECTION_STRING': (
+                f'DefaultEndpointsProtocol=http;AccountName={BLOB_ACCOUNT};AccountKey={BLOB_ACCOUNT_KEY};'
+                f'BlobEndpoint={self.url}/{BLOB_ACCOUNT};'),
+            'AZURE_STORAGE_CONTAINER': container,
+            'AZURE_SEARCH_ENDPOINT': self.url,
+            'AZURE_SEARCH_API_KEY': 'fake-key',
+            'AZURE_SEARCH_INDEX': 'bench',
+        }
+
+    def stats(self):
+        with self.server.stats_lock:
+            return dict(self.server.stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Azure OpenAI / Blob / Search 대체 서버')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--root', default='fake_blob', help='blob 저장 디렉터리')
+    parser.add_argument('--dim', type=int, default=FAKE_EMBED_DIM, help='임베딩 차원')
+    parser.add_argument('--embed-latency-ms', type=float, default=FAKE_EMBED_LATENCY_MS)
+    parser.add_argument('--chat-latency-ms', type=float, default=FAKE_CHAT_LATENCY_MS)
+    args = parser.parse_args()
+    fake = FakeAzure(args.root, args.host, args.port, dim=args.dim, embed_latency_ms=args.embed_latency_ms,
+                     chat_latency_ms=args.chat_latency_ms)
+    print(f"[fake_azure] {fake.url} 실행 중 (blob: {Path(args.root).resolve()})")
+    for k, v in fake.env().items():
+        print(f"{k}={v}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+"""
+FAISS 인덱스 생성/검색 파라미터
+
+INDEX_MODE로 인덱스 종류 선택(ingest.py 재생성, 업로드 시 첫 인덱스 생성에 사용)
+- flat  : IndexFlatL2 (정확 검색, 기본값)
+- hnsw  : IndexHNSWFlat (그래프 기반 근사 검색, 학습 불필요)
+- ivf   : IVF-Flat (클러스터 nprobe개만 탐색)
+- ivfpq : IVF-PQ (벡터를 PQ 코드로 압축)
+- opq   : OPQ 회전 + IVF-PQ
+- sqfp16: 스칼라 양자화 float16 (벡터당 2바이트/차원, 정확도 손실 거의 없음)
+- sq8   : 스칼라 양자화 int8 (벡터당 1바이트/차원)
+
+벡터 수가 학습에 부족하면(IVF 계열) flat으로 대체. 검색 시 nprobe/efSearch는 요청별로 지정 가능
+(SearchParameters 사용 → 공유 인덱스 객체를 변경하지 않아 동시 검색에 안전).
+
+INDEX_METRIC=ip면 벡터를 L2 정규화해 내적(=코사인) 점수로 검색, 기본 l2는 기존과 동일.
+양자화 인덱스는 원본 float32 벡터(memmap)로 상위 후보를 다시 채점(rerank)할 수 있음.
+
+삭제된 문서의 벡터 행은 RowFilter(IDSelectorBitmap)로 검색 단계에서 제외하고,
+rebuild_without()으로 남은 행만 같은 구조(학습된 양자화기 재사용)의 새 인덱스로 옮겨 압축.
+메타데이터 필터도 같은 RowFilter로 검색 단계에서 적용. 선택 비율이 낮으면 nprobe/efSearch를 넓혀 재현율을 유지하고,
+선택된 행이 FILTER_EXACT_ROWS 이하이면 ANN 탐색 없이 그 행만 정확히 채점.
+"""
+import math
+import os
+
+import faiss
+import numpy as np
+
+INDEX_MODE = os.getenv('INDEX_MODE', 'flat').lower()
+INDEX_MODES = ('flat', 'hnsw', 'ivf', 'ivfpq', 'opq', 'sqfp16', 'sq8')
+INDEX_METRIC = os.getenv('INDEX_METRIC', 'l2').lower()
+# 1이면 원본 float32 벡터를 별도 파일로 보관해 검색 후보를 정확한 점수로 재정렬
+INDEX_RERANK = os.getenv('INDEX_RERANK', '0') == '1'
+INDEX_RERANK_FACTOR = int(os.getenv('INDEX_RERANK_FACTOR', '4'))
+HNSW_M = int(os.getenv('HNSW_M', '32'))
+HNSW_EF_CONSTRUCTION = int(os.getenv('HNSW_EF_CONSTRUCTION', '200'))
+HNSW_EF_SEARCH = int(os.getenv('HNSW_EF_SEARCH', '64'))
+IVF_NLIST = int(os.getenv('IVF_NLIST', '0'))  # 0이면 4*sqrt(N) 자동
+IVF_NPROBE = int(os.getenv('IVF_NPROBE', '16'))
+PQ_M = int(os.getenv('PQ_M', '0'))  # 0이면 차원/16 자동(차원의 약수)
+PQ_NBITS = int(os.getenv('PQ_NBITS', '8'))
+INDEX_TRAIN_SAMPLE = int(os.getenv('INDEX_TRAIN_SAMPLE', '100000'))
+# 필터 선택 비율이 낮을 때 efSearch 확장 상한, 원본 벡터로 직접 채점할 선택 행 수 상한
+FILTER_MAX_EF_SEARCH = int(os.getenv('FILTER_MAX_EF_SEARCH', '1024'))
+FILTER_EXACT_ROWS = int(os.getenv('FILTER_EXACT_ROWS', '4096'))
+# IVF 학습에 필요한 클러스터당 최소 벡터 수
+IVF_MIN_POINTS_PER_LIST = 39
+
+
+def auto_nlist(n):
+    return max(1, min(65536, int(4 * math.sqrt(max(n, 1)))))
+
+
+def auto_pq_m(d):
+    m = PQ_M or max(1, d // 16)
+    # PQ 서브벡터 수는 차원의 약수여야 함
+    while d % m:
+        m -= 1
+    return m
+
+
+def factory_string(mode, d, n):
+    """모드 → faiss.index_factory 문자열(학습 데이터가 부족하면 None = flat 대체)"""
+    if mode not in INDEX_MODES:
+        raise ValueError(f'알 수 없는 INDEX_MODE: {mode} (지원: {", ".join(INDEX_MODES)})')
+    if mode == 'flat':
+        return 'Flat'
+    if mode == 'hnsw':
+        return f'HNSW{HNSW_M},Flat'
+    if mode == 'sqfp16':
+        return 'SQfp16'
+    if mode == 'sq8':
+        return 'SQ8'
+    nlist = IVF_NLIST or auto_nlist(n)
+    if n < nlist * IVF_MIN_POINTS_PER_LIST:
+        nlist = max(1, n // IVF_MIN_POINTS_PER_LIST)
+    if nlist < 2:
+        return None
+    if mode == 'ivf':
+        return f'IVF{nlist},Flat'
+    m = auto_pq_m(d)
+    if n < (1 << PQ_NBITS):
+        return None
+    if mode == 'ivfpq':
+        return f'IVF{nlist},PQ{m}x{PQ_NBITS}'
+    return f'OPQ{m},IVF{nlist},PQ{m}x{PQ_NBITS}'
+
+
+def _apply_defaults(index):
+    ivf = _find_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(IVF_NPROBE, ivf.nlist)
+        # 청크 벡터 재구성(reconstruct) 지원용 id → 위치 맵
+        ivf.make_direct_map()
+    hnsw = _find_hnsw(index)
+    if hnsw is not None:
+        hnsw.hnsw.efSearch = HNSW_EF_SEARCH
+
+
+def metric_type(name=None):
+    name = (name or INDEX_METRIC).lower()
+    if name in ('ip', 'cosine'):
+        return faiss.METRIC_INNER_PRODUCT
+    if name == 'l2':
+        return faiss.METRIC_L2
+    raise ValueError(f'알 수 없는 INDEX_METRIC: {name} (지원: l2, ip)')
+
+
+def is_inner_product(index):
+    return index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+
+def prepare_vectors(vectors, metric=faiss.METRIC_L2):
+    """float32 연속 배열 사본(내적 인덱스면 L2 정규화). 호출자의 배열(캐시된 질의 벡터 등)은 변경하지 않음"""
+    vectors = np.array(vectors, dtype=np.float32, order='C', copy=True)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    if metric == faiss.METRIC_INNER_PRODUCT:
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def prepare_for(index, vectors):
+    return prepare_vectors(vectors, index.metric_type)
+
+
+def similarity(index, score):
+    """검색 점수 → 유사도(내적 인덱스는 코사인 그대로, L2는 1/(1+거리))"""
+    if is_inner_product(index):
+        return float(score)
+    return 1 / (1 + float(score))
+
+
+def build_index(vectors, mode=None, metric=None):
+    """벡터로 인덱스 생성(필요 시 샘플 학습) 후 전체 추가"""
+    mode = (mode or INDEX_MODE).lower()
+    metric = metric_type() if metric is None else metric
+    vectors = prepare_vectors(vectors, metric)
+    n, d = vectors.shape
+    spec = factory_string(mode, d, n)
+    if spec is None:
+        print(f"[index_factory] 벡터 {n}개로는 '{mode}' 학습 불가 → Flat 사용")
+        spec = 'Flat'
+    index = faiss.index_factory(d, spec, metric)
+    if mode == 'hnsw' and _find_hnsw(index) is not None:
+        _find_hnsw(index).hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        sample = vectors
+        if n > INDEX_TRAIN_SAMPLE:
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(n, INDEX_TRAIN_SAMPLE, replace=False)]
+        index.train(sample)
+    _apply_defaults(index)
+    index.add(vectors)
+    return index
+
+
+def _find_ivf(index):
+    try:
+        return faiss.extract_index_ivf(index)
+    except (RuntimeError, TypeError):
+        return None
+
+
+def _find_hnsw(index):
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexPreTransform):
+        index = faiss.downcast_index(index.index)
+    return index if isinstance(index, faiss.IndexHNSW) else None
+
+
+class RowFilter:
+    """검색에서 제외할 벡터 행(삭제 문서/필터 불일치 문서의 청크) → IDSelectorBitmap. 비트맵 배열은 이 객체가 보관"""
+
+    def __init__(self, live_mask):
+        live_mask = np.asarray(live_mask, dtype=bool)
+        self.ntotal = len(live_mask)
+        self.selected = int(live_mask.sum())
+        self.excluded = self.ntotal - self.selected
+        self._bits = np.packbits(live_mask, bitorder='little')
+        self.selector = faiss.IDSelectorBitmap(self.ntotal, faiss.swig_ptr(self._bits))
+        self.live_mask = live_mask
+        # 선택된 행이 적으면 행 번호를 미리 구해 둠(직접 채점용)
+        self.rows = np.flatnonzero(live_mask) if self.selected <= FILTER_EXACT_ROWS else None
+
+
+def widen_for_filter(index, nprobe, ef_search, row_filter):
+    """
+    선택 비율이 절반 미만인 필터: IVF nprobe는 1/비율배(선택되지 않은 행은 거리 계산 없이 비트 확인만 하므로
+    거리 계산 수는 필터 없을 때와 비슷), HNSW efSearch는 1/sqrt(비율)배(그래프 탐색 비용이 커서 재현율과 절충)
+    """
+    ratio = row_filter.selected / max(1, row_filter.ntotal)
+    if ratio >= 0.5 or ratio <= 0:
+        return nprobe, ef_search
+    ivf = _find_ivf(index)
+    if ivf is not None:
+        nprobe = min(ivf.nlist, math.ceil((nprobe or ivf.nprobe) / ratio))
+    hnsw = _find_hnsw(index)
+    if hnsw is not None:
+        base = ef_search or hnsw.hnsw.efSearch
+        ef_search = min(max(base, FILTER_MAX_EF_SEARCH), math.ceil(base / math.sqrt(ratio)))
+    return nprobe, ef_search
+
+
+def search_params(index, nprobe=None, ef_search=None, sel=None):
+    """요청별 nprobe/efSearch/IDSelector → SearchParameters(지정할 것이 없으면 None)"""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexPreTransform):
+        inner = search_params(index.index, nprobe, ef_search, sel)
+        return faiss.SearchParametersPreTransform(index_params=inner) if inner is not None else None
+    if isinstance(index, faiss.IndexIVF):
+        if not nprobe and sel is None:
+            return None
+        # SearchParametersIVF의 기본 nprobe는 1이므로 인덱스 값을 명시
+        params = faiss.SearchParametersIVF(nprobe=int(nprobe or index.nprobe))
+    elif isinstance(index, faiss.IndexHNSW):
+        if not ef_search and sel is None:
+            return None
+        params = faiss.SearchParametersHNSW(efSearch=int(ef_search or index.hnsw.efSearch))
+    elif sel is not None:
+        params = faiss.SearchParameters()
+    else:
+        return None
+    if sel is not None:
+        params.sel = sel
+    return params
+
+
+def rerank(index, query, I, vectors, k):
+    """후보 id(I)를 원본 벡터로 정확히 다시 채점해 질의별 상위 k개 반환(query는 prepare_for 적용된 (n, d))"""
+    nq = len(query)
+    D = np.full((nq, k), -np.inf if is_inner_product(index) else np.inf, dtype=np.float32)
+    out = np.full((nq, k), -1, dtype=np.int64)
+    for row in range(nq):
+        ids = I[row][I[row] >= 0]
+        if len(ids) == 0:
+            continue
+        # memmap에서 후보 행만 읽음(정렬된 순서로 읽어야 디스크 접근이 순차적)
+        ids = np.sort(ids)
+        cand = np.asarray(vectors[ids], dtype=np.float32)
+        if is_inner_product(index):
+            scores = cand @ query[row]
+            top = np.argsort(-scores)[:k]
+        else:
+            scores = ((cand - query[row]) ** 2).sum(axis=1)
+            top = np.argsort(scores)[:k]
+        D[row, :len(top)] = scores[top]
+        out[row, :len(top)] = ids[top]
+    return D, out
+
+
+def _search_rows(index, query, rows, vectors, k):
+    """
+    선택된 행(rows, 오름차순)만 정확히 채점(query는 prepare_for 적용된 (n, d)). 원본 벡터가 없으면 인덱스에 저장된 값을
+    복원(flat/HNSW/SQ). IVF·변환 인덱스는 복원에 direct map이 필요하므로 None → ANN 검색으로 처리
+    """
+    if vectors is not None:
+        cand = np.asarray(vectors[rows], dtype=np.float32)
+    elif _find_ivf(index) is None and not isinstance(faiss.downcast_index(index), faiss.IndexPreTransform):
+        try:
+            cand = index.reconstruct_batch(rows)
+        except RuntimeError:
+            return None
+    else:
+        return None
+    nq = len(query)
+    D = np.full((nq, k), -np.inf if is_inner_product(index) else np.inf, dtype=np.float32)
+    out = np.full((nq, k), -1, dtype=np.int64)
+    if is_inner_product(index):
+        scores = -(query @ cand.T)
+    else:
+        scores = (query ** 2).sum(axis=1)[:, None] - 2 * (query @ cand.T) + (cand ** 2).sum(axis=1)[None, :]
+    n = min(k, len(rows))
+    if not n:
+        return D, out
+    top = np.argpartition(scores, n - 1, axis=1)[:, :n] if n < len(rows) else np.tile(np.arange(n), (nq, 1))
+    top = np.take_along_axis(top, np.argsort(np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+    picked = np.take_along_axis(scores, top, axis=1)
+    D[:, :n] = -picked if is_inner_product(index) else picked
+    out[:, :n] = rows[top]
+    return D, out
+
+
+def _search_excluding(index, query, fetch_k, nprobe, ef_search, row_filter):
+    """IDSelector를 지원하지 않는 인덱스/버전: 제외 행 수만큼 더 찾은 뒤 걸러냄"""
+    params = search_params(index, nprobe, ef_search)
+    wider = min(fetch_k + row_filter.excluded, max(fetch_k, index.ntotal))
+    D, I = index.search(query, wider, params=params) if params is not None else index.search(query, wider)
+    live = (I >= 0) & row_filter.live_mask[np.clip(I, 0, row_filter.ntotal - 1)]
+    out_D = np.full((len(I), fetch_k), D.dtype.type(0), dtype=D.dtype)
+    out_I = np.full((len(I), fetch_k), -1, dtype=np.int64)
+    for row in range(len(I)):
+        keep = np.flatnonzero(live[row])[:fetch_k]
+        out_D[row, :len(keep)] = D[row, keep]
+        out_I[row, :len(keep)] = I[row, keep]
+    return out_D, out_I
+
+
+def search(index, query, k, nprobe=None, ef_search=None, vectors=None, rerank_factor=INDEX_RERANK_FACTOR,
+           row_filter=None):
+    """
+    질의 검색(query: (n, d), 여러 질의는 행렬 검색 1회). vectors(원본 float32, 행 = 인덱스 id)를 주면
+    k×rerank_factor 후보를 정확한 점수로 재정렬. row_filter(RowFilter)의 제외 행은 결과에 나오지 않음.
+    내적 인덱스면 질의를 정규화(원본 배열은 그대로 둠)
+    """
+    query = prepare_for(index, query)
+    if row_filter is not None and not row_filter.excluded:
+        row_filter = None
+    if row_filter is not None and row_filter.rows is not None:
+        # 선택된 행이 적으면 ANN 탐색 없이 그 행만 정확히 채점
+        found = _search_rows(index, query, row_filter.rows, vectors, k)
+        if found is not None:
+            return found
+    fetch_k = k
+    if vectors is not None and rerank_factor > 1:
+        fetch_k = min(k * rerank_factor, max(k, index.ntotal))
+    if row_filter is not None:
+        nprobe, ef_search = widen_for_filter(index, nprobe, ef_search, row_filter)
+    params = search_params(index, nprobe, ef_search, row_filter.selector if row_filter is not None else None)
+    try:
+        if params is None:
+            D, I = index.search(query, fetch_k)
+        else:
+            D, I = index.search(query, fetch_k, params=params)
+    except RuntimeError:
+        if row_filter is None:
+            raise
+        D, I = _search_excluding(index, query, fetch_k, nprobe, ef_search, row_filter)
+    if fetch_k > k:
+        return rerank(index, query, I, vectors, k)
+    return D, I
+
+
+def reconstruct_rows(index, rows, batch_size=65536):
+    """인덱스에 저장된 벡터(양자화 인덱스는 근사값) 중 rows 행(오름차순)만 (len(rows), d) float32로 복원"""
+    rows = np.asarray(rows, dtype=np.int64)
+    ivf = _find_ivf(index)
+    if ivf is not None:
+        # IVF 계열은 id → 위치 맵이 있어야 reconstruct 가능
+        ivf.make_direct_map()
+    out = np.empty((len(rows), index.d), dtype=np.float32)
+    pos = 0
+    for start in range(0, index.ntotal, batch_size):
+        end = min(start + batch_size, index.ntotal)
+        picked = rows[(rows >= start) & (rows < end)]
+        if not len(picked):
+            continue
+        block = index.reconstruct_n(start, end - start)
+        out[pos:pos + len(picked)] = block[picked - start]
+        pos += len(picked)
+    return out
+
+
+def rebuild_without(index, keep_rows, vectors=None):
+    """
+    keep_rows 행만 남긴 새 인덱스(행 번호는 0부터 다시 매김). 같은 종류/파라미터로 복제 후 reset →
+    IVF 중심점/PQ·OPQ 학습 결과는 그대로 재사용(재학습 없음).
+    vectors: 원본 float32 벡터(prepare_for 적용된 값, 있으면 인덱스 복원값 대신 사용)
+    """
+    keep_rows = np.asarray(keep_rows, dtype=np.int64)
+    new_index = faiss.clone_index(index)
+    new_index.reset()
+    if vectors is not None:
+        live = np.ascontiguousarray(vectors[keep_rows], dtype=np.float32)
+    else:
+        live = reconstruct_rows(index, keep_rows)
+    if len(live):
+        new_index.add(live)
+    return new_index
+
+
+def describe(index):
+    """인덱스 종류 문자열(상태 확인용)"""
+    index = faiss.downcast_index(index)
+    name = type(index).__name__
+    if isinstance(index, faiss.IndexPreTransform):
+        name += '+' + type(faiss.downcast_index(index.index)).__name__
+    ivf = _find_ivf(index)
+    if ivf is not None:
+        name += f'(nlist={ivf.nlist}, nprobe={ivf.nprobe})'
+    hnsw = _find_hnsw(index)
+    if hnsw is not None:
+        name += f'(efSearch={hnsw.hnsw.efSearch})'
+    if is_inner_product(index):
+        name += '[IP]'
+    return name
@@ -0,0 +1,140 @@
+"""
+인덱스 모드별 recall@k / 지연시간 / 메모리 비교 리포트
+
+사용 예)
+  python index_report.py --synthetic 200000 --dim 3072          # 합성 벡터로 비교
+  python index_report.py --from-index                           # 현재 faiss_index.bin 벡터로 비교
+  python index_report.py --vectors vecs.npy --modes flat,hnsw,ivf --nprobe 8,16,32 --ef 32,64,128 --out report.json
+  python index_report.py --vectors vecs.npy --modes flat,sqfp16,sq8 --metric ip --dims 3072,1024,512 --rerank 4
+
+기준(정답)은 원본 차원 float32 벡터로 만든 IndexFlatL2(현재 운영 방식)의 top-k 결과.
+--dims는 text-embedding-3의 dimensions 축소를 앞쪽 차원 자르기 + 재정규화로 재현(모델 동작과 동일)
+--rerank N이면 후보 k×N개를 원본 float32 벡터로 다시 채점(원본 벡터는 디스크 memmap이라 메모리 수치에서 제외)
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+import index_factory
+from index_store import FAISS_INDEX_PATH
+
+
+def load_vectors(args):
+    if args.vectors:
+        return np.load(args.vectors).astype(np.float32)
+    if args.from_index:
+        index = faiss.read_index(str(FAISS_INDEX_PATH))
+        return index.reconstruct_n(0, index.ntotal)
+    # 군집 구조가 있는 합성 벡터(실제 임베딩과 비슷하게 균일 분포는 피함)
+    rng = np.random.default_rng(args.seed)
+    n_clusters = max(1, args.synthetic // 500)
+    centers = rng.standard_normal((n_clusters, args.dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, args.synthetic)
+    return centers[labels] + 0.3 * rng.standard_normal((args.synthetic, args.dim)).astype(np.float32)
+
+
+def make_queries(vectors, nq, seed):
+    rng = np.random.default_rng(seed + 1)
+    picks = rng.choice(len(vectors), min(nq, len(vectors)), replace=False)
+    noise = 0.05 * rng.standard_normal((len(picks), vectors.shape[1])).astype(np.float32)
+    return np.ascontiguousarray(vectors[picks] + noise)
+
+
+def shorten(vectors, dims):
+    """앞쪽 dims 차원만 남기고 L2 재정규화(text-embedding-3 dimensions 파라미터와 같은 결과)"""
+    if not dims or dims >= vectors.shape[1]:
+        return vectors
+    short = np.ascontiguousarray(vectors[:, :dims])
+    faiss.normalize_L2(short)
+    return short
+
+
+def recall_at_k(found, truth, k):
+    hits = sum(len(set(f[:k]) & set(t[:k])) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def measure(index, queries, k, truth, raw=None, rerank=0, **knobs):
+    """질의를 하나씩 검색(실서비스와 동일) → 지연 분포 + recall"""
+    latencies, found = [], []
+    for q in queries:
+        started = time.perf_counter()
+        _, I = index_factory.search(index, q.reshape(1, -1), k, vectors=raw if rerank > 1 else None,
+                                    rerank_factor=rerank, **knobs)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found.append(I[0])
+    latencies = np.array(latencies)
+    return {
+        'recall_at_k': round(recall_at_k(found, truth, k), 4),
+        'latency_ms_p50': round(float(np.percentile(latencies, 50)), 3),
+        'latency_ms_p95': round(float(np.percentile(latencies, 95)), 3),
+        'latency_ms_mean': round(float(latencies.mean()), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FAISS 인덱스 모드 비교(recall@k vs 지연시간)')
+    parser.add_argument('--vectors', help='벡터 .npy 파일')
+    parser.add_argument('--from-index', action='store_true', help='현재 faiss_index.bin의 벡터 사용(flat 인덱스)')
+    parser.add_argument('--synthetic', type=int, default=50000, help='합성 벡터 수')
+    parser.add_argument('--dim', type=int, default=3072, help='합성 벡터 차원')
+    parser.add_argument('--modes', default=','.join(index_factory.INDEX_MODES))
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--nprobe', default='4,16,64', help='IVF 계열 nprobe 목록')
+    parser.add_argument('--ef', default='32,64,128', help='HNSW efSearch 목록')
+    parser.add_argument('--metric', default='l2', help='l2 또는 ip(정규화 + 내적)')
+    parser.add_argument('--dims', default='0', help='축소 차원 목록(0 = 원본 차원)')
+    parser.add_argument('--rerank', type=int, default=0, help='원본 벡터 재정렬 후보 배수(0 = 사용 안 함)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='결과 JSON 저장 경로')
+    args = parser.parse_args()
+
+    vectors = load_vectors(args)
+    n, d = vectors.shape
+    queries = make_queries(vectors, args.queries, args.seed)
+    k = min(args.k, n)
+    print(f"[index_report] 벡터 {n}개 x {d}차원, 질의 {len(queries)}개, k={k}")
+
+    flat = faiss.IndexFlatL2(d)
+    flat.add(vectors)
+    _, truth = flat.search(queries, k)
+
+    metric = index_factory.metric_type(args.metric)
+    rows = []
+    for dims in [int(v) for v in args.dims.split(',')]:
+        base = shorten(vectors, dims)
+        base_queries = shorten(queries, dims)
+        for mode in [m.strip() for m in args.modes.split(',') if m.strip()]:
+            started = time.perf_counter()
+            index = index_factory.build_index(base, mode, metric)
+            build_sec = time.perf_counter() - started
+            bytes_per_vector = len(faiss.serialize_index(index)) / n
+            raw = index_factory.prepare_for(index, base) if args.rerank > 1 else None
+            if index_factory._find_ivf(index) is not None:
+                sweeps = [{'nprobe': int(v)} for v in args.nprobe.split(',')]
+            elif mode == 'hnsw':
+                sweeps = [{'ef_search': int(v)} for v in args.ef.split(',')]
+            else:
+                sweeps = [{}]
+            for knobs in sweeps:
+                row = {'mode': mode, 'dims': base.shape[1], 'metric': args.metric, 'rerank': args.rerank,
+                       'index': index_factory.describe(index), 'params': knobs,
+                       'build_sec': round(build_sec, 2), 'bytes_per_vector': round(bytes_per_vector, 1)}
+                row.update(measure(index, base_queries, k, truth, raw=raw, rerank=args.rerank, **knobs))
+                rows.append(row)
+                print(f"{mode:6s} d={base.shape[1]:<5d} {json.dumps(knobs):22s} recall@{k}={row['recall_at_k']:.3f} "
+                      f"p50={row['latency_ms_p50']:.2f}ms p95={row['latency_ms_p95']:.2f}ms "
+                      f"{row['bytes_per_vector']:.0f}B/vec build={row['build_sec']}s")
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'n': n, 'dim': d, 'k': k, 'queries': len(queries), 'results': rows}, f, ensure_ascii=False, indent=2)
+        print(f"[index_report] 저장: {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,418 @@
+"""
+FAISS 인덱스 / 문서 메타데이터 상주 관리
+
+- 워커 기동 시 한 번만 faiss_index.bin, 메타데이터(meta.db의 작은 필드만, 본문 제외)를 읽어 메모리에 유지
+- 버전 스탬프(faiss_index.version) 또는 파일 mtime이 바뀌면 새 스냅샷을 읽어 원자적으로 교체
+- 쓰기 측(app.py 업로드, ingest.py)은 publish_index()로 임시파일 저장 → 메타 트랜잭션 커밋 → rename → 스탬프 갱신
+- 스탬프의 meta_count가 현재 인덱스에 대응하는 문서 수(그 이후 doc_id는 publish 전 잔여분이므로 무시/교체)
+- 인덱스 벡터는 청크 단위, chunk_map(faiss_index.chunks.npy)의 행 i = [문서 번호, chunk_id, start, end]
+- INDEX_RERANK=1이면 원본 float32 벡터(faiss_index.vectors.npy)를 함께 저장, 읽는 쪽은 memmap으로 열어 재정렬에 사용
+- 읽는 쪽(IndexHolder)은 인덱스/chunk_map을 메모리 매핑(INDEX_MMAP=1)으로 열고 메타는 필요한 문서만 조회(MetaView)
+  → 여러 워커가 OS 페이지 캐시의 같은 페이지를 공유하고, 워커 기동 시간이 코퍼스 크기와 거의 무관.
+  publish는 항상 새 파일 rename이므로 기존 매핑은 그 스냅샷을 쓰는 동안 유효(다음 확인 때 새 파일을 다시 매핑)
+- 문서 번호(doc_id)는 고정: 덮어쓰기/삭제된 문서는 메타 저장소에 tombstone으로 남고, 그 청크 벡터는
+  검색 시 RowFilter로 제외. tombstone 벡터 비율이 INDEX_COMPACT_RATIO를 넘으면 compact_index()가
+  남은 벡터만으로 인덱스를 다시 만듦(벡터 행 번호만 바뀌고 doc_id는 그대로)
+"""
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+import metrics
+from chunking import legacy_chunk_map
+from index_factory import INDEX_RERANK, RowFilter, build_index, describe, prepare_for, rebuild_without
+from meta_store import get_meta_store
+
+BASE_DIR = Path(__file__).parent
+# 인덱스 파일 위치(기본은 코드와 같은 디렉터리, 벤치마크 등 별도 작업 디렉터리에서 실행할 때 지정)
+INDEX_DIR = Path(os.getenv('INDEX_DIR') or BASE_DIR)
+FAISS_INDEX_PATH = INDEX_DIR / 'faiss_index.bin'
+INDEX_VERSION_PATH = INDEX_DIR / 'faiss_index.version'
+CHUNK_MAP_PATH = INDEX_DIR / 'faiss_index.chunks.npy'
+VECTORS_PATH = INDEX_DIR / 'faiss_index.vectors.npy'
+# 인덱스 쓰기 락(업로드 인덱싱 워커, ingest.py 공통)
+INDEX_LOCK_PATH = INDEX_DIR / 'faiss_index.bin.lock'
+
+# 변경 감지(stat) 주기(초). 0이면 매 검색마다 확인
+INDEX_RELOAD_CHECK_SEC = float(os.getenv('INDEX_RELOAD_CHECK_SEC', '1.0'))
+# 삭제된 문서의 벡터 비율이 이 값 이상이면 압축(인덱스 재구성)
+INDEX_COMPACT_RATIO = float(os.getenv('INDEX_COMPACT_RATIO', '0.2'))
+# 1이면 검색용 인덱스를 메모리 매핑으로 읽음(워커 간 페이지 공유). 0이면 전체를 읽어 워커마다 복사본 유지
+INDEX_MMAP = os.getenv('INDEX_MMAP', '1') == '1'
+
+# deleted: 문서 번호별 삭제 여부(bool 배열), row_filter: 삭제 문서 청크를 제외하는 RowFilter(없으면 None)
+IndexSnapshot = namedtuple('IndexSnapshot', ['index', 'meta', 'chunk_map', 'vectors', 'generation', 'loaded_at',
+                                             'deleted', 'row_filter'])
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _atomic_write_bytes(path, data):
+    tmp_path = f'{path}.tmp.{os.getpid()}'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_version_stamp(version_path=INDEX_VERSION_PATH):
+    try:
+        with open(version_path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_version_stamp(version_path=INDEX_VERSION_PATH, **extra):
+    """새 generation 스탬프 기록(모든 워커가 같은 값을 보게 됨)"""
+    stamp = {
+        'generation': str(time.time_ns()),
+        'published_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'pid': os.getpid(),
+    }
+    stamp.update(extra)
+    _atomic_write_bytes(version_path, json.dumps(stamp, ensure_ascii=False).encode('utf-8'))
+    return stamp
+
+
+def read_index_mmap(index_path=FAISS_INDEX_PATH):
+    """
+    검색 전용으로 인덱스 열기. IO_FLAG_MMAP_IFC(faiss 1.11 이상)로 flat/SQ/HNSW/IVF의 벡터 데이터를 매핑.
+    매핑할 수 없는 형식이면 일반 읽기
+    """
+    if INDEX_MMAP:
+        try:
+            return faiss.read_index(str(index_path), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            print(f"[index_store] 메모리 매핑 읽기 실패(일반 읽기로 대체): {str(e).splitlines()[0]}")
+    return faiss.read_index(str(index_path))
+
+
+def load_chunk_map(ntotal, chunk_map_path=CHUNK_MAP_PATH, persist=False):
+    """
+    chunk_map 로드(읽기 전용 memmap, 없거나 인덱스와 크기가 다르면 문서 1개 = 벡터 1개인 기존 구조로 간주).
+    persist=True(검색 워커)면 없는 chunk_map을 한 번 저장해 다음 기동부터 memmap으로 열게 함
+    """
+    try:
+        chunk_map = np.load(chunk_map_path, mmap_mode='r')
+        if chunk_map.shape == (ntotal, 4):
+            return chunk_map
+        print(f"[index_store] chunk_map 크기 불일치({chunk_map.shape[0]} != {ntotal}), 문서 단위 매핑 사용")
+        return legacy_chunk_map(ntotal)
+    except FileNotFoundError:
+        pass
+    chunk_map = legacy_chunk_map(ntotal)
+    if persist:
+        _persist_legacy_chunk_map(chunk_map, chunk_map_path)
+    return chunk_map
+
+
+def _persist_legacy_chunk_map(chunk_map, chunk_map_path):
+    """쓰기 락을 바로 얻을 수 있을 때만 저장(그 사이 publish가 chunk_map을 썼으면 건너뜀)"""
+    from filelock import Timeout
+    try:
+        with index_write_lock(timeout=0):
+            if os.path.exists(chunk_map_path):
+                return
+            os.replace(_save_npy_atomic(chunk_map_path, chunk_map, np.int64), chunk_map_path)
+            print(f"[index_store] 기존 인덱스 chunk_map 저장: {chunk_map_path}")
+    except Timeout:
+        pass
+    except OSError as e:
+        print(f"[index_store] chunk_map 저장 실패(다음 publish 때 저장): {e}")
+
+
+def load_vectors(ntotal, vectors_path=VECTORS_PATH):
+    """재정렬용 원본 벡터(memmap, 없거나 인덱스와 개수가 다르면 None)"""
+    try:
+        vectors = np.load(vectors_path, mmap_mode='r')
+    except FileNotFoundError:
+        return None
+    if vectors.ndim != 2 or vectors.shape[0] != ntotal:
+        print(f"[index_store] 원본 벡터 개수 불일치({vectors.shape[0]} != {ntotal}), 재정렬 사용 안 함")
+        return None
+    return vectors
+
+
+def tombstone_mask(store, meta_count, chunk_map):
+    """(문서별 삭제 여부, 벡터 행별 삭제 여부). 삭제 문서가 없으면 chunk_map을 훑지 않고 행별 마스크는 None"""
+    deleted = np.zeros(meta_count, dtype=bool)
+    ids = [i for i in store.deleted_ids(meta_count) if i < meta_count]
+    if not ids:
+        return deleted, None
+    deleted[ids] = True
+    doc_ids = chunk_map[:, 0]
+    dead_rows = np.zeros(len(chunk_map), dtype=bool)
+    valid = (doc_ids >= 0) & (doc_ids < meta_count)
+    dead_rows[valid] = deleted[doc_ids[valid]]
+    return deleted, dead_rows
+
+
+def _save_npy_atomic(path, array, dtype):
+    tmp_path = f'{path}.tmp.{os.getpid()}'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.asarray(array, dtype=dtype))
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp_path
+
+
+def publish_index(index, chunk_map, vectors=None, commit_meta=None, meta_count=None, count_tombstones=None,
+                  index_path=FAISS_INDEX_PATH, version_path=INDEX_VERSION_PATH, chunk_map_path=CHUNK_MAP_PATH,
+                  vectors_path=VECTORS_PATH):
+    """
+    인덱스/chunk_map(/원본 벡터)을 임시파일에 쓰고, commit_meta()(메타 저장소 트랜잭션)를 실행한 뒤
+    rename으로 교체하고 버전 스탬프(meta_count 포함) 갱신. 읽는 쪽은 중간 상태(반쯤 쓰인 파일)를 보지 않는다.
+    vectors가 None이면 이전 원본 벡터 파일은 인덱스와 맞지 않으므로 삭제.
+    count_tombstones(): 메타 커밋 후 삭제 문서 벡터 수(스탬프에 기록, 압축 판단용)
+    """
+    tmp_index = f'{index_path}.tmp.{os.getpid()}'
+    faiss.write_index(index, tmp_index)
+    with open(tmp_index, 'rb+') as f:
+        os.fsync(f.fileno())
+    tmp_map = _save_npy_atomic(chunk_map_path, chunk_map, np.int64)
+    tmp_vectors = _save_npy_atomic(vectors_path, vectors, np.float32) if vectors is not None else None
+    if commit_meta is not None:
+        commit_meta()
+    os.replace(tmp_map, chunk_map_path)
+    if tmp_vectors is not None:
+        os.replace(tmp_vectors, vectors_path)
+    elif os.path.exists(vectors_path):
+        os.remove(vectors_path)
+    os.replace(tmp_index, index_path)
+    tombstone_rows = count_tombstones() if count_tombstones is not None else 0
+    return write_version_stamp(version_path, ntotal=int(index.ntotal), meta_count=meta_count,
+                               tombstone_rows=int(tombstone_rows))
+
+
+def tombstone_ratio(stamp):
+    """스탬프 기준 삭제 문서 벡터 비율(압축 필요 여부 판단용)"""
+    if not stamp or not stamp.get('ntotal'):
+        return 0.0
+    return stamp.get('tombstone_rows', 0) / stamp['ntotal']
+
+
+def published_meta_count(store, version_path=INDEX_VERSION_PATH):
+    """현재 인덱스에 대응하는 문서 수(스탬프 기준, 스탬프가 없는 기존 산출물은 저장소 문서 수)"""
+    stamp = read_version_stamp(version_path)
+    if stamp and stamp.get('meta_count') is not None:
+        return int(stamp['meta_count'])
+    return store.count()
+
+
+def index_write_lock(timeout=60):
+    from filelock import FileLock
+    return FileLock(str(INDEX_LOCK_PATH), timeout=timeout)
+
+
+def append_to_index(docs, chunk_rows, vectors, store=None, delete_sources=()):
+    """
+    문서 여러 건의 청크 벡터를 한 번에 인덱스에 추가하고 한 번만 publish(파일 락 안에서 디스크 최신본 기준).
+    문서는 메타 저장소에 트랜잭션 1회로 추가(doc_id = 기존 문서 수부터), 같은 문서명의 이전 문서는
+    tombstone 처리(덮어쓰기 = 새 doc_id로 추가 + 이전 doc_id 삭제). delete_sources 문서도 같은 커밋에서 삭제.
+    이 tombstone은 새 문서를 포함한 스탬프가 publish된 뒤에만 적용(그 전에 중단되면 이전 문서가 그대로 검색됨).
+    chunk_rows: (n, 4) [docs 내 위치, chunk_id, start, end], vectors: (n, d) float32
+    """
+    store = store or get_meta_store()
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    with index_write_lock():
+        start = published_meta_count(store)
+        new_rows = np.asarray(chunk_rows, dtype=np.int64).reshape(-1, 4).copy()
+        new_rows[:, 0] += start
+        if FAISS_INDEX_PATH.exists():
+            index = faiss.read_index(str(FAISS_INDEX_PATH))
+            chunk_map = load_chunk_map(index.ntotal)
+            old_vectors = load_vectors(index.ntotal) if INDEX_RERANK else None
+            # 내적 인덱스면 정규화된 벡터로 추가
+            vectors = prepare_for(index, vectors)
+            index.add(vectors)
+        else:
+            # 첫 인덱스는 INDEX_MODE로 생성(학습 데이터 부족 시 flat)
+            index = build_index(vectors)
+            chunk_map = np.zeros((0, 4), dtype=np.int64)
+            old_vectors = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+            vectors = prepare_for(index, vectors)
+        all_vectors = np.vstack([old_vectors, vectors]) if INDEX_RERANK and old_vectors is not None else None
+        chunk_map = np.vstack([chunk_map, new_rows])
+        replaced = []
+
+        def commit_meta():
+            replaced.extend(store.append(docs, start, delete_sources))
+
+        stamp = publish_index(index, chunk_map, all_vectors, commit_meta=commit_meta, meta_count=start + len(docs),
+                              count_tombstones=lambda: _count_tombstone_rows(store, start + len(docs), chunk_map))
+        # 덮어쓴 이전 문서는 publish 후에야 삭제로 취급되므로 본문도 이제 삭제(중단되면 다음 append에서 정리)
+        store.settle_replaced(start + len(docs))
+        stamp['replaced'] = replaced
+        return stamp
+
+
+def _count_tombstone_rows(store, meta_count, chunk_map):
+    dead_rows = tombstone_mask(store, meta_count, chunk_map)[1]
+    return int(dead_rows.sum()) if dead_rows is not None else 0
+
+
+def delete_documents(sources, store=None):
+    """
+    문서명 목록의 현재 문서를 삭제(tombstone). 인덱스 파일은 그대로 두고 스탬프만 갱신 →
+    각 워커가 새 삭제 목록을 읽어 검색에서 제외. 반환: (삭제된 doc_id 목록, 스탬프 또는 None)
+    """
+    store = store or get_meta_store()
+    with index_write_lock():
+        meta_count = published_meta_count(store)
+        doc_ids = []
+        for source in sources:
+            doc_ids.extend(store.live_ids_by_source(source, meta_count))
+        deleted = store.delete(doc_ids)
+        if not deleted:
+            return [], None
+        ntotal = (read_version_stamp() or {}).get('ntotal')
+        tombstone_rows = 0
+        if FAISS_INDEX_PATH.exists():
+            if ntotal is None:
+                ntotal = int(faiss.read_index(str(FAISS_INDEX_PATH)).ntotal)
+            chunk_map = load_chunk_map(ntotal)
+            tombstone_rows = _count_tombstone_rows(store, meta_count, chunk_map)
+        stamp = write_version_stamp(ntotal=ntotal, meta_count=meta_count, tombstone_rows=tombstone_rows)
+        return deleted, stamp
+
+
+def compact_index(store=None, min_ratio=INDEX_COMPACT_RATIO):
+    """
+    삭제 문서 벡터 비율이 min_ratio 이상이면 남은 벡터만으로 인덱스 재구성 후 publish.
+    원본 벡터 파일이 있으면 그 값을, 없으면 인덱스에 저장된 값(양자화 인덱스는 근사값)을 사용. 반환: 스탬프 또는 None
+    """
+    store = store or get_meta_store()
+    with index_write_lock(timeout=600):
+        if not FAISS_INDEX_PATH.exists():
+            return None
+        started = time.perf_counter()
+        meta_count = published_meta_count(store)
+        index = faiss.read_index(str(FAISS_INDEX_PATH))
+        chunk_map = load_chunk_map(index.ntotal)
+        _, dead_rows = tombstone_mask(store, meta_count, chunk_map)
+        if not index.ntotal or dead_rows is None or not dead_rows.any() or dead_rows.mean() < min_ratio:
+            return None
+        keep = np.flatnonzero(~dead_rows)
+        vectors = load_vectors(index.ntotal)
+        new_index = rebuild_without(index, keep, vectors)
+        new_vectors = np.asarray(vectors[keep], dtype=np.float32) if INDEX_RERANK and vectors is not None else None
+        stamp = publish_index(new_index, chunk_map[keep], new_vectors, meta_count=meta_count)
+        print(f"[index_store] 인덱스 압축: 벡터 {index.ntotal}개 → {new_index.ntotal}개 "
+              f"(삭제 {int(dead_rows.sum())}개 제거, {time.perf_counter() - started:.2f}초, generation={stamp['generation']})")
+        return stamp
+
+
+class IndexHolder:
+    """프로세스 내 인덱스 스냅샷 보관 및 핫스왑"""
+
+    def __init__(self, index_path=FAISS_INDEX_PATH, store=None,
+                 version_path=INDEX_VERSION_PATH, chunk_map_path=CHUNK_MAP_PATH,
+                 vectors_path=VECTORS_PATH, check_interval=INDEX_RELOAD_CHECK_SEC):
+        self.index_path = Path(index_path)
+        self._store = store
+        self.version_path = Path(version_path)
+        self.chunk_map_path = Path(chunk_map_path)
+        self.vectors_path = Path(vectors_path)
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._signature = None
+        self._last_check = 0.0
+        self._reload_lock = threading.Lock()
+        self.load_count = 0
+
+    @property
+    def store(self):
+        # 메타 저장소는 처음 쓸 때 연다(최초 1회 meta.json 이전 포함)
+        if self._store is None:
+            self._store = get_meta_store()
+        return self._store
+
+    def _current_signature(self):
+        # 메타 저장소 변경은 항상 publish(스탬프 갱신)와 함께 일어나므로 스탬프/인덱스 파일만 확인
+        return (
+            _file_signature(self.version_path),
+            _file_signature(self.index_path),
+        )
+
+    def _generation_for(self, stamp, signature):
+        if stamp and stamp.get('generation'):
+            return stamp['generation']
+        # 스탬프가 없으면(구버전 ingest 산출물) 파일 mtime으로 대체
+        _, index_sig = signature
+        return f"mtime-{index_sig[0] if index_sig else 0}"
+
+    def load(self):
+        """디스크에서 새 스냅샷을 읽어 교체(읽는 동안 기존 스냅샷으로 계속 서비스)"""
+        with self._reload_lock:
+            signature = self._current_signature()
+            if self._snapshot is not None and signature == self._signature:
+                return self._snapshot
+            with metrics.timed('index_load'):
+                # 스탬프를 먼저 읽음: 그 사이 새 인덱스가 publish되면 meta_count가 작게 잡힐 뿐(다음 확인 때 재로딩)
+                stamp = read_version_stamp(self.version_path)
+                index = read_index_mmap(self.index_path)
+                meta_count = stamp.get('meta_count') if stamp else None
+                # 메타는 읽어 두지 않고 검색 결과에 나온 문서만 조회(작은 필드, 본문 제외)
+                meta = self.store.view(meta_count)
+                chunk_map = load_chunk_map(index.ntotal, self.chunk_map_path, persist=True)
+                vectors = load_vectors(index.ntotal, self.vectors_path) if INDEX_RERANK else None
+                # 삭제(tombstone) 문서의 청크 벡터는 검색 단계에서 제외
+                deleted, dead_rows = tombstone_mask(self.store, len(meta), chunk_map)
+                row_filter = RowFilter(~dead_rows) if dead_rows is not None and dead_rows.any() else None
+            snapshot = IndexSnapshot(index, meta, chunk_map, vectors, self._generation_for(stamp, signature), time.time(),
+                                     deleted, row_filter)
+            # 참조 교체는 원자적: 진행 중인 검색은 이전 스냅샷을 끝까지 사용
+            self._snapshot = snapshot
+            self._signature = signature
+            self.load_count += 1
+            print(f"[index_store] 인덱스 로드 완료: generation={snapshot.generation}, "
+                  f"벡터 {index.ntotal}개, 메타 {len(meta)}개, 삭제 문서 {int(deleted.sum())}개")
+            return snapshot
+
+    def get(self):
+        """현재 스냅샷 반환(주기적으로 변경 여부 확인 후 필요 시 재로딩)"""
+        now = time.monotonic()
+        if self._snapshot is None:
+            return self.load()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            if self._current_signature() != self._signature:
+                try:
+                    return self.load()
+                except Exception as e:
+                    # 쓰기 도중 등 로드 실패 시 기존 스냅샷 유지
+                    print(f"[index_store] 인덱스 재로딩 실패(기존 스냅샷 유지): {e}")
+        return self._snapshot
+
+    def status(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {'loaded': False, 'pid': os.getpid()}
+        return {
+            'loaded': True,
+            'pid': os.getpid(),
+            'generation': snapshot.generation,
+            'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(snapshot.loaded_at)),
+            'index_type': describe(snapshot.index),
+            'ntotal': int(snapshot.index.ntotal),
+            'meta_count': len(snapshot.meta),
+            'chunk_count': int(snapshot.chunk_map.shape[0]),
+            'rerank': snapshot.vectors is not None,
+            'deleted_docs': int(snapshot.deleted.sum()),
+            'tombstone_rows': snapshot.row_filter.excluded if snapshot.row_filter is not None else 0,
+            'load_count': self.load_count,
+        }
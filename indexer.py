@@ -0,0 +1,201 @@
+"""
+업로드 문서 백그라운드 인덱싱 워커
+
+- /upload는 본문을 meta.db staged_docs에 보관하고 job_queue에는 stage_id만 기록한 뒤 바로 응답
+- 워커 스레드가 대기 작업을 최대 JOB_BATCH_SIZE개씩 가져와 청크 분할 → 임베딩 1회(배치) + 인덱스 커밋 1회로 처리
+- 재시작 시 미완료 작업은 requeue_stale()로 복구되어 다시 처리됨
+- 완료 작업의 staged 문서는 바로 삭제, 완료/실패 작업은 보관 기간(JOB_RETENTION_SEC) 후 한가할 때 정리
+- 덮어쓰기/삭제로 tombstone 벡터 비율이 INDEX_COMPACT_RATIO를 넘으면 대기 작업이 없을 때 인덱스 압축
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+import metrics
+from chunking import chunk_documents
+from embed_pipeline import BatchEmbedder, EmbedStats, cache_namespace
+from embedding_cache import get_embedding_cache
+from index_store import INDEX_COMPACT_RATIO, append_to_index, compact_index, read_version_stamp, tombstone_ratio
+from job_queue import JobQueue
+from meta_store import get_meta_store
+
+INDEX_JOB_KIND = 'index_document'
+JOB_BATCH_SIZE = int(os.getenv('JOB_BATCH_SIZE', '64'))
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '1'))
+JOB_POLL_SEC = float(os.getenv('JOB_POLL_SEC', '2.0'))
+# 오래된 완료/실패 작업 정리 주기(초)
+JOB_PURGE_INTERVAL_SEC = float(os.getenv('JOB_PURGE_INTERVAL_SEC', '3600'))
+
+_sync_client = None
+
+
+def get_sync_openai_client():
+    """워커 스레드용 동기 클라이언트(재시도는 BatchEmbedder가 담당)"""
+    global _sync_client
+    if _sync_client is None:
+        from openai import AzureOpenAI
+        _sync_client = AzureOpenAI(
+            api_key=os.getenv('OPENAI_API_KEY') or os.getenv('AZURE_OPENAI_KEY'),
+            api_version=os.getenv('OPENAI_API_VERSION') or '2024-02-01',
+            azure_endpoint=os.getenv('OPENAI_API_BASE') or os.getenv('AZURE_OPENAI_ENDPOINT'),
+            max_retries=0,
+        )
+    return _sync_client
+
+
+def embed_model():
+    return os.getenv('EMBED_MODEL') or os.getenv('EMBED_DEPLOYMENT')
+
+
+class IndexingWorker:
+    def __init__(self, queue=None, workers=JOB_WORKERS, batch_size=JOB_BATCH_SIZE, poll_sec=JOB_POLL_SEC,
+                 store=None):
+        self.queue = queue or JobQueue()
+        self._store = store
+        self._next_purge = 0.0
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.poll_sec = poll_sec
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._compact_due = threading.Event()
+        self._threads = []
+
+    @property
+    def store(self):
+        # 메타 저장소는 처음 쓸 때 연다(app.py import 시점에 meta.db를 열지 않도록)
+        return self._store or get_meta_store()
+
+    def start(self):
+        recovered = self.queue.requeue_stale()
+        if recovered:
+            print(f"[indexer] 미완료 작업 {recovered}건 복구")
+        self.check_compaction(read_version_stamp())
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f'indexer-{i}', daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def check_compaction(self, stamp):
+        """publish 결과 스탬프의 tombstone 비율이 기준 이상이면 압축 예약(워커가 한가할 때 실행)"""
+        if stamp and tombstone_ratio(stamp) >= INDEX_COMPACT_RATIO:
+            self._compact_due.set()
+            self._wake.set()
+
+    def compact(self):
+        try:
+            with metrics.timed('index_compact'):
+                compact_index()
+        except Exception as e:
+            print(f"[indexer] 인덱스 압축 실패: {e}")
+
+    def submit(self, doc):
+        # 본문은 meta.db에 보관, 작업에는 참조만 기록(jobs.db에 본문 사본이 쌓이지 않도록)
+        stage_id = self.store.stage(doc)
+        try:
+            job_id = self.queue.enqueue(INDEX_JOB_KIND, {'stage_id': stage_id, 'source': doc.get('source')})
+        except Exception:
+            self.store.unstage([stage_id])
+            raise
+        self._wake.set()
+        return job_id
+
+    def purge(self):
+        """보관 기간이 지난 완료/실패 작업과 그 staged 문서 정리"""
+        try:
+            payloads = self.queue.purge()
+            self.store.unstage([p['stage_id'] for p in payloads if 'stage_id' in p])
+            if payloads:
+                print(f"[indexer] 오래된 작업 {len(payloads)}건 정리")
+        except Exception as e:
+            print(f"[indexer] 작업 정리 실패: {e}")
+
+    def _load_docs(self, jobs):
+        """작업 → 문서(staged 문서가 없는 작업은 실패 처리하고 제외). 이전 형식(payload = 문서)도 처리"""
+        staged = self.store.staged([job['payload']['stage_id'] for job in jobs if 'stage_id' in job['payload']])
+        loaded, docs = [], []
+        for job in jobs:
+            payload = job['payload']
+            doc = staged.get(payload['stage_id']) if 'stage_id' in payload else payload
+            if doc is None:
+                self.queue.fail([job['id']], f"인덱싱할 문서가 없습니다(stage_id={payload['stage_id']})")
+                continue
+            loaded.append(job)
+            docs.append(doc)
+        return loaded, docs
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                jobs = self.queue.claim_batch(INDEX_JOB_KIND, self.batch_size)
+            except Exception as e:
+                print(f"[indexer] 작업 조회 실패: {e}")
+                jobs = []
+            if not jobs:
+                if time.monotonic() >= self._next_purge:
+                    self._next_purge = time.monotonic() + JOB_PURGE_INTERVAL_SEC
+                    self.purge()
+                if self._compact_due.is_set():
+                    self._compact_due.clear()
+                    self.compact()
+                    continue
+                self._wake.wait(self.poll_sec)
+                self._wake.clear()
+                continue
+            self.process_batch(jobs)
+
+    def process_batch(self, jobs):
+        started = time.perf_counter()
+        jobs, docs = self._load_docs(jobs)
+        if not jobs:
+            return
+        try:
+            texts, rows = chunk_documents(docs)
+            embedder = BatchEmbedder(get_sync_openai_client(), embed_model(),
+                                     cache=get_embedding_cache(cache_namespace(embed_model())))
+            stats = EmbedStats()
+            with metrics.timed('index_embedding', upstream='openai'):
+                vectors = embedder.embed(texts, stats=stats)
+            if embedder.errors:
+                metrics.UPSTREAM_ERRORS.inc('openai', amount=len(embedder.errors))
+        except Exception as e:
+            print(f"[indexer] 임베딩 실패: {e}")
+            self.queue.fail([job['id'] for job in jobs], e)
+            return
+        # 청크가 하나라도 실패한 문서는 통째로 재시도 대상
+        failed_docs = {}
+        for i, ((doc_pos, _, _, _), vec) in enumerate(zip(rows, vectors)):
+            if vec is None and doc_pos not in failed_docs:
+                failed_docs[doc_pos] = embedder.errors.get(i) or '임베딩 실패'
+        for doc_pos, error in failed_docs.items():
+            self.queue.fail([jobs[doc_pos]['id']], error)
+        ok_positions = [pos for pos in range(len(docs)) if pos not in failed_docs]
+        if not ok_positions:
+            return
+        new_pos = {pos: i for i, pos in enumerate(ok_positions)}
+        ok_rows = [(new_pos[r[0]],) + tuple(r[1:]) for r in rows if r[0] in new_pos]
+        ok_vectors = [vec for r, vec in zip(rows, vectors) if r[0] in new_pos]
+        try:
+            # 배치 전체를 인덱스 커밋 1회로 반영
+            with metrics.timed('index_commit'):
+                stamp = append_to_index([docs[pos] for pos in ok_positions], ok_rows, np.vstack(ok_vectors),
+                                        store=self.store)
+        except Exception as e:
+            print(f"[indexer] 인덱스 커밋 실패: {e}")
+            self.queue.fail([jobs[pos]['id'] for pos in ok_positions], e)
+            return
+        self.queue.complete([jobs[pos]['id'] for pos in ok_positions], result={'generation': stamp['generation']})
+        self.store.unstage([jobs[pos]['payload']['stage_id'] for pos in ok_positions
+                            if 'stage_id' in jobs[pos]['payload']])
+        print(f"[indexer] {len(ok_positions)}건({len(ok_rows)}청크) 인덱싱 완료(generation={stamp['generation']}, "
+              f"{time.perf_counter() - started:.2f}초, 캐시 재사용 {stats.cache_hits}건, 덮어쓰기 {len(stamp['replaced'])}건)")
+        self.check_compaction(stamp)
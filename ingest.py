@@ -1,14 +1,19 @@
 
 
-import json
-import faiss
 import numpy as np
 from openai import AzureOpenAI
 from packaging import version
 import os
+import time
 from dotenv import load_dotenv
 # 파일 락을 위한 filelock 라이브러리 사용
-from filelock import FileLock, Timeout
+from filelock import Timeout
+from index_store import publish_index, index_write_lock, published_meta_count
+from meta_store import get_meta_store
+from embed_pipeline import BatchEmbedder, EmbedStats, cache_namespace
+from embedding_cache import get_embedding_cache
+from chunking import chunk_documents, rows_to_array
+from index_factory import INDEX_RERANK, build_index, describe, prepare_for
 
 # 로그 파일 핸들러
 import sys
@@ -31,79 +36,133 @@ def logprint(*args, **kwargs):
 
 
 load_dotenv()
+
+# --sync: 전체 재생성 대신 Blob 컨테이너 증분 동기화(blob_sync.py)
+import argparse
+parser = argparse.ArgumentParser(description='FAISS 인덱스 재생성 / Blob 컨테이너 증분 동기화')
+parser.add_argument('--sync', action='store_true', help='컨테이너 변경분(추가/변경/삭제)만 반영')
+parser.add_argument('--dry-run', action='store_true', help='--sync와 함께: 변경 목록만 확인')
+parser.add_argument('--prefix', default='', help='--sync와 함께: 이 접두어로 시작하는 blob만 동기화')
+parser.add_argument('--container', default=None, help='--sync와 함께: 컨테이너(기본 AZURE_STORAGE_CONTAINER)')
+args = parser.parse_args()
+if args.sync:
+    import contextlib
+    import blob_sync
+    try:
+        with contextlib.redirect_stdout(logger):
+            counts = blob_sync.run_sync(args.container, prefix=args.prefix, dry_run=args.dry_run)
+    except Timeout:
+        logprint('[ingest.py] 다른 동기화가 실행 중입니다. 종료합니다.')
+        sys.exit(1)
+    except RuntimeError as e:
+        logprint(f'[ingest.py] {e}')
+        sys.exit(1)
+    summary = ', '.join(f'{k}={v}' for k, v in counts.items())
+    logprint(f"[ingest.py] {'동기화 확인(dry-run)' if args.dry_run else '동기화 완료'}: {summary}")
+    sys.exit(1 if counts['failed'] else 0)
+
 # Azure OpenAI 환경변수 명확화
 AZURE_OPENAI_KEY = os.getenv('OPENAI_API_KEY') or os.getenv('AZURE_OPENAI_KEY')
 AZURE_OPENAI_ENDPOINT = os.getenv('OPENAI_API_BASE') or os.getenv('AZURE_OPENAI_ENDPOINT')
-AZURE_OPENAI_VERSION = os.getenv('OPENAI_API_VERSION') or "2023-05-15"
+AZURE_OPENAI_VERSION = os.getenv('OPENAI_API_VERSION') or "2024-02-01"
 EMBED_DEPLOYMENT = os.getenv('EMBED_DEPLOYMENT') or os.getenv('EMBED_MODEL')
 
+# 재시도/백오프는 BatchEmbedder가 담당하므로 SDK 자체 재시도는 끔
 client = AzureOpenAI(
     api_key=AZURE_OPENAI_KEY,
     api_version=AZURE_OPENAI_VERSION,
-    azure_endpoint=AZURE_OPENAI_ENDPOINT
+    azure_endpoint=AZURE_OPENAI_ENDPOINT,
+    max_retries=0
 )
 
 
 # 단일 실행 진입점: ingest.py는 명시적으로 한 번만 실행(여러 파일 업로드 후 수동 또는 별도 트리거)
-lock_path = 'meta.json.lock'
-lock = FileLock(lock_path, timeout=60)
+# 업로드 인덱싱 워커와 같은 락을 사용(재생성 중 append가 끼어들지 않도록)
+lock = index_write_lock(timeout=60)
 try:
     logprint('[ingest.py] 파일 락 획득 시도...')
     with lock:
         logprint('[ingest.py] 파일 락 획득!')
-        with open('meta.json', encoding='utf-8') as f:
-            meta = json.load(f)
-
-        def get_openai_embedding(text):
-            # 최대 8000자까지만 임베딩
-            max_length = 8000
-            if text and len(text) > max_length:
-                text = text[:max_length]
-            response = client.embeddings.create(
-                input=[text],
-                model=EMBED_DEPLOYMENT
-            )
-            embedding = response.data[0].embedding
-            return np.array(embedding, dtype=np.float32)
+        # 문서는 메타 저장소(meta.db)에서 읽음(최초 실행 시 meta.json에서 한 번 이전)
+        store = get_meta_store()
+        meta_count = published_meta_count(store)
+        # 삭제(tombstone)된 문서는 제외, doc_id는 그대로 유지(재생성 후에도 문서 번호 고정)
+        meta = list(store.iter_docs(0, meta_count))
 
-        embeddings = []
-        filtered_meta = []
-        for item in meta:
+        candidates = []
+        candidate_ids = []
+        excluded_ids = []
+        for doc_id, item in meta:
             text = item.get('text', '')
             # 의미 없는 텍스트(빈 문자열, 20자 미만, http/https로 시작) 제외
             if not text or len(text.strip()) < 20:
                 logprint(f"[ingest.py] 제외: '{item.get('source')}' (텍스트 20자 미만 또는 없음)")
+                excluded_ids.append(doc_id)
                 continue
             if text.strip().lower().startswith(('http://', 'https://')):
                 logprint(f"[ingest.py] 제외: '{item.get('source')}' (http/https로 시작)")
+                excluded_ids.append(doc_id)
                 continue
-            logprint(f"[ingest.py] 임베딩 시도: '{item.get('source')}' (텍스트 길이: {len(text)})")
-            try:
-                emb = get_openai_embedding(text)
-                logprint(f"[ingest.py] 임베딩 성공: '{item.get('source')}', shape: {emb.shape}")
-                embeddings.append(emb)
+            candidates.append(item)
+            candidate_ids.append(doc_id)
+
+        # 여러 문서를 요청 1건에 묶어 동시 임베딩(429/5xx 재시도 포함)
+        def report_progress(stats, total):
+            s = stats.summary()
+            logprint(f"[ingest.py] 임베딩 진행: {s['docs'] + s['failed']}/{total} "
+                     f"({s['docs_per_sec']} docs/sec, {s['tokens_per_sec']} tokens/sec, 재시도 {s['retries']}회)")
+
+        # 내용이 바뀌지 않은 문서는 임베딩 캐시에서 재사용(새 문서/변경분만 API 호출)
+        cache = get_embedding_cache(cache_namespace(EMBED_DEPLOYMENT))
+        embedder = BatchEmbedder(client, EMBED_DEPLOYMENT, progress=report_progress, cache=cache)
+        stats = EmbedStats()
+        logprint(f"[ingest.py] 임베딩 시작: 문서 {len(candidates)}건 "
+                 f"(배치 최대 {embedder.max_batch_items}건/{embedder.max_batch_tokens}토큰, 동시 {embedder.concurrency})")
+        # 문서 전체를 잘라 쓰지 않고 겹치는 청크로 나눠 청크별로 임베딩
+        chunk_texts, chunk_rows = chunk_documents(candidates)
+        logprint(f"[ingest.py] 청크 분할: 문서 {len(candidates)}건 → 청크 {len(chunk_texts)}개")
+        vectors = embedder.embed(chunk_texts, stats=stats)
+
+        failed_docs = {}
+        for i, ((doc_pos, _, _, _), emb) in enumerate(zip(chunk_rows, vectors)):
+            if emb is None and doc_pos not in failed_docs:
+                failed_docs[doc_pos] = embedder.errors.get(i)
+        for doc_pos, error in failed_docs.items():
+            logprint(f"[ingest.py] 임베딩 실패: '{candidates[doc_pos].get('source')}', 에러: {error}")
+
+        # 모든 청크가 성공한 문서만 인덱싱(chunk_map의 문서 번호 = 메타 저장소 doc_id)
+        # 임베딩 실패 문서는 메타에 남겨 둠(키워드 검색 가능, 다음 재생성 때 다시 임베딩)
+        embeddings = []
+        filtered_meta = []
+        new_rows = []
+        for doc_pos, item in enumerate(candidates):
+            if doc_pos not in failed_docs:
                 filtered_meta.append(item)
-            except Exception as e:
-                logprint(f"[ingest.py] 임베딩 실패: '{item.get('source')}', 에러: {e}")
+        for (doc_pos, chunk_id, start, end), emb in zip(chunk_rows, vectors):
+            if doc_pos not in failed_docs:
+                embeddings.append(emb)
+                new_rows.append((candidate_ids[doc_pos], chunk_id, start, end))
+        s = stats.summary()
+        logprint(f"[ingest.py] 임베딩 완료: 문서 {len(filtered_meta)}건, 청크 성공 {s['docs']}개(캐시 재사용 {s['cache_hits']}개), "
+                 f"실패 {s['failed']}개, 요청 {s['requests']}회, {s['elapsed_sec']}초 - "
+                 f"{round(len(filtered_meta) / stats.elapsed, 2)} docs/sec, {s['docs_per_sec']} chunks/sec, {s['tokens_per_sec']} tokens/sec")
+
+        if cache is not None:
+            logprint(f"[ingest.py] 임베딩 캐시: {cache.stats()}")
 
         if embeddings:
             embeddings = np.vstack(embeddings)
-            index = faiss.IndexFlatL2(embeddings.shape[1])
-            index.add(embeddings)
-            faiss.write_index(index, 'faiss_index.bin')
-            # faiss_index.bin flush/close 보장
-            try:
-                with open('faiss_index.bin', 'rb+') as fidx:
-                    fidx.flush()
-                    os.fsync(fidx.fileno())
-            except Exception as e:
-                print(f'[flush] faiss_index.bin flush error: {e}')
-            # meta.json도 인덱싱된 항목만 따로 저장(선택)
-            with open('meta.json', 'w', encoding='utf-8') as f:
-                json.dump(filtered_meta, f, ensure_ascii=False, indent=2)
-                f.flush()
-                os.fsync(f.fileno())
-            logprint('FAISS 인덱스 재생성 완료! (flush/close 완료)')
+            # INDEX_MODE(flat/hnsw/ivf/ivfpq/opq)에 따라 인덱스 생성
+            build_started = time.perf_counter()
+            index = build_index(embeddings)
+            logprint(f"[ingest.py] 인덱스 생성: {describe(index)}, {time.perf_counter() - build_started:.2f}초")
+            # faiss_index.bin을 임시파일 → rename으로 교체, 제외된 문서는 메타 저장소에서 tombstone 처리(트랜잭션 1회),
+            # 버전 스탬프를 갱신해 실행 중인 app.py 워커들이 새 스냅샷으로 핫스왑하도록 함
+            # INDEX_RERANK=1이면 원본 float32 벡터도 저장(양자화 인덱스 검색 결과 재정렬용)
+            raw_vectors = prepare_for(index, embeddings) if INDEX_RERANK else None
+            stamp = publish_index(index, rows_to_array(new_rows), raw_vectors,
+                                  commit_meta=lambda: store.delete(excluded_ids), meta_count=meta_count)
+            logprint(f"FAISS 인덱스 재생성 완료! (generation={stamp['generation']})")
         else:
             logprint('인덱싱할 유효한 텍스트가 없습니다.')
 except Timeout:
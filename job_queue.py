@@ -0,0 +1,180 @@
+"""
+SQLite 기반 영속 작업 큐
+
+- 업로드된 문서의 임베딩/인덱싱 작업을 jobs.db에 기록(프로세스 재시작 후에도 유지)
+- 여러 gunicorn 워커가 같은 DB를 공유: BEGIN IMMEDIATE 트랜잭션으로 작업을 원자적으로 가져감(claim)
+- 실행 중(running)인데 담당 프로세스가 죽었거나 임대 시간이 지난 작업은 다시 대기(pending)로 되돌림
+- payload에는 문서 본문 대신 참조(meta.db staged_docs의 stage_id)만 기록, 완료/실패 작업은 JOB_RETENTION_SEC 후 삭제(purge)
+- 이전 형식(payload = 문서 전체) 작업은 완료 시 payload에서 본문(text)을 지움
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent
+# 영속 상태는 모두 인덱스 디렉터리(INDEX_DIR) 아래에 둠(디렉터리를 옮겨도 한 곳에 모여 있도록)
+INDEX_DIR = Path(os.getenv('INDEX_DIR') or BASE_DIR)
+JOBS_DB_PATH = Path(os.getenv('JOBS_DB_PATH') or (INDEX_DIR / 'jobs.db'))
+JOB_LEASE_SEC = float(os.getenv('JOB_LEASE_SEC', '600'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+# 완료/실패 작업 보관 기간(초, 기본 7일). 지나면 purge()가 삭제
+JOB_RETENTION_SEC = float(os.getenv('JOB_RETENTION_SEC', str(7 * 24 * 3600)))
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_by TEXT,
+    claimed_at REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(kind, status, created_at);
+'''
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    def __init__(self, db_path=JOBS_DB_PATH):
+        self.db_path = str(db_path)
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind, payload):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            'INSERT INTO jobs(id, kind, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (job_id, kind, 'pending', json.dumps(payload, ensure_ascii=False), now, now))
+        return job_id
+
+    def get(self, job_id, with_payload=False):
+        conn = self._conn()
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._row_to_dict(row, with_payload) if row else None
+
+    def claim_batch(self, kind, limit):
+        """대기 중 작업을 최대 limit개 running으로 바꾸고 반환(생성 순)"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(
+                'SELECT * FROM jobs WHERE kind = ? AND status = ? ORDER BY created_at LIMIT ?',
+                (kind, 'pending', limit)).fetchall()
+            if rows:
+                conn.executemany(
+                    'UPDATE jobs SET status = ?, claimed_by = ?, claimed_at = ?, attempts = attempts + 1, '
+                    'updated_at = ? WHERE id = ?',
+                    [('running', self.owner, now, now, row['id']) for row in rows])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return [self._row_to_dict(row, with_payload=True) for row in rows]
+
+    def complete(self, job_ids, result=None):
+        now = time.time()
+        result_json = json.dumps(result, ensure_ascii=False) if result is not None else None
+        conn = self._conn()
+        # 인덱싱이 끝난 본문은 jobs.db에 남기지 않음(메타/인덱스에 이미 반영)
+        conn.executemany(
+            "UPDATE jobs SET status = ?, result = ?, error = NULL, payload = json_remove(payload, '$.text'), "
+            'updated_at = ? WHERE id = ?',
+            [('done', result_json, now, job_id) for job_id in job_ids])
+
+    def fail(self, job_ids, error):
+        """시도 횟수가 남았으면 다시 pending, 아니면 failed"""
+        now = time.time()
+        conn = self._conn()
+        conn.executemany(
+            'UPDATE jobs SET status = CASE WHEN attempts < ? THEN ? ELSE ? END, error = ?, '
+            'claimed_by = NULL, updated_at = ? WHERE id = ?',
+            [(JOB_MAX_ATTEMPTS, 'pending', 'failed', str(error), now, job_id) for job_id in job_ids])
+
+    def requeue_stale(self):
+        """시작 시 호출: 죽은 프로세스가 잡고 있던 작업/임대 만료 작업을 pending으로 복구"""
+        now = time.time()
+        host = socket.gethostname()
+        stale = []
+        conn = self._conn()
+        rows = conn.execute('SELECT id, claimed_by, claimed_at FROM jobs WHERE status = ?', ('running',)).fetchall()
+        for row in rows:
+            owner_host, _, owner_pid = (row['claimed_by'] or '').rpartition(':')
+            dead = owner_host == host and owner_pid.isdigit() and not _pid_alive(int(owner_pid))
+            expired = (row['claimed_at'] or 0) + JOB_LEASE_SEC < now
+            if dead or expired:
+                stale.append(row['id'])
+        if stale:
+            conn.executemany(
+                'UPDATE jobs SET status = ?, claimed_by = NULL, updated_at = ? WHERE id = ? AND status = ?',
+                [('pending', now, job_id, 'running') for job_id in stale])
+        return len(stale)
+
+    def purge(self, retention_sec=JOB_RETENTION_SEC):
+        """완료/실패 후 retention_sec가 지난 작업 삭제 → 삭제한 작업의 payload 목록(참조 정리용)"""
+        cutoff = time.time() - retention_sec
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute('SELECT id, payload FROM jobs WHERE status IN (?, ?) AND updated_at < ?',
+                                ('done', 'failed', cutoff)).fetchall()
+            conn.executemany('DELETE FROM jobs WHERE id = ?', [(row['id'],) for row in rows])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return [json.loads(row['payload']) for row in rows]
+
+    def counts(self):
+        conn = self._conn()
+        rows = conn.execute('SELECT status, COUNT(*) AS n FROM jobs GROUP BY status').fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+    @staticmethod
+    def _row_to_dict(row, with_payload=False):
+        job = {
+            'id': row['id'],
+            'kind': row['kind'],
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'error': row['error'],
+            'result': json.loads(row['result']) if row['result'] else None,
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+        }
+        if with_payload:
+            job['payload'] = json.loads(row['payload'])
+        return job
+
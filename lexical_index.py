@@ -0,0 +1,198 @@
+"""
+문서 키워드(BM25) 인덱스 - 프로세스 내 역색인
+
+- 토큰화: 한글은 글자 2-gram(조사/복합어에 강함, 1글자 단어는 1-gram),
+  영문/숫자는 소문자 단어 + 하이픈 등으로 이어진 식별자 전체("dr-2025-52056")
+- 문서 = 메타 항목(문서명 + 본문), 문서 번호 = doc_id(벡터 검색의 chunk_map 문서 번호와 동일)
+- sync(meta, generation, load_docs): 메타가 뒤에 추가만 된 경우 새 문서만 색인(업로드), 그 외에는 전체 재구성
+  (스냅샷 meta에는 본문이 없으므로 색인할 범위의 본문은 load_docs(start, end)로 읽음)
+- 검색 중인 스레드는 이전 상태(_State)를 끝까지 사용하고 갱신은 새 상태로 통째 교체(락 없이 읽기)
+- 삭제(tombstone)된 문서는 색인에서 빼지 않고 검색 시 exclude 마스크로 제외(전체 재구성 시 빠짐)
+- 검색 비용은 질의 용어의 posting 길이에 비례(전체 문서 수 크기의 배열을 만들지 않음)
+- rrf_fuse(): 여러 순위 목록을 Reciprocal Rank Fusion으로 병합(하이브리드 검색)
+"""
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, namedtuple
+
+import numpy as np
+
+BM25_K1 = float(os.getenv('BM25_K1', '1.2'))
+BM25_B = float(os.getenv('BM25_B', '0.75'))
+RRF_K = int(os.getenv('RRF_K', '60'))
+
+_HANGUL_RE = re.compile(r'[가-힣]+')
+# 영문/숫자 단어 및 -_./로 이어진 식별자(DR 번호, 버전, 파일명 등)
+_WORD_RE = re.compile(r'[a-z0-9]+(?:[-_./][a-z0-9]+)*')
+
+# postings: {용어: (문서 번호 배열 int32, 빈도 배열 float32)}, doc_len: 문서별 토큰 수
+# norm: 문서별 BM25 길이 정규화 항 k1·(1 - b + b·len/avgdl)(색인 갱신 시 한 번 계산)
+_State = namedtuple('_State', ['postings', 'doc_len', 'total_len', 'fingerprint', 'generation', 'norm'])
+
+
+def tokenize(text):
+    """검색/색인 공통 토큰 목록(중복 포함)"""
+    if not text:
+        return []
+    text = text.lower()
+    tokens = []
+    for run in _HANGUL_RE.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    for word in _WORD_RE.findall(text):
+        tokens.append(word)
+        parts = re.split(r'[-_./]', word)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p)
+    return tokens
+
+
+def doc_text(item):
+    return f"{item.get('source', '')}\n{item.get('text', '') or ''}"
+
+
+def _fingerprint(meta):
+    """앞부분이 그대로인지 확인용(문서 수 + 마지막 문서명)"""
+    if not meta:
+        return (0, None)
+    return (len(meta), meta[-1].get('source'))
+
+
+class LexicalIndex:
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._state = self._empty_state()
+        self._write_lock = threading.Lock()
+
+    @staticmethod
+    def _empty_state():
+        return _State({}, np.zeros(0, dtype=np.float32), 0, (0, None), None, np.zeros(0, dtype=np.float32))
+
+    def _norm(self, doc_len, total_len):
+        avgdl = total_len / len(doc_len) if len(doc_len) else 1.0
+        return (self.k1 * (1 - self.b + self.b * doc_len / (avgdl or 1.0))).astype(np.float32)
+
+    @property
+    def doc_count(self):
+        return len(self._state.doc_len)
+
+    @property
+    def generation(self):
+        return self._state.generation
+
+    def _add_docs(self, state, docs, start, end):
+        """state에 문서(doc_id start..end-1, [(doc_id, 문서)])를 추가한 새 상태. 바뀐 용어의 posting만 새 배열로 만듦"""
+        new_terms = {}
+        lengths = np.zeros(end - start, dtype=np.float32)
+        for doc_id, item in docs:
+            if not start <= doc_id < end:
+                continue
+            counts = Counter(tokenize(doc_text(item)))
+            lengths[doc_id - start] = sum(counts.values())
+            for term, tf in counts.items():
+                new_terms.setdefault(term, ([], []))
+                new_terms[term][0].append(doc_id)
+                new_terms[term][1].append(tf)
+        postings = dict(state.postings)
+        for term, (ids, tfs) in new_terms.items():
+            ids = np.asarray(ids, dtype=np.int32)
+            tfs = np.asarray(tfs, dtype=np.float32)
+            old = postings.get(term)
+            if old is not None:
+                ids = np.concatenate([old[0], ids])
+                tfs = np.concatenate([old[1], tfs])
+            postings[term] = (ids, tfs)
+        doc_len = np.concatenate([state.doc_len, lengths])
+        return postings, doc_len, state.total_len + float(lengths.sum())
+
+    def sync(self, meta, generation=None, load_docs=None):
+        """meta(스냅샷 메타) 기준으로 색인 갱신. 변경 없으면 바로 반환"""
+        state = self._state
+        if generation is not None and generation == state.generation:
+            return False
+        with self._write_lock:
+            state = self._state
+            if generation is not None and generation == state.generation:
+                return False
+            started = time.perf_counter()
+            indexed = len(state.doc_len)
+            appended = len(meta) >= indexed and (
+                indexed == 0 or (indexed, meta[indexed - 1].get('source')) == state.fingerprint)
+            if not appended:
+                state = self._empty_state()
+                indexed = 0
+            if load_docs is not None:
+                docs = load_docs(indexed, len(meta))
+            else:
+                docs = enumerate(meta[indexed:], start=indexed)
+            postings, doc_len, total_len = self._add_docs(state, docs, indexed, len(meta))
+            self._state = _State(postings, doc_len, total_len, _fingerprint(meta), generation,
+                                 self._norm(doc_len, total_len))
+            print(f"[lexical_index] {'추가' if appended else '재구성'}: 문서 {len(meta) - indexed}건 색인 "
+                  f"(전체 {len(meta)}건, 용어 {len(postings)}개, {time.perf_counter() - started:.3f}초)")
+            return True
+
+    def search(self, query, top_k=10, exclude=None):
+        """BM25 상위 문서 [(문서 번호, 점수)]. exclude: 문서 번호별 제외 여부(bool 배열, 삭제 문서)"""
+        state = self._state
+        n_docs = len(state.doc_len)
+        terms = set(tokenize(query))
+        if not n_docs or not terms:
+            return []
+        # 질의 용어의 posting만 모아 문서별 합산
+        id_parts, score_parts = [], []
+        for term in terms:
+            posting = state.postings.get(term)
+            if posting is None:
+                continue
+            ids, tfs = posting
+            idf = math.log(1 + (n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+            id_parts.append(ids)
+            score_parts.append(idf * tfs * (self.k1 + 1) / (tfs + state.norm[ids]))
+        if not id_parts:
+            return []
+        if len(id_parts) == 1:
+            doc_ids, scores = id_parts[0], score_parts[0]
+        else:
+            doc_ids, inverse = np.unique(np.concatenate(id_parts), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(score_parts)).astype(np.float32)
+        if exclude is not None and len(exclude):
+            inside = doc_ids < len(exclude)
+            keep = ~inside
+            keep[inside] = ~exclude[doc_ids[inside]]
+            doc_ids, scores = doc_ids[keep], scores[keep]
+        if not len(doc_ids):
+            return []
+        order = np.argsort(-scores) if len(scores) <= top_k else \
+            np.argpartition(-scores, top_k - 1)[:top_k]
+        order = order[np.argsort(-scores[order], kind='stable')]
+        return [(int(doc_ids[i]), float(scores[i])) for i in order]
+
+    def stats(self):
+        state = self._state
+        return {
+            'generation': state.generation,
+            'doc_count': len(state.doc_len),
+            'term_count': len(state.postings),
+            'avg_doc_tokens': round(state.total_len / len(state.doc_len), 1) if len(state.doc_len) else 0,
+        }
+
+
+def rrf_fuse(rankings, top_k=10, k=RRF_K):
+    """
+    순위 목록 여러 개([(문서 번호, 점수)], 점수 내림차순)를 RRF로 병합.
+    반환 점수는 모든 목록에서 1위일 때 1.0이 되도록 정규화
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, (doc_idx, _) in enumerate(ranking):
+            fused[doc_idx] = fused.get(doc_idx, 0.0) + 1.0 / (k + rank + 1)
+    best = len(rankings) / (k + 1) if rankings else 1.0
+    ranked = sorted(fused.items(), key=lambda x: -x[1])[:top_k]
+    return [(doc_idx, score / best) for doc_idx, score in ranked]
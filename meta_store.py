@@ -0,0 +1,435 @@
+"""
+SQLite 기반 문서 메타데이터 저장소(meta.db)
+
+- 문서 번호(doc_id) = chunk_map의 문서 번호(FAISS 벡터 → 문서 매핑과 같은 id 공간)
+- docs: 검색 결과 표시/순위에 필요한 작은 필드(source + 기타 필드 JSON), doc_text: 본문(필요할 때만 조회)
+- doc_id / source 색인으로 O(1) 조회, 추가는 트랜잭션 1회(파일 전체 재작성 없음)
+- 최초 실행 시 기존 meta.json을 한 번만 옮겨 옴(배열 순서 = doc_id)
+- 읽는 쪽은 버전 스탬프의 meta_count까지만 사용 → 인덱스 publish 전에 커밋된 문서는 보이지 않음
+- 삭제/덮어쓰기는 행을 지우지 않고 deleted=1(tombstone)로 표시하고 본문만 삭제 → doc_id는 재사용되지 않음
+- 덮어쓰기 tombstone은 대체 문서 번호(deleted_by)와 함께 기록하고, 대체 문서가 publish된 뒤(deleted_by < meta_count)에만
+  삭제로 취급 → 메타 커밋 후 인덱스 rename 전에 중단되어도 이전 문서는 계속 검색됨(본문은 publish 후 다음 append에서 삭제)
+- 검색 스냅샷은 view(meta_count)로 필요한 문서만 조회(워커 기동 시 전체 메타를 읽지 않음)
+- staged_docs: 인덱싱 대기 문서(업로드 본문). 작업 큐(jobs.db)에는 stage_id만 기록하고 인덱싱 완료 후 삭제
+- doc_attrs: 필터 검색용 (속성, 값) → doc_id 역리스트(doc_filters.extract_attrs, 문서 추가와 같은 트랜잭션에서 기록)
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from cache_utils import LRUTTLCache
+from doc_filters import ATTRS_VERSION, extract_attrs
+
+BASE_DIR = Path(__file__).parent
+# 인덱스 파일과 같은 디렉터리(index_store.INDEX_DIR) 기준: 다른 INDEX_DIR의 meta.json을 옮겨 와
+# 인덱스에 없는 문서가 생기지 않도록 함
+INDEX_DIR = Path(os.getenv('INDEX_DIR') or BASE_DIR)
+META_DB_PATH = Path(os.getenv('META_DB_PATH') or (INDEX_DIR / 'meta.db'))
+LEGACY_META_PATH = INDEX_DIR / 'meta.json'
+# 스냅샷 메타 보기(MetaView)에서 조회한 문서 필드 캐시 크기(워커당)
+META_VIEW_CACHE_SIZE = int(os.getenv('META_VIEW_CACHE_SIZE', '20000'))
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS docs (
+    doc_id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    fields TEXT NOT NULL,
+    text_len INTEGER NOT NULL DEFAULT 0,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    deleted_by INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_docs_source ON docs(source, doc_id);
+CREATE TABLE IF NOT EXISTS doc_text (
+    doc_id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS doc_attrs (
+    attr TEXT NOT NULL,
+    value TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    PRIMARY KEY (attr, value, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_doc_attrs_doc ON doc_attrs(doc_id);
+CREATE TABLE IF NOT EXISTS staged_docs (
+    stage_id TEXT PRIMARY KEY,
+    doc TEXT NOT NULL,
+    staged_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS store_info (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+
+def _split(doc):
+    """문서 dict → (source, 작은 필드 JSON, 본문)"""
+    # chunks(추출 단계 청크 구간)는 인덱싱에만 쓰고 저장하지 않음
+    fields = {k: v for k, v in doc.items() if k not in ('text', 'chunks')}
+    text = doc.get('text') or ''
+    return doc.get('source') or '', json.dumps(fields, ensure_ascii=False), text
+
+
+def _row_to_doc(row, text=None):
+    doc = json.loads(row['fields'])
+    doc.setdefault('source', row['source'])
+    if text is not None:
+        doc['text'] = text
+    return doc
+
+
+class MetaStore:
+    def __init__(self, db_path=META_DB_PATH, migrate_from=LEGACY_META_PATH):
+        self.db_path = str(db_path)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        # deleted 컬럼이 없던 기존 meta.db 보완
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(docs)')}
+        if 'deleted' not in columns:
+            conn.execute('ALTER TABLE docs ADD COLUMN deleted INTEGER NOT NULL DEFAULT 0')
+        if 'deleted_by' not in columns:
+            conn.execute('ALTER TABLE docs ADD COLUMN deleted_by INTEGER')
+        # 삭제 목록 조회(스냅샷 로드마다)가 전체 행을 훑지 않도록 tombstone만 담는 부분 색인
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_docs_deleted ON docs(doc_id) WHERE deleted = 1')
+        # publish 대기 중인 덮어쓰기 tombstone(본문 미삭제)만 담는 부분 색인
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_docs_deleted_by ON docs(deleted_by) WHERE deleted_by IS NOT NULL')
+        # 속성 추출 전에 만들어진(또는 추출 규칙이 바뀐) meta.db는 한 번 다시 추출. 빈 저장소는 버전만 기록
+        self.backfill_attrs()
+        if migrate_from is not None:
+            self.migrate_from_json(migrate_from)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _insert(self, conn, docs, start):
+        rows, texts, attrs = [], [], []
+        for offset, doc in enumerate(docs):
+            source, fields, text = _split(doc)
+            rows.append((start + offset, source, fields, len(text)))
+            texts.append((start + offset, text))
+            attrs.extend((attr, value, start + offset) for attr, value in extract_attrs(doc))
+        conn.executemany('INSERT INTO docs (doc_id, source, fields, text_len) VALUES (?, ?, ?, ?)', rows)
+        conn.executemany('INSERT INTO doc_text (doc_id, text) VALUES (?, ?)', texts)
+        conn.executemany('INSERT OR IGNORE INTO doc_attrs (attr, value, doc_id) VALUES (?, ?, ?)', attrs)
+
+    def backfill_attrs(self, batch_size=500):
+        """doc_attrs를 현재 추출 규칙(ATTRS_VERSION)으로 다시 채움(버전이 같으면 아무것도 하지 않음). 반환: 처리한 문서 수"""
+        conn = self._conn()
+        query = "SELECT value FROM store_info WHERE key = 'attrs_version'"
+        row = conn.execute(query).fetchone()
+        if row is not None and row[0] == ATTRS_VERSION:
+            return 0
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 다른 워커가 먼저 채웠으면 건너뜀
+            row = conn.execute(query).fetchone()
+            if row is not None and row[0] == ATTRS_VERSION:
+                conn.execute('COMMIT')
+                return 0
+            conn.execute('DELETE FROM doc_attrs')
+            total, pos = 0, 0
+            while True:
+                # 삭제된 문서도 문서명/필드 속성은 채움(검색에서는 tombstone 마스크로 제외)
+                batch = conn.execute(
+                    'SELECT d.doc_id, d.source, d.fields, t.text FROM docs d LEFT JOIN doc_text t ON t.doc_id = d.doc_id '
+                    'WHERE d.doc_id >= ? ORDER BY d.doc_id LIMIT ?', (pos, batch_size)).fetchall()
+                if not batch:
+                    break
+                conn.executemany('INSERT OR IGNORE INTO doc_attrs (attr, value, doc_id) VALUES (?, ?, ?)',
+                                 [(attr, value, row['doc_id'])
+                                  for row in batch for attr, value in extract_attrs(_row_to_doc(row, row['text'] or ''))])
+                total += len(batch)
+                pos = batch[-1]['doc_id'] + 1
+            conn.execute("INSERT OR REPLACE INTO store_info (key, value) VALUES ('attrs_version', ?)", (ATTRS_VERSION,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if total:
+            print(f"[meta_store] 문서 속성(필터 검색용) 추출 완료: 문서 {total}건")
+        return total
+
+    def migrate_from_json(self, path):
+        """저장소가 비어 있고 아직 옮긴 적이 없으면 meta.json을 한 번에 가져옴"""
+        path = Path(path)
+        if not path.exists():
+            return 0
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM store_info WHERE key = 'migrated_from'").fetchone():
+            return 0
+        with open(path, encoding='utf-8') as f:
+            docs = json.load(f)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 다른 워커가 먼저 옮겼으면 건너뜀
+            if conn.execute("SELECT 1 FROM store_info WHERE key = 'migrated_from'").fetchone() \
+                    or conn.execute('SELECT 1 FROM docs LIMIT 1').fetchone():
+                conn.execute('COMMIT')
+                return 0
+            self._insert(conn, docs, 0)
+            conn.execute("INSERT OR REPLACE INTO store_info (key, value) VALUES ('migrated_from', ?)", (str(path),))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        print(f"[meta_store] {path.name} → {Path(self.db_path).name} 이전 완료: 문서 {len(docs)}건")
+        return len(docs)
+
+    def count(self):
+        row = self._conn().execute('SELECT MAX(doc_id) FROM docs').fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def _mark_deleted(self, conn, doc_ids):
+        conn.executemany('UPDATE docs SET deleted = 1, deleted_by = NULL WHERE doc_id = ?', [(i,) for i in doc_ids])
+        conn.executemany('DELETE FROM doc_text WHERE doc_id = ?', [(i,) for i in doc_ids])
+
+    def _mark_replaced(self, conn, doc_ids, replaced_by):
+        """덮어쓰기 tombstone(replaced_by 문서가 publish되어야 삭제로 취급, 본문은 그때까지 유지)"""
+        conn.executemany('UPDATE docs SET deleted = 1, deleted_by = ? WHERE doc_id = ?',
+                         [(replaced_by, i) for i in doc_ids])
+
+    def _settle_replaced(self, conn, published):
+        """
+        publish된(deleted_by < published) 덮어쓰기 tombstone은 본문 삭제 후 일반 tombstone으로,
+        publish되지 않은(중단된 이전 시도의) tombstone은 되돌림
+        """
+        ids = [row[0] for row in conn.execute(
+            'SELECT doc_id FROM docs WHERE deleted_by IS NOT NULL AND deleted_by < ?', (published,))]
+        self._mark_deleted(conn, ids)
+        conn.execute('UPDATE docs SET deleted = 0, deleted_by = NULL WHERE deleted_by >= ?', (published,))
+
+    def append(self, docs, start, delete_sources=()):
+        """
+        doc_id start번부터 문서 추가(트랜잭션 1회). start 이후의 기존 행(커밋 후 publish 안 된 잔여분)은 교체.
+        같은 문서명의 이전 문서와 delete_sources 문서명의 문서는 같은 트랜잭션에서 tombstone 처리(덮어쓰기/삭제).
+        이 tombstone은 추가한 문서가 publish(meta_count > 대체 문서 번호)된 뒤에만 검색에서 제외됨.
+        반환: tombstone 처리된 doc_id 목록
+        """
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._settle_replaced(conn, start)
+            conn.execute('DELETE FROM docs WHERE doc_id >= ?', (start,))
+            conn.execute('DELETE FROM doc_text WHERE doc_id >= ?', (start,))
+            conn.execute('DELETE FROM doc_attrs WHERE doc_id >= ?', (start,))
+            self._insert(conn, docs, start)
+            replaced = []
+            for offset, doc in enumerate(docs):
+                # 배치 안에서 같은 문서명이 여러 번 나오면 마지막 것만 남김
+                ids = [row[0] for row in conn.execute(
+                    'SELECT doc_id FROM docs WHERE source = ? AND doc_id < ? AND deleted = 0',
+                    (doc.get('source') or '', start + offset))]
+                self._mark_replaced(conn, ids, start + offset)
+                replaced.extend(ids)
+            for source in delete_sources:
+                ids = [row[0] for row in conn.execute(
+                    'SELECT doc_id FROM docs WHERE source = ? AND doc_id < ? AND deleted = 0', (source, start))]
+                # 추가 문서가 없으면 publish 없이 바로 삭제
+                if docs:
+                    self._mark_replaced(conn, ids, start + len(docs) - 1)
+                else:
+                    self._mark_deleted(conn, ids)
+                replaced.extend(ids)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return replaced
+
+    def settle_replaced(self, published):
+        """publish 후 호출: 반영된 덮어쓰기 tombstone의 본문 삭제(트랜잭션 1회)"""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._settle_replaced(conn, published)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def delete(self, doc_ids):
+        """문서 tombstone 처리(본문 삭제, 행은 남겨 doc_id 재사용 방지). 반환: 새로 삭제된 doc_id 목록"""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # publish 대기 중인 덮어쓰기 tombstone도 아직 살아 있는 문서이므로 삭제 대상
+            live = [i for i in doc_ids if conn.execute(
+                'SELECT 1 FROM docs WHERE doc_id = ? AND (deleted = 0 OR deleted_by IS NOT NULL)', (int(i),)).fetchone()]
+            self._mark_deleted(conn, live)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return live
+
+    def deleted_ids(self, limit=None):
+        """doc_id limit 미만의 tombstone 목록(limit = meta_count면 그 시점에 publish되지 않은 덮어쓰기 tombstone 제외)"""
+        sql, params = 'SELECT doc_id FROM docs WHERE deleted = 1', []
+        if limit is not None:
+            sql += ' AND doc_id < ? AND (deleted_by IS NULL OR deleted_by < ?)'
+            params += [limit, limit]
+        return [row[0] for row in self._conn().execute(sql, params)]
+
+    @staticmethod
+    def _live(limit, alias=''):
+        """삭제되지 않은 문서 조건(limit = meta_count면 publish 대기 중인 덮어쓰기 tombstone은 아직 살아 있는 문서)"""
+        if limit is None:
+            return f'{alias}deleted = 0', []
+        return f'{alias}doc_id < ? AND ({alias}deleted = 0 OR {alias}deleted_by >= ?)', [limit, limit]
+
+    def live_ids_by_source(self, source, limit=None):
+        """문서명의 삭제되지 않은 doc_id 목록"""
+        live, live_params = self._live(limit)
+        sql, params = f'SELECT doc_id FROM docs WHERE source = ? AND {live}', [source] + live_params
+        return [row[0] for row in self._conn().execute(sql + ' ORDER BY doc_id', params)]
+
+    def doc_ids_with(self, attr, values, limit=None):
+        """속성 값이 values 중 하나인 doc_id 목록(삭제 여부 무관, 오름차순)"""
+        values = list(values)
+        sql = (f'SELECT DISTINCT doc_id FROM doc_attrs WHERE attr = ? '
+               f'AND value IN ({",".join("?" * len(values))})')
+        params = [attr] + values
+        if limit is not None:
+            sql += ' AND doc_id < ?'
+            params.append(limit)
+        return [row[0] for row in self._conn().execute(sql + ' ORDER BY doc_id', params)]
+
+    def attr_values(self, attr, limit=None):
+        """속성의 값별 문서 수 {값: 문서 수}(삭제된 문서 제외, 필터 값 안내용)"""
+        live, live_params = self._live(limit, 'd.')
+        sql = ('SELECT a.value, COUNT(*) FROM doc_attrs a JOIN docs d ON d.doc_id = a.doc_id '
+               f'WHERE a.attr = ? AND {live}')
+        params = [attr] + live_params
+        return dict(self._conn().execute(sql + ' GROUP BY a.value ORDER BY a.value', params).fetchall())
+
+    def rows(self, limit=None, start=0):
+        """doc_id start..limit-1의 작은 필드 목록(본문 제외). 빠진 번호는 빈 dict"""
+        limit = self.count() if limit is None else limit
+        result = [{} for _ in range(max(0, limit - start))]
+        cursor = self._conn().execute('SELECT doc_id, source, fields FROM docs WHERE doc_id >= ? AND doc_id < ? '
+                                      'ORDER BY doc_id', (start, limit))
+        for row in cursor:
+            result[row['doc_id'] - start] = _row_to_doc(row)
+        return result
+
+    def view(self, limit=None):
+        """doc_id 0..limit-1을 필요할 때 조회하는 읽기 전용 시퀀스(검색 스냅샷용)"""
+        return MetaView(self, self.count() if limit is None else limit)
+
+    def get(self, doc_id, with_text=True):
+        conn = self._conn()
+        row = conn.execute('SELECT doc_id, source, fields FROM docs WHERE doc_id = ?', (doc_id,)).fetchone()
+        if row is None:
+            return None
+        return _row_to_doc(row, self.get_text(doc_id) if with_text else None)
+
+    def get_text(self, doc_id):
+        row = self._conn().execute('SELECT text FROM doc_text WHERE doc_id = ?', (doc_id,)).fetchone()
+        return row['text'] if row else ''
+
+    def find_by_source(self, source, limit=None, with_text=True):
+        """문서명으로 조회(삭제된 문서 제외, 같은 이름이 여러 건이면 최신). 반환: (doc_id, 문서) 또는 (None, None)"""
+        live, live_params = self._live(limit)
+        sql = f'SELECT doc_id, source, fields FROM docs WHERE source = ? AND {live}'
+        params = [source] + live_params
+        row = self._conn().execute(sql + ' ORDER BY doc_id DESC LIMIT 1', params).fetchone()
+        if row is None:
+            return None, None
+        return row['doc_id'], _row_to_doc(row, self.get_text(row['doc_id']) if with_text else None)
+
+    def iter_docs(self, start=0, end=None, batch_size=500):
+        """본문 포함 문서(삭제된 문서 제외)를 doc_id 순으로 (doc_id, 문서) 반환(한 번에 batch_size건씩 읽음)"""
+        end = self.count() if end is None else end
+        conn = self._conn()
+        pos = start
+        while pos < end:
+            rows = conn.execute(
+                'SELECT d.doc_id, d.source, d.fields, t.text FROM docs d LEFT JOIN doc_text t ON t.doc_id = d.doc_id '
+                'WHERE d.doc_id >= ? AND d.doc_id < ? AND (d.deleted = 0 OR d.deleted_by >= ?) '
+                'ORDER BY d.doc_id LIMIT ?',
+                (pos, end, end, batch_size)).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                yield row['doc_id'], _row_to_doc(row, row['text'] or '')
+            pos = rows[-1]['doc_id'] + 1
+
+    def stage(self, doc):
+        """인덱싱 대기 문서 보관 → stage_id(작업 큐 payload에 이 값만 기록)"""
+        stage_id = uuid.uuid4().hex
+        self._conn().execute('INSERT INTO staged_docs (stage_id, doc, staged_at) VALUES (?, ?, ?)',
+                             (stage_id, json.dumps(doc, ensure_ascii=False), time.time()))
+        return stage_id
+
+    def staged(self, stage_ids):
+        """{stage_id: 문서}(없는 id는 빠짐)"""
+        conn = self._conn()
+        docs = {}
+        for i in range(0, len(stage_ids), 500):
+            part = list(stage_ids[i:i + 500])
+            rows = conn.execute(
+                f'SELECT stage_id, doc FROM staged_docs WHERE stage_id IN ({",".join("?" * len(part))})', part)
+            docs.update((row['stage_id'], json.loads(row['doc'])) for row in rows)
+        return docs
+
+    def unstage(self, stage_ids):
+        self._conn().executemany('DELETE FROM staged_docs WHERE stage_id = ?', [(i,) for i in stage_ids])
+
+
+class MetaView:
+    """
+    스냅샷 메타(doc_id 0..count-1의 작은 필드). 생성 시 아무것도 읽지 않고 meta[i]를 처음 볼 때 조회해 캐시.
+    publish된 범위의 source/fields는 바뀌지 않으므로(삭제는 deleted 플래그와 본문만 변경) 캐시를 무효화할 일이 없음
+    """
+
+    def __init__(self, store, count, cache_size=META_VIEW_CACHE_SIZE):
+        self.store = store
+        self.count = count
+        self._cache = LRUTTLCache(cache_size)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(self.count)
+            return self.store.rows(stop, start)[::step] if start < stop else []
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        doc = self._cache.get(i)
+        if doc is None:
+            doc = self.store.get(i, with_text=False) or {}
+            self._cache.set(i, doc)
+        return doc
+
+    def __iter__(self):
+        batch = 5000
+        for start in range(0, self.count, batch):
+            yield from self.store.rows(min(start + batch, self.count), start)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_meta_store():
+    """프로세스 내 공유 인스턴스(최초 생성 시 meta.json 이전)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MetaStore()
+        return _store
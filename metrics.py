@@ -0,0 +1,238 @@
+"""
+프로세스 내 성능 지표(Prometheus 텍스트 형식) 및 요청 단위 추적
+
+- Counter / Histogram: 표준 라이브러리만 사용(스레드 안전), GET /metrics에서 render()로 노출
+- STAGE_SECONDS{stage}: 단계별 처리 시간(embedding, index_load, faiss_search, metadata_lookup, lexical_search,
+  blob_props, blob_download, blob_upload, extraction, gpt, cognitive_search, filter_resolve)
+- UPSTREAM_ERRORS{service}: 업스트림(Azure OpenAI/Blob/Search) 호출 실패 수
+- CallbackMetric: 이미 집계 중인 값(캐시 적중 수, 인덱스 벡터 수 등)을 /metrics 조회 시점에 읽음(요청 경로 비용 없음)
+- MetricsMiddleware: 엔드포인트별 요청 수/응답 시간(순수 ASGI, 스트리밍 응답은 본문 전송 완료까지)
+- Trace: 상세 추적(검색 결과 id/점수 등). TRACE_SAMPLE_RATE 비율로 샘플링하거나 요청별로 켬(?trace=1, X-Trace: 1)
+  꺼져 있으면 None을 넘기므로 검색 경로 비용은 `if trace is not None` 확인뿐
+"""
+import os
+import random
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+# 0~1, 요청을 이 비율로 골라 상세 추적 로그 출력(0이면 요청에서 켠 경우만)
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0'))
+# 초 단위 기본 버킷(FAISS 검색 같은 1ms 미만 단계부터 GPT/OCR 같은 수십 초 단계까지)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _num(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            yield f'{self.name}{_labels(self.labelnames, labelvalues)} {_num(value)}'
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # 레이블 값 → [버킷별 개수..., +Inf 개수, 합계]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labelvalues):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def count(self, *labelvalues):
+        series = self._series.get(labelvalues)
+        return sum(series[:-1]) if series else 0
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for labelvalues, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += n
+                le = 'le="' + _num(bound) + '"'
+                yield f'{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, labelvalues)} {_num(series[-1])}'
+            yield f'{self.name}_count{_labels(self.labelnames, labelvalues)} {cumulative}'
+
+
+class CallbackMetric:
+    """조회 시점에 fn()이 돌려준 {레이블 값 튜플: 값}을 노출(kind: counter/gauge)"""
+
+    def __init__(self, name, help, kind, labelnames, fn):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+        _registry.append(self)
+
+    def collect(self):
+        try:
+            values = self.fn()
+        except Exception as e:
+            print(f"[metrics] {self.name} 수집 실패: {e}")
+            return
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.kind}'
+        for labelvalues, value in sorted(values.items()):
+            yield f'{self.name}{_labels(self.labelnames, labelvalues)} {_num(value)}'
+
+
+def render():
+    """등록된 전체 지표 → Prometheus 텍스트 형식(0.0.4)"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+STAGE_SECONDS = Histogram('app_stage_seconds', '단계별 처리 시간(초)', ['stage'])
+UPSTREAM_ERRORS = Counter('app_upstream_errors_total', '업스트림 호출 실패 수', ['service'])
+REQUEST_SECONDS = Histogram('app_request_seconds', '엔드포인트별 응답 시간(초, 스트리밍은 전송 완료까지)',
+                            ['handler', 'method'])
+REQUESTS = Counter('app_requests_total', '엔드포인트별 요청 수', ['handler', 'method', 'status'])
+
+
+class timed:
+    """
+    with timed('faiss_search', trace): 단계 시간을 STAGE_SECONDS에 기록(trace가 있으면 추적에도 남김)
+    upstream을 지정하면 예외 발생 시 UPSTREAM_ERRORS{service=upstream} 증가
+    """
+    __slots__ = ('stage', 'trace', 'upstream', 'started')
+
+    def __init__(self, stage, trace=None, upstream=None):
+        self.stage = stage
+        self.trace = trace
+        self.upstream = upstream
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(elapsed, self.stage)
+        # 취소(CancelledError)는 실패로 세지 않음
+        failed = exc_type is not None and issubclass(exc_type, Exception)
+        if failed and self.upstream:
+            UPSTREAM_ERRORS.inc(self.upstream)
+        if self.trace is not None:
+            self.trace.event(f"{self.stage} {elapsed * 1000:.2f}ms" + (f" 실패: {exc}" if failed else ''))
+        return False
+
+
+class Trace:
+    """요청 하나의 상세 추적 기록(샘플링되었거나 요청에서 켠 경우에만 생성)"""
+
+    def __init__(self, name, requested=False):
+        self.name = name
+        self.requested = requested  # 요청에서 켠 경우 응답에도 포함
+        self.id = uuid.uuid4().hex[:8]
+        self.started = time.perf_counter()
+        self.events = []
+        self._lock = threading.Lock()
+
+    def event(self, message):
+        offset = (time.perf_counter() - self.started) * 1000
+        with self._lock:
+            self.events.append((round(offset, 2), message))
+
+    def finish(self):
+        """추적 내용을 한 번에 출력하고 응답에 실을 수 있는 dict로 반환"""
+        total = (time.perf_counter() - self.started) * 1000
+        lines = [f"[trace {self.id}] {self.name} {total:.2f}ms"]
+        lines += [f"[trace {self.id}] +{offset:.2f}ms {message}" for offset, message in self.events]
+        print('\n'.join(lines))
+        return {'id': self.id, 'total_ms': round(total, 2),
+                'events': [{'ms': offset, 'event': message} for offset, message in self.events]}
+
+
+def start_trace(name, requested=False):
+    """요청에서 켰거나 TRACE_SAMPLE_RATE 샘플에 걸리면 Trace, 아니면 None"""
+    if requested or (TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE):
+        return Trace(name, requested)
+    return None
+
+
+def trace_requested(request, flag=None):
+    """?trace=1 파라미터/본문 값(flag) 또는 X-Trace 헤더로 추적 요청 여부"""
+    if flag:
+        return True
+    header = request.headers.get('x-trace') if request is not None else None
+    return bool(header) and header.strip().lower() not in ('0', 'false', 'no')
+
+
+class MetricsMiddleware:
+    """엔드포인트(핸들러 함수 이름)별 요청 수/응답 시간 기록"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # 라우팅 후 scope에 endpoint가 채워짐(정적 파일/404 등은 other)
+            handler = getattr(scope.get('endpoint'), '__name__', 'other')
+            REQUEST_SECONDS.observe(time.perf_counter() - started, handler, scope['method'])
+            REQUESTS.inc(handler, scope['method'], str(status[0]))
@@ -173,31 +173,61 @@ async function search(){
         try {
           const doc = j.결과[idx];
           console.log('요약/키워드 생성 요청 본문:', doc.본문);
+          // 스트리밍(SSE) 요청: 생성 중인 텍스트를 바로 표시하고, 완료(done) 시 키워드/요약으로 교체
           const resp = await fetch('/summarize', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ text: doc.본문, source: doc.문서명, query: document.getElementById('query').value })
+            body: JSON.stringify({ text: doc.본문, source: doc.문서명, query: document.getElementById('query').value, stream: true })
           });
-          const data = await resp.json();
-          el.querySelector('.summarizing').remove();
+          // 스트리밍 중에는 글자가 보이도록 투명도만 복원(클릭은 완료 후 허용)
           el.style.opacity = '1';
+          el.insertAdjacentHTML('beforeend', `
+            <div class="summary-box" style="background:#f6f8fa;border-radius:8px;padding:12px;margin-top:10px;">
+              <div class="summary-stream" style="color:#222;white-space:pre-wrap;"></div>
+            </div>
+          `);
+          const box = el.querySelector('.summary-box');
+          const streamDiv = box.querySelector('.summary-stream');
+          const reader = resp.body.getReader();
+          const decoder = new TextDecoder();
+          let buffer = '';
+          let data = null;
+          while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let sep;
+            while ((sep = buffer.indexOf('\n\n')) >= 0) {
+              const block = buffer.slice(0, sep);
+              buffer = buffer.slice(sep + 2);
+              const event = (block.match(/^event: (.*)$/m) || [])[1];
+              const payload = JSON.parse((block.match(/^data: (.*)$/m) || [])[1] || '{}');
+              if (event === 'delta') {
+                if (el.querySelector('.summarizing')) el.querySelector('.summarizing').remove();
+                streamDiv.textContent += payload.text;
+              } else if (event === 'done' || event === 'error') {
+                data = event === 'error' ? { error: payload.error } : payload;
+              }
+            }
+          }
+          if (el.querySelector('.summarizing')) el.querySelector('.summarizing').remove();
           el.style.pointerEvents = '';
-          if (data.error) {
-            alert('요약/키워드 생성 오류: ' + data.error);
+          if (!data || data.error) {
+            box.remove();
+            alert('요약/키워드 생성 오류: ' + (data ? data.error : '응답이 중단되었습니다.'));
             summaryVisible = false;
             return;
           }
-          el.insertAdjacentHTML('beforeend', `
-            <div class="summary-box" style="background:#f6f8fa;border-radius:8px;padding:12px;margin-top:10px;">
+          box.innerHTML = `
               <div style="font-weight:600;color:#0366d6;margin-bottom:6px;">키워드</div>
               <div style="color:#222;margin-bottom:10px;">${data.keywords}</div>
               <div style="font-weight:600;color:#0366d6;margin-bottom:6px;">요약</div>
               <div style="color:#222;">${data.summary}</div>
-            </div>
-          `);
+          `;
           summaryVisible = true;
         } catch(e) {
-          el.querySelector('.summarizing').remove();
+          if (el.querySelector('.summarizing')) el.querySelector('.summarizing').remove();
+          if (el.querySelector('.summary-box')) el.querySelector('.summary-box').remove();
           el.style.opacity = '1';
           el.style.pointerEvents = '';
           alert('요약/키워드 생성 오류: ' + e.message);
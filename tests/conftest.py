@@ -0,0 +1,92 @@
+"""
+fake_azure.py(Azure OpenAI/Blob 대체 서버)를 띄워 실제 Azure 없이 app.py/blob_sync.py를 테스트
+- INDEX_DIR 등은 모듈 import 시점에 읽으므로, 테스트 모듈을 수집(import)하기 전에 이 파일에서 환경변수를 설정
+- fake_azure 주소는 서버를 띄운 뒤에 정해지므로 fixture 안에서 설정한 다음 app을 import
+- 앱은 세션당 한 번 띄움(인덱스/메타 저장소 공유) → 테스트마다 서로 다른 파일명을 사용
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# 업로드 블록 분할이 작은 파일에서도 일어나도록 블록 크기를 줄임
+BLOCK_SIZE = 64 * 1024
+
+WORK = Path(tempfile.mkdtemp(prefix='rag-tests-'))
+(WORK / 'index').mkdir()
+os.environ.update({
+    # meta.db/jobs.db/blob_sync.db/embed_cache 모두 INDEX_DIR 아래
+    'INDEX_DIR': str(WORK / 'index'),
+    'EMBED_DIMENSIONS': '256',
+    'BLOB_BLOCK_SIZE': str(BLOCK_SIZE),
+    # 인덱싱 작업이 끝나면 다음 검색에서 바로 새 스냅샷을 보도록 매번 변경 여부 확인
+    'INDEX_RELOAD_CHECK_SEC': '0',
+})
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(WORK, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def azure():
+    from fake_azure import FakeAzure
+    fake = FakeAzure(WORK / 'blob', port=0, dim=256, embed_latency_ms=0, embed_item_ms=0, chat_latency_ms=0)
+    fake.start()
+    fake.work = WORK
+    with pytest.MonkeyPatch.context() as mp:
+        for key, value in fake.env().items():
+            mp.setenv(key, value)
+        yield fake
+    fake.stop()
+
+
+@pytest.fixture(scope='session')
+def app_module(azure):
+    """환경변수를 설정한 뒤 import한 app 모듈"""
+    import app
+    return app
+
+
+@pytest.fixture(scope='session')
+def client(app_module):
+    from fastapi.testclient import TestClient
+    with TestClient(app_module.app) as c:
+        yield c
+
+
+def wait_job(client, job_id, timeout=30):
+    """작업이 끝날 때까지 /jobs/{id}를 조회"""
+    deadline = time.time() + timeout
+    while True:
+        job = client.get(f'/jobs/{job_id}').json()
+        if job.get('status') in ('done', 'failed') or time.time() > deadline:
+            return job
+        time.sleep(0.05)
+
+
+@pytest.fixture(scope='session')
+def upload(client):
+    """파일 업로드 후 인덱싱 작업 완료까지 기다리고 (업로드 응답, 작업) 반환"""
+    def _upload(name, text, overwrite=False):
+        data = text.encode('utf-8') if isinstance(text, str) else text
+        r = client.post('/upload', files={'file': (name, data, 'text/plain')},
+                        data={'overwrite': '1' if overwrite else '0'})
+        assert r.status_code == 200
+        body = r.json()
+        assert 'error' not in body, body
+        return body, wait_job(client, body['job_id'])
+    return _upload
+
+
+def lexical_sources(client, q, top_k=20):
+    r = client.get('/search', params={'q': q, 'mode': 'lexical', 'top_k': top_k})
+    assert r.status_code == 200
+    return [item['문서명'] for item in r.json()['결과']]
@@ -0,0 +1,161 @@
+"""app.py 엔드포인트: 업로드/작업 상태, 덮어쓰기·삭제 tombstone, 다운로드 Range, 배치 검색, 요약 SSE"""
+import json
+
+from conftest import BLOCK_SIZE, lexical_sources
+
+
+def body_text(word, repeat=30):
+    return f'{word} 수수료 정산 고객 대리점별 집계 문서 ' * repeat
+
+
+def test_upload_then_job_done(client, upload, azure):
+    before = azure.stats().get('blob_block_bytes', 0)
+    text = body_text('uploadword', repeat=3000)
+    body, job = upload('upload.txt', text)
+    assert body['filename'] == 'upload.txt'
+    assert job['status'] == 'done'
+    # 블록 단위 업로드(BLOB_BLOCK_SIZE보다 큰 파일)
+    size = len(text.encode('utf-8'))
+    assert size > BLOCK_SIZE
+    assert azure.stats()['blob_block_bytes'] - before == size
+    assert 'upload.txt' in lexical_sources(client, 'uploadword')
+    status = client.get('/index/status').json()
+    assert status['loaded'] and status['ntotal'] > 0
+
+
+def test_job_payload_keeps_reference_only(client, upload):
+    import app
+    _, job = upload('payload.txt', body_text('payloadword'))
+    payload = app.indexing_worker.queue.get(job['id'], with_payload=True)['payload']
+    assert 'text' not in payload and payload['source'] == 'payload.txt'
+    assert list(app.indexing_worker.store.staged([payload['stage_id']])) == []
+
+
+def test_unknown_job_is_404(client):
+    assert client.get('/jobs/no-such-job').status_code == 404
+
+
+def test_upload_existing_name_requires_overwrite(client, upload):
+    upload('exists.txt', body_text('existsword'))
+    r = client.post('/upload', files={'file': ('exists.txt', b'other', 'text/plain')})
+    assert 'error' in r.json()
+
+
+def test_overwrite_tombstones_previous_version(client, upload):
+    upload('overwrite.txt', body_text('oldversionword'))
+    assert 'overwrite.txt' in lexical_sources(client, 'oldversionword')
+    deleted_before = client.get('/index/status').json()['deleted_docs']
+    _, job = upload('overwrite.txt', body_text('newversionword'), overwrite=True)
+    assert job['status'] == 'done'
+    assert 'overwrite.txt' not in lexical_sources(client, 'oldversionword')
+    assert lexical_sources(client, 'newversionword').count('overwrite.txt') == 1
+    status = client.get('/index/status').json()
+    assert status['deleted_docs'] == deleted_before + 1
+    # 벡터 검색에서도 이전 버전이 나오지 않음(같은 문서명은 한 번만)
+    r = client.get('/search', params={'q': 'newversionword', 'mode': 'vector', 'top_k': 50}).json()
+    assert [x['문서명'] for x in r['결과']].count('overwrite.txt') <= 1
+
+
+def test_delete_index_document(client, upload):
+    upload('delete.txt', body_text('deleteword'))
+    assert 'delete.txt' in lexical_sources(client, 'deleteword')
+    r = client.delete('/index/documents', params={'filename': 'delete.txt'})
+    assert r.status_code == 200 and r.json()['doc_ids']
+    assert 'delete.txt' not in lexical_sources(client, 'deleteword')
+    r = client.delete('/index/documents', params={'filename': 'delete.txt'})
+    assert r.status_code == 404
+    # Blob 원본은 유지
+    assert client.get('/download', params={'filename': 'delete.txt'}).status_code == 200
+
+
+def test_download_range_304_416(client, upload):
+    data = ('다운로드 범위 테스트 ' * 20000).encode('utf-8')
+    upload('download.txt', data)
+    full = client.get('/download', params={'filename': 'download.txt'})
+    assert full.status_code == 200
+    assert full.content == data
+    assert full.headers['accept-ranges'] == 'bytes'
+    etag = full.headers['etag']
+
+    part = client.get('/download', params={'filename': 'download.txt'}, headers={'Range': 'bytes=100-199'})
+    assert part.status_code == 206
+    assert part.content == data[100:200]
+    assert part.headers['content-range'] == f'bytes 100-199/{len(data)}'
+
+    suffix = client.get('/download', params={'filename': 'download.txt'}, headers={'Range': 'bytes=-10'})
+    assert suffix.status_code == 206 and suffix.content == data[-10:]
+
+    # If-Range가 현재 ETag와 다르면 전체 전송
+    stale = client.get('/download', params={'filename': 'download.txt'},
+                       headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert stale.status_code == 200 and len(stale.content) == len(data)
+
+    cached = client.get('/download', params={'filename': 'download.txt'}, headers={'If-None-Match': etag})
+    assert cached.status_code == 304 and cached.content == b''
+
+    bad = client.get('/download', params={'filename': 'download.txt'},
+                     headers={'Range': f'bytes={len(data)}-{len(data) + 10}'})
+    assert bad.status_code == 416
+    assert bad.headers['content-range'] == f'bytes */{len(data)}'
+
+    assert client.get('/download', params={'filename': 'missing.txt'}).status_code == 404
+
+
+def test_search_batch_json_and_ndjson(client, upload):
+    upload('batch-a.txt', body_text('batchalpha'))
+    upload('batch-b.txt', body_text('batchbeta'))
+    queries = ['batchalpha', 'batchbeta', 'batchalpha 정산']
+
+    r = client.post('/search/batch', json={'queries': queries, 'mode': 'lexical', 'top_k': 3})
+    assert r.status_code == 200
+    results = r.json()['결과']
+    assert [x['질의'] for x in results] == queries
+    assert results[0]['결과'][0]['문서명'] == 'batch-a.txt'
+    assert results[1]['결과'][0]['문서명'] == 'batch-b.txt'
+
+    # 벡터 검색도 질의별 결과를 반환
+    r = client.post('/search/batch', json={'queries': queries, 'mode': 'vector', 'top_k': 3}).json()
+    assert r['검색방식'] == 'vector' and len(r['결과']) == len(queries)
+
+    with client.stream('POST', '/search/batch',
+                       json={'queries': queries, 'mode': 'lexical', 'top_k': 3, 'stream': True}) as s:
+        assert s.headers['content-type'].startswith('application/x-ndjson')
+        lines = [json.loads(line) for line in s.iter_lines() if line]
+    assert [line['번호'] for line in lines] == [0, 1, 2]
+    assert [line['질의'] for line in lines] == queries
+    assert lines[0]['결과'] == results[0]['결과']
+
+    assert client.post('/search/batch', json={'queries': []}).status_code == 400
+    assert client.post('/search/batch', json={'queries': ['a'], 'mode': 'nope'}).status_code == 400
+
+
+def parse_sse(text):
+    events = []
+    for block in text.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def test_summarize_sse(client, azure):
+    body = {'source': 'summary.txt', 'text': body_text('summaryword', repeat=10), 'query': '정산',
+            'stream': True}
+    chat_before = azure.stats().get('chat_requests', 0)
+    r = client.post('/summarize', json=body)
+    assert r.headers['content-type'].startswith('text/event-stream')
+    events = parse_sse(r.text)
+    names = [name for name, _ in events]
+    assert names[-1] == 'done' and 'delta' in names
+    done = events[-1][1]
+    assert done['cached'] is False and done['summary']
+    streamed = ''.join(data['text'] for name, data in events if name == 'delta')
+    assert done['summary'] in streamed
+
+    # 같은 요청은 캐시에서 done 이벤트 하나로 응답(GPT 호출 없음)
+    again = parse_sse(client.post('/summarize', json=body).text)
+    assert [name for name, _ in again] == ['done']
+    assert again[0][1]['cached'] is True and again[0][1]['summary'] == done['summary']
+    assert azure.stats()['chat_requests'] - chat_before == 1
+
+    empty = parse_sse(client.post('/summarize', json={'source': 'x', 'text': '', 'stream': True}).text)
+    assert empty[0][0] == 'error'
@@ -0,0 +1,82 @@
+"""ingest.py --sync(blob_sync.run_sync) 증분 동기화: 추가/변경/삭제 반영 후 실행 중인 앱 검색 결과 확인"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT, lexical_sources
+
+PREFIX = 'sync/'
+
+
+@pytest.fixture
+def container(azure):
+    from azure.core.exceptions import ResourceExistsError
+    from azure.storage.blob import BlobServiceClient
+    service = BlobServiceClient.from_connection_string(os.environ['AZURE_STORAGE_CONNECTION_STRING'])
+    cc = service.get_container_client(os.environ['AZURE_STORAGE_CONTAINER'])
+    try:
+        cc.create_container()
+    except ResourceExistsError:
+        pass
+    return cc
+
+
+def put(cc, name, text):
+    from azure.storage.blob import ContentSettings
+    cc.upload_blob(PREFIX + name, text.encode('utf-8'), overwrite=True,
+                   content_settings=ContentSettings(content_type='text/plain'))
+
+
+def run_sync(azure, *extra, batch_size=None):
+    """별도 프로세스로 ingest.py --sync 실행 → 요약 줄의 건수 dict"""
+    # app과 같은 프로세스에서 돌리면 aio_clients 전역 클라이언트를 서로 닫으므로 CLI로 실행
+    env = os.environ.copy()
+    if batch_size:
+        env['SYNC_BATCH_SIZE'] = str(batch_size)
+    proc = subprocess.run([sys.executable, str(ROOT / 'ingest.py'), '--sync', '--prefix', PREFIX, *extra],
+                          cwd=azure.work, env=env, capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    summary = [line for line in proc.stdout.splitlines() if '동기화 완료' in line or '동기화 확인' in line][-1]
+    counts = summary.split(': ', 1)[1]
+    return {k: float(v) for k, v in (item.split('=') for item in counts.split(', '))}
+
+
+def doc_text(word):
+    return f'{word} 동기화 수수료 정산 고객 대리점별 집계 ' * 20
+
+
+def test_run_sync_add_modify_delete(client, azure, container):
+    put(container, 'a.txt', doc_text('syncalpha'))
+    put(container, 'b.txt', doc_text('syncbeta'))
+    put(container, 'c.txt', doc_text('syncgamma'))
+    put(container, 'image.png', 'not a document')
+
+    # 배치 2개(2건 + 1건)로 나눠 반영
+    counts = run_sync(azure, batch_size=2)
+    assert counts['added'] == 3 and counts['unsupported'] == 1 and counts['failed'] == 0
+    assert PREFIX + 'a.txt' in lexical_sources(client, 'syncalpha')
+    assert PREFIX + 'b.txt' in lexical_sources(client, 'syncbeta')
+
+    # 변경 없으면 다시 임베딩하지 않음
+    counts = run_sync(azure)
+    assert counts['added'] == counts['updated'] == counts['deleted'] == 0
+    assert counts['skipped'] == 3
+
+    put(container, 'a.txt', doc_text('syncchanged'))
+    container.delete_blob(PREFIX + 'b.txt')
+    put(container, 'd.txt', doc_text('syncdelta'))
+
+    dry = run_sync(azure, '--dry-run')
+    assert (dry['added'], dry['updated'], dry['deleted']) == (1, 1, 1)
+    assert PREFIX + 'b.txt' in lexical_sources(client, 'syncbeta')
+
+    counts = run_sync(azure, batch_size=1)
+    assert (counts['added'], counts['updated'], counts['deleted']) == (1, 1, 1)
+    assert counts['failed'] == 0
+    assert PREFIX + 'a.txt' not in lexical_sources(client, 'syncalpha')
+    assert lexical_sources(client, 'syncchanged').count(PREFIX + 'a.txt') == 1
+    assert PREFIX + 'b.txt' not in lexical_sources(client, 'syncbeta')
+    assert PREFIX + 'c.txt' in lexical_sources(client, 'syncgamma')
+    assert PREFIX + 'd.txt' in lexical_sources(client, 'syncdelta')
@@ -0,0 +1,83 @@
+"""cache_utils: LRUTTLCache 교체/만료, AsyncSingleFlight 동시 호출 병합과 대표 호출 취소"""
+import asyncio
+
+from cache_utils import AsyncSingleFlight, LRUTTLCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUTTLCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['size'] == 2
+    assert (stats['hits'], stats['misses']) == (3, 1)
+
+
+def test_ttl_expires(monkeypatch):
+    import cache_utils
+    now = [1000.0]
+    monkeypatch.setattr(cache_utils.time, 'monotonic', lambda: now[0])
+    cache = LRUTTLCache(max_size=10, ttl=5)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=None)
+    now[0] += 6
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    assert len(cache) == 1
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'value'
+
+    async def main():
+        flight = AsyncSingleFlight()
+        results = await asyncio.gather(*(flight.do('k', load) for _ in range(5)))
+        assert [r for r, _ in results] == ['value'] * 5
+        assert sum(shared for _, shared in results) == 4
+        assert flight.coalesced == 4
+        # 끝난 키는 다시 실행
+        assert await flight.do('k', load) == ('value', False)
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+
+def test_single_flight_error_is_shared():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError('boom')
+
+    async def main():
+        flight = AsyncSingleFlight()
+        results = await asyncio.gather(flight.do('k', fail), flight.do('k', fail), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        assert flight._tasks == {}
+
+    asyncio.run(main())
+
+
+def test_cancelled_leader_does_not_cancel_waiters():
+    async def load():
+        await asyncio.sleep(0.05)
+        return 'value'
+
+    async def main():
+        flight = AsyncSingleFlight()
+        leader = asyncio.ensure_future(flight.do('k', load))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.do('k', load))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        assert await waiter == ('value', True)
+        assert leader.cancelled()
+
+    asyncio.run(main())
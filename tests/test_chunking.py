@@ -0,0 +1,89 @@
+"""chunking: 토큰 한도/겹침 청크 분할, 페이지 단위 ChunkStream, 청크 행 → 문서 집계"""
+import random
+from types import SimpleNamespace
+
+import faiss
+import numpy as np
+import pytest
+
+from chunking import ChunkStream, chunk_documents, legacy_chunk_map, rows_to_array, split_into_chunks
+from embed_pipeline import estimate_tokens
+
+
+def sample_text(seed, sentences=200):
+    rng = random.Random(seed)
+    words = ['정산', '수수료', '고객', '대리점', '집계', 'DR-2025-52056', 'KRDS', '모바일', '화면', '보완']
+    parts = []
+    for _ in range(sentences):
+        parts.append(' '.join(rng.choice(words) for _ in range(rng.randint(3, 30))) + rng.choice(['.', '다.', '?']))
+        parts.append(rng.choice([' ', '\n', '\n\n']))
+    return ''.join(parts)
+
+
+def test_chunks_respect_budget_and_overlap():
+    text = sample_text(0)
+    chunks = split_into_chunks(text, max_tokens=120, overlap_tokens=30)
+    assert len(chunks) > 3
+    for start, end, chunk_text in chunks:
+        assert chunk_text == text[start:end].strip()
+        assert estimate_tokens(chunk_text) <= 120 + 5
+    # 이웃 청크 사이에 빠지는 본문이 없고(겹침 한도 안의 문장은 다음 청크에도 포함), 전체가 덮임
+    pairs = list(zip(chunks, chunks[1:]))
+    assert all(s1 < s2 and not text[e1:s2].strip() for (s1, e1, _), (s2, _, _) in pairs)
+    assert any(s2 < e1 for (_, e1, _), (s2, _, _) in pairs)
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(text)
+    assert split_into_chunks('   \n') == [] and split_into_chunks('') == []
+
+
+def test_long_unit_is_hard_split():
+    text = '가' * 5000
+    chunks = split_into_chunks(text, max_tokens=100, overlap_tokens=0)
+    assert len(chunks) > 1
+    assert ''.join(c for _, _, c in chunks) == text
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_chunk_stream_matches_whole_text(seed):
+    pages = [sample_text(seed * 10 + i, sentences=random.Random(i).randint(0, 40)) for i in range(8)]
+    stream = ChunkStream(max_tokens=150, overlap_tokens=40)
+    streamed = []
+    for page in pages:
+        streamed.extend(stream.feed(page))
+    streamed.extend(stream.finish())
+    assert streamed == split_into_chunks('\n'.join(pages), max_tokens=150, overlap_tokens=40)
+
+
+def test_chunk_documents_rows():
+    docs = [{'source': 'a.txt', 'text': sample_text(1)}, {'source': 'empty.txt', 'text': ''}]
+    texts, rows = chunk_documents(docs)
+    assert len(texts) == len(rows) > 2
+    assert [r[1] for r in rows if r[0] == 0] == list(range(len(rows) - 1))
+    # 본문이 없는 문서도 문서명으로 1개 벡터
+    assert rows[-1] == (1, 0, 0, 0) and texts[-1] == 'empty.txt'
+
+    arr = rows_to_array(rows, doc_offset=10)
+    assert arr.shape == (len(rows), 4) and arr.dtype == np.int64
+    assert set(arr[:, 0]) == {10, 11}
+
+    # 추출 단계에서 미리 나눈 청크 구간이 있으면 그대로 사용
+    text = '첫 번째 청크 본문.\n두 번째 청크 본문.'
+    texts, rows = chunk_documents([{'source': 'p.pdf', 'text': text, 'chunks': [(0, 11), (11, len(text))]}])
+    assert texts == ['첫 번째 청크 본문.', '두 번째 청크 본문.']
+
+
+def test_legacy_chunk_map_is_one_vector_per_document():
+    arr = legacy_chunk_map(3)
+    assert arr[:, 0].tolist() == [0, 1, 2] and arr[:, 1].tolist() == [0, 0, 0]
+    assert 'abc'[arr[0, 2]:arr[0, 3]] == 'abc'
+
+
+def test_aggregate_hits_per_document(app_module):
+    index = faiss.IndexFlatL2(4)
+    snapshot = SimpleNamespace(meta=[{'source': 'a'}, {'source': 'b'}, {'source': 'c'}],
+                               chunk_map=np.array([[0, 0, 0, 10], [0, 1, 5, 20], [1, 0, 0, 10], [2, 0, 0, 10]]),
+                               deleted=np.array([False, False, True]), index=index)
+    ids = np.array([0, 1, 2, 3, -1])
+    scores = np.array([0.0, 1.0, 3.0, 0.0, 0.0], dtype=np.float32)
+    # 같은 문서의 청크는 한 번만(max: 가장 가까운 청크 점수), 삭제 문서와 -1은 제외
+    assert app_module.aggregate_hits(snapshot, ids, scores) == [(0, 1.0), (1, 0.25)]
+    assert app_module.aggregate_hits(snapshot, ids, scores, agg='sum') == [(0, 1.5), (1, 0.25)]
@@ -0,0 +1,68 @@
+"""doc_filters: 문서 속성 추출(DR/연도/메뉴 경로/확장자), 필터 파싱, /search 필터 적용"""
+import pytest
+
+from doc_filters import _MENU_PATH_RE, extract_attrs, menu_paths, normalize_menu, parse_filters
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('KRDS>수수료>수수료관리 화면', 'KRDS>수수료>수수료관리'),
+    ('메뉴: KOS RDS -> 정책 및 수수료 관리 -> 정책수수료등록 화면에서 고객분류 추가',
+     'KOS RDS -> 정책 및 수수료 관리 -> 정책수수료등록'),
+    ('K-RDS → 고객 → On-Demand조회', 'K-RDS → 고객 → On-Demand조회'),
+    ('KRDS > 정산 > 대리점별 집계', 'KRDS > 정산 > 대리점별'),
+])
+def test_menu_path_regex(text, expected):
+    assert _MENU_PATH_RE.search(text).group(0) == expected
+
+
+def test_menu_path_regex_ignores_plain_mentions():
+    assert _MENU_PATH_RE.search('KRDS 시스템 개선 요청') is None
+    assert menu_paths('KRDS 만 언급') == set()
+
+
+def test_menu_paths_include_parents():
+    text = 'KOS RDS -> 정책 및 수수료 관리 -> 정책수수료등록 화면, KRDS>고객>조회'
+    assert menu_paths(text) == {'KRDS>정책및수수료관리', 'KRDS>정책및수수료관리>정책수수료등록',
+                                'KRDS>고객', 'KRDS>고객>조회'}
+    assert normalize_menu('수수료 > 수수료관리') == 'KRDS>수수료>수수료관리'
+
+
+def test_extract_attrs():
+    doc = {'source': 'docs/DR-2025-12349 정책수수료등록.DOCX', 'content_type': 'application/msword; charset=x',
+           'text': 'KRDS>수수료>수수료관리'}
+    assert extract_attrs(doc) == [('content_type', 'application/msword'), ('dr', 'DR-2025-12349'),
+                                  ('ext', 'docx'), ('menu', 'KRDS>수수료'), ('menu', 'KRDS>수수료>수수료관리'),
+                                  ('year', '2025')]
+    assert extract_attrs({'source': 'README'}) == []
+
+
+def test_parse_filters():
+    assert parse_filters() is None
+    assert parse_filters(year='2024-2025, 2023', dr='2025-12349', ext='.PDF,docx', menu='수수료') == {
+        'year': ('2023', '2024', '2025'), 'dr': ('DR-2025-12349',), 'ext': ('docx', 'pdf'),
+        'menu': ('KRDS>수수료',)}
+    with pytest.raises(ValueError):
+        parse_filters(year='25')
+    with pytest.raises(ValueError):
+        parse_filters(dr='DR-abc')
+
+
+def test_search_with_filters(client, upload):
+    body = '필터검색 수수료 정산 고객 대리점별 집계 문서 ' * 20
+    upload('DR-2024-00001 필터.txt', body + 'KRDS>수수료>수수료관리')
+    upload('DR-2025-00002 필터.txt', body + 'KRDS>고객>조회')
+
+    def sources(**params):
+        r = client.get('/search', params={'q': '필터검색 정산', 'top_k': 20, **params}).json()
+        return {item['문서명'] for item in r['결과']}
+
+    for mode in ('vector', 'lexical'):
+        assert sources(mode=mode, year='2024') == {'DR-2024-00001 필터.txt'}
+        assert sources(mode=mode, menu='KRDS>고객') == {'DR-2025-00002 필터.txt'}
+        assert sources(mode=mode, dr='DR-2025-00002', menu='수수료') == set()
+    assert sources(mode='hybrid', year='2024-2025', ext='txt') == {'DR-2024-00001 필터.txt', 'DR-2025-00002 필터.txt'}
+    assert 'error' in client.get('/search', params={'q': 'x', 'year': 'abcd'}).json()
+
+    values = client.get('/search/filters', params={'attr': 'year'}).json()['year']
+    assert values['2024'] >= 1 and values['2025'] >= 1
+    assert client.get('/search/filters', params={'attr': 'nope'}).status_code == 400
@@ -0,0 +1,28 @@
+"""embed_pipeline.BatchEmbedder: 요청 묶음 수와 결과 순서"""
+import os
+
+import numpy as np
+
+
+def make_client():
+    from openai import AzureOpenAI
+    return AzureOpenAI(api_key=os.environ['OPENAI_API_KEY'], api_version=os.environ['OPENAI_API_VERSION'],
+                       azure_endpoint=os.environ['OPENAI_API_BASE'], max_retries=0)
+
+
+def test_batches_keep_input_order(azure):
+    from embed_pipeline import BatchEmbedder
+    client = make_client()
+    model = os.environ['EMBED_DEPLOYMENT']
+    texts = [f'배치 임베딩 문서 {i} 정산 수수료' for i in range(10)]
+    embedder = BatchEmbedder(client, model, max_batch_items=4, concurrency=2)
+
+    before = azure.stats().get('embedding_requests', 0)
+    vectors = embedder.embed(texts)
+    assert azure.stats()['embedding_requests'] - before == 3
+    assert len(vectors) == len(texts) and not embedder.errors
+
+    # 묶어서 보낸 결과가 한 건씩 보낸 결과와 같은 위치에 있어야 함
+    single = BatchEmbedder(client, model, max_batch_items=1)
+    for text, vec in zip(texts[::3], vectors[::3]):
+        np.testing.assert_allclose(vec, single.embed([text])[0], rtol=1e-5)
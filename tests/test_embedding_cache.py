@@ -0,0 +1,45 @@
+"""embedding_cache.EmbeddingCache: 다른 인스턴스(프로세스)에서 재사용, 정규화 키, LRU 교체"""
+import time
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+
+def vec(seed, dim=8):
+    return np.random.default_rng(seed).random(dim, dtype=np.float32)
+
+
+def test_vectors_are_reused_across_instances(tmp_path):
+    cache = EmbeddingCache('deploy/a', cache_dir=tmp_path)
+    cache.put_many(['정산 수수료', '고객 분류'], [vec(1), vec(2)])
+    assert cache.get_many(['고객 분류', '없는 문장'])[1] is None
+
+    # 새 인스턴스(다른 프로세스와 같은 상황)도 파일에서 같은 벡터를 읽음, 공백/줄바꿈 차이는 같은 키
+    other = EmbeddingCache('deploy/a', cache_dir=tmp_path)
+    found = other.get_many(['정산   수수료\n', '고객 분류'])
+    np.testing.assert_array_equal(found[0], vec(1))
+    np.testing.assert_array_equal(found[1], vec(2))
+    assert (other.hits, other.misses) == (2, 0)
+
+    # 배포명이 다르면 별도 캐시
+    assert EmbeddingCache('deploy/b', cache_dir=tmp_path).get('정산 수수료') is None
+
+
+def test_lru_eviction_reuses_rows(tmp_path):
+    cache = EmbeddingCache('small', cache_dir=tmp_path, max_entries=2)
+    cache.put('a', vec(1))
+    time.sleep(0.01)
+    cache.put('b', vec(2))
+    time.sleep(0.01)
+    assert cache.get('a') is not None
+    time.sleep(0.01)
+    cache.put('c', vec(3))
+
+    assert cache.get('b') is None
+    np.testing.assert_array_equal(cache.get('a'), vec(1))
+    np.testing.assert_array_equal(cache.get('c'), vec(3))
+    stats = cache.stats()
+    assert stats['entries'] == 2 and stats['evictions'] == 1
+    # 행렬은 max_entries 행을 넘지 않음
+    assert cache.matrix_path.stat().st_size == 2 * 8 * 4
@@ -0,0 +1,76 @@
+"""extraction: PDF 페이지 예산(OCR 페이지 수/시간/글자 수)과 페이지 단위 청크 분할"""
+import asyncio
+
+import pytest
+
+import extraction
+from chunking import split_into_chunks
+
+
+def fake_run(pages, ocr_delay=None):
+    """프로세스 풀 대신: _fast_pass는 pages, _ocr_page는 'OCR 본문 {페이지}'(ocr_delay={페이지: 초})"""
+    ocr_delay = ocr_delay or {}
+
+    async def _run(fn, *args):
+        if fn is extraction._fast_pass:
+            return list(pages), 'fake'
+        page_no = args[1]
+        await asyncio.sleep(ocr_delay.get(page_no, 0))
+        return f'OCR 본문 {page_no}페이지 정산 수수료'
+    return _run
+
+
+def collect(path='x.pdf', **kwargs):
+    info = {}
+
+    async def main():
+        return [text async for _, text in extraction.iter_pdf_pages(path, info, **kwargs)]
+    return asyncio.run(main()), info
+
+
+def test_only_empty_pages_are_ocred_up_to_budget(monkeypatch):
+    pages = ['텍스트 레이어가 있는 페이지 본문', '', ' ', '', '두 번째 텍스트 페이지 본문입니다']
+    monkeypatch.setattr(extraction, '_run', fake_run(pages))
+    texts, info = collect(max_ocr_pages=2)
+    assert texts[0] == pages[0] and texts[4] == pages[4]
+    assert texts[1].startswith('OCR 본문 1') and texts[2].startswith('OCR 본문 2')
+    # 예산을 넘은 OCR 대상 페이지는 빈 페이지로 남김
+    assert texts[3] == ''
+    assert info['ocr_pages'] == 2 and info['truncated'] is True and info['pages'] == 5
+
+
+def test_time_budget_skips_remaining_ocr(monkeypatch):
+    pages = ['', '', '마지막 텍스트 페이지 본문입니다']
+    monkeypatch.setattr(extraction, '_run', fake_run(pages, ocr_delay={0: 0, 1: 5}))
+    texts, info = collect(time_budget=0.3)
+    assert texts[0].startswith('OCR 본문 0')
+    assert texts[1] == '' and texts[2] == pages[2]
+    assert info['truncated'] is True and info['ocr_pages'] == 1
+
+
+def pdf_pages(pages):
+    async def _iter(path, info, **kwargs):
+        info.update(pages=len(pages), truncated=False)
+        for i, text in enumerate(pages):
+            yield i, text
+    return _iter
+
+
+def test_pdf_text_is_chunked_per_page(monkeypatch):
+    pages = [f'{i}페이지 정산 수수료 고객 대리점별 집계 문서입니다. ' * 40 for i in range(6)]
+    monkeypatch.setattr(extraction, 'iter_pdf_pages', pdf_pages(pages))
+    text, chunks = asyncio.run(extraction._extract_pdf('x.pdf', {}))
+    assert text == '\n'.join(pages)
+    assert chunks == [(start, end) for start, end, _ in split_into_chunks(text)]
+
+
+@pytest.mark.parametrize('limit', [100, 250, 10 ** 6])
+def test_max_chars_budget(monkeypatch, limit):
+    pages = ['가나다라마바사 ' * 20] * 5
+    monkeypatch.setattr(extraction, 'iter_pdf_pages', pdf_pages(pages))
+    monkeypatch.setattr(extraction, 'EXTRACT_MAX_CHARS', limit)
+    info = {}
+    text, chunks = asyncio.run(extraction._extract_pdf('x.pdf', info))
+    assert len(text.replace('\n', '')) == min(limit, sum(len(p) for p in pages))
+    assert info['truncated'] is (limit < 10 ** 6)
+    assert chunks == [(start, end) for start, end, _ in split_into_chunks(text)]
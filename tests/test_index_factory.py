@@ -0,0 +1,86 @@
+"""index_factory: 모드별 인덱스 생성/flat 대체, 요청별 nprobe, SQ 저장 크기와 float32 재정렬"""
+import faiss
+import numpy as np
+import pytest
+
+import index_factory
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 32)).astype(np.float32)
+    vectors = (centers[rng.integers(0, 20, 1500)] + 0.3 * rng.normal(size=(1500, 32))).astype(np.float32)
+    queries = vectors[rng.choice(1500, 20, replace=False)] + 0.05 * rng.normal(size=(20, 32)).astype(np.float32)
+    return vectors, queries.astype(np.float32)
+
+
+def exact_top(vectors, queries, k):
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors)
+    return flat.search(queries, k)[1]
+
+
+def recall(found, truth):
+    return np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])
+
+
+def test_factory_string_falls_back_to_flat_for_small_data():
+    assert index_factory.factory_string('flat', 32, 10) == 'Flat'
+    assert index_factory.factory_string('sq8', 32, 10) == 'SQ8'
+    assert index_factory.factory_string('ivf', 32, 10) is None
+    assert index_factory.factory_string('ivfpq', 32, 100) is None
+    assert index_factory.factory_string('ivf', 32, 1500).startswith('IVF')
+    with pytest.raises(ValueError):
+        index_factory.factory_string('nope', 32, 10)
+
+
+@pytest.mark.parametrize('mode', ['flat', 'hnsw', 'ivf', 'ivfpq', 'opq', 'sqfp16', 'sq8'])
+def test_modes_build_and_search(data, mode, monkeypatch):
+    vectors, queries = data
+    # PQ 학습 시간을 줄이기 위해 코드북을 작게
+    monkeypatch.setattr(index_factory, 'PQ_M', 8)
+    monkeypatch.setattr(index_factory, 'PQ_NBITS', 5)
+    index = index_factory.build_index(vectors, mode=mode, metric=faiss.METRIC_L2)
+    assert index.ntotal == len(vectors)
+    _, I = index_factory.search(index, queries, 10)
+    assert recall(I, exact_top(vectors, queries, 10)) >= (0.99 if mode in ('flat', 'sqfp16') else 0.5)
+
+
+def test_request_nprobe_does_not_change_shared_index(data):
+    vectors, queries = data
+    index = index_factory.build_index(vectors, mode='ivf', metric=faiss.METRIC_L2)
+    ivf = faiss.extract_index_ivf(index)
+    before = ivf.nprobe
+    _, wide = index_factory.search(index, queries, 10, nprobe=ivf.nlist)
+    assert ivf.nprobe == before
+    # 모든 클러스터를 탐색하면 정확 검색과 같음
+    assert recall(wide, exact_top(vectors, queries, 10)) == 1.0
+
+
+def test_sq_storage_and_float32_rerank(data):
+    vectors, queries = data
+    flat = index_factory.build_index(vectors, mode='flat', metric=faiss.METRIC_L2)
+    sq8 = index_factory.build_index(vectors, mode='sq8', metric=faiss.METRIC_L2)
+    sqfp16 = index_factory.build_index(vectors, mode='sqfp16', metric=faiss.METRIC_L2)
+    size = {name: len(faiss.serialize_index(index)) for name, index in
+            (('flat', flat), ('sq8', sq8), ('sqfp16', sqfp16))}
+    assert size['sq8'] < size['sqfp16'] < size['flat']
+    assert size['sq8'] < size['flat'] / 3
+
+    # 원본 float32 벡터로 후보를 다시 채점하면 점수가 정확한 L2 거리
+    truth = exact_top(vectors, queries, 5)
+    D, I = index_factory.search(sq8, queries, 5, vectors=vectors, rerank_factor=4)
+    assert recall(I, truth) >= 0.95
+    expected = ((vectors[I[0]] - queries[0]) ** 2).sum(axis=1)
+    np.testing.assert_allclose(D[0], expected, rtol=1e-4)
+
+
+def test_inner_product_normalizes_a_copy(data):
+    vectors, queries = data
+    original = queries.copy()
+    index = index_factory.build_index(vectors, mode='flat', metric=faiss.METRIC_INNER_PRODUCT)
+    D, _ = index_factory.search(index, queries, 3)
+    np.testing.assert_array_equal(queries, original)
+    assert index_factory.is_inner_product(index)
+    assert np.all(D <= 1.0001) and index_factory.similarity(index, D[0, 0]) == pytest.approx(float(D[0, 0]))
@@ -0,0 +1,22 @@
+"""index_store.load_chunk_map: chunk_map이 없는 기존 인덱스(메타를 읽지 않고 문서 단위 매핑 생성/저장)"""
+import numpy as np
+
+from index_store import load_chunk_map
+
+
+def test_legacy_chunk_map_is_persisted_once(tmp_path):
+    path = tmp_path / 'faiss_index.chunks.npy'
+    # 적재/압축 경로(persist=False)는 파일을 만들지 않음
+    assert load_chunk_map(3, path)[:, 0].tolist() == [0, 1, 2]
+    assert not path.exists()
+
+    chunk_map = load_chunk_map(3, path, persist=True)
+    assert path.exists()
+    # 다음 기동부터는 저장된 파일을 memmap으로 엶
+    again = load_chunk_map(3, path)
+    assert isinstance(again, np.memmap)
+    np.testing.assert_array_equal(again, chunk_map)
+
+    # 인덱스와 크기가 다르면 문서 단위 매핑(저장된 파일은 그대로)
+    assert load_chunk_map(4, path, persist=True).shape == (4, 4)
+    assert np.load(path).shape == (3, 4)
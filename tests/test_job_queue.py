@@ -0,0 +1,25 @@
+"""job_queue.JobQueue: 완료 작업 본문 정리, 보관 기간 지난 작업 purge"""
+from job_queue import JOB_MAX_ATTEMPTS, JobQueue
+
+
+def test_complete_drops_text_and_purge_removes_old_jobs(tmp_path):
+    queue = JobQueue(tmp_path / 'jobs.db')
+    done_id = queue.enqueue('index_document', {'source': 'a.txt', 'text': '본문'})
+    failed_id = queue.enqueue('index_document', {'source': 'b.txt', 'text': '본문'})
+    pending_id = queue.enqueue('index_document', {'source': 'c.txt', 'text': '본문'})
+    queue.claim_batch('index_document', 1)
+    queue.complete([done_id], result={'generation': 1})
+    for _ in range(JOB_MAX_ATTEMPTS):
+        [job] = queue.claim_batch('index_document', 1)
+        assert job['id'] == failed_id
+        queue.fail([failed_id], 'boom')
+
+    assert queue.get(done_id, with_payload=True)['payload'] == {'source': 'a.txt'}
+    assert queue.get(failed_id)['status'] == 'failed'
+
+    # 보관 기간 안의 작업은 남김
+    assert queue.purge() == []
+    purged = queue.purge(retention_sec=-1)
+    assert sorted(p['source'] for p in purged) == ['a.txt', 'b.txt']
+    assert queue.get(done_id) is None and queue.get(failed_id) is None
+    assert queue.get(pending_id)['status'] == 'pending'
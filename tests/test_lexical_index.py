@@ -0,0 +1,96 @@
+"""lexical_index: 토큰화, BM25 점수(전수 계산과 비교), 추가분 색인, rrf_fuse"""
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from lexical_index import LexicalIndex, doc_text, rrf_fuse, tokenize
+
+DOCS = [
+    {'source': 'DR-2025-52056 정책수수료.docx', 'text': '정책수수료 등록 화면 고객분류 보완'},
+    {'source': '정산.txt', 'text': '대리점별 수수료 정산 집계 수수료 지급'},
+    {'source': 'mobile.txt', 'text': 'KRDS 모바일 고객 조회 화면'},
+    {'source': 'empty.txt', 'text': ''},
+]
+
+
+def bm25(docs, query, k1=1.2, b=0.75):
+    """전체 문서를 훑는 BM25(검증용)"""
+    counts = [Counter(tokenize(doc_text(d))) for d in docs]
+    lengths = [sum(c.values()) for c in counts]
+    avgdl = sum(lengths) / len(lengths)
+    scores = {}
+    for term in set(tokenize(query)):
+        df = sum(1 for c in counts if term in c)
+        if not df:
+            continue
+        idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+        for i, c in enumerate(counts):
+            if term in c:
+                tf = c[term]
+                scores[i] = scores.get(i, 0.0) + idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[i] / avgdl))
+    return sorted(scores.items(), key=lambda x: -x[1])
+
+
+def test_tokenize_hangul_bigrams_and_identifiers():
+    tokens = tokenize('정산 DR-2025-52056 v1.2 고')
+    assert tokens[:2] == ['정산', '고']
+    assert 'dr-2025-52056' in tokens and '52056' in tokens
+    assert 'v1.2' in tokens
+    assert tokenize('수수료') == ['수수', '수료']
+
+
+def test_bm25_matches_full_scan():
+    index = LexicalIndex()
+    index.sync(DOCS, generation=1)
+    for query in ('수수료 정산', '고객 화면', 'dr-2025-52056', '없는말'):
+        found = index.search(query, top_k=10)
+        expected = bm25(DOCS, query)
+        assert [doc for doc, _ in found] == [doc for doc, _ in expected]
+        np.testing.assert_allclose([s for _, s in found], [s for _, s in expected], rtol=1e-5)
+    assert index.search('DR-2025-52056')[0][0] == 0
+    assert index.search('') == []
+
+
+def test_append_indexes_only_new_docs_and_matches_rebuild(capsys):
+    index = LexicalIndex()
+    index.sync(DOCS[:2], generation=1)
+    loaded = []
+
+    def load_docs(start, end):
+        loaded.append((start, end))
+        return enumerate(DOCS[start:end], start=start)
+
+    assert index.sync(DOCS, generation=2, load_docs=load_docs)
+    assert loaded == [(2, 4)]
+    assert not index.sync(DOCS, generation=2)
+    rebuilt = LexicalIndex()
+    rebuilt.sync(DOCS, generation=2)
+    assert index.search('고객 수수료') == pytest.approx(rebuilt.search('고객 수수료'))
+    assert index.stats()['doc_count'] == 4
+
+    # 색인한 범위의 마지막 문서가 바뀌면(전체 재생성 등) 전체 재구성
+    capsys.readouterr()
+    changed = [{'source': 'other.txt', 'text': '다른 문서'}]
+    index.sync(changed, generation=3)
+    assert '재구성' in capsys.readouterr().out
+    assert index.search('수수료') == [] and index.stats()['doc_count'] == 1
+
+
+def test_exclude_mask():
+    index = LexicalIndex()
+    index.sync(DOCS, generation=1)
+    exclude = np.array([False, True, False, False])
+    assert 1 not in [doc for doc, _ in index.search('수수료', exclude=exclude)]
+
+
+def test_rrf_fuse():
+    vector = [(1, 0.9), (2, 0.8), (3, 0.7)]
+    lexical = [(3, 12.0), (1, 3.0)]
+    fused = rrf_fuse([vector, lexical], top_k=10, k=60)
+    assert [doc for doc, _ in fused] == [1, 3, 2]
+    assert fused[0][1] == pytest.approx((1 / 61 + 1 / 62) / (2 / 61))
+    # 모든 목록에서 1위면 1.0
+    assert rrf_fuse([[(5, 1.0)], [(5, 2.0)]])[0] == (5, pytest.approx(1.0))
+    assert rrf_fuse([vector], top_k=2) == [(1, pytest.approx(1.0)), (2, pytest.approx(61 / 62))]
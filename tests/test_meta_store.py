@@ -0,0 +1,105 @@
+"""meta_store.MetaStore: meta.json 이전, 추가 트랜잭션, 덮어쓰기 tombstone(deleted_by), 인덱싱 대기 문서"""
+import json
+import sqlite3
+
+from meta_store import MetaStore
+
+
+def make_docs(*names):
+    return [{'source': name, 'text': f'{name} 본문 정산 수수료', 'size': len(name)} for name in names]
+
+
+def test_migrates_meta_json_once(tmp_path):
+    legacy = tmp_path / 'meta.json'
+    legacy.write_text(json.dumps(make_docs('a.txt', 'b.txt'), ensure_ascii=False), encoding='utf-8')
+    store = MetaStore(tmp_path / 'meta.db', migrate_from=legacy)
+    assert store.count() == 2
+    assert store.get(1) == make_docs('a.txt', 'b.txt')[1]
+    # 검색 스냅샷용 보기에는 본문이 없음
+    view = store.view()
+    assert len(view) == 2 and view[0] == {'source': 'a.txt', 'size': 5}
+    assert store.find_by_source('b.txt')[0] == 1
+
+    # 두 번째 열 때는 다시 옮기지 않음(meta.json이 바뀌어도)
+    legacy.write_text(json.dumps(make_docs('x.txt'), ensure_ascii=False), encoding='utf-8')
+    again = MetaStore(tmp_path / 'meta.db', migrate_from=legacy)
+    assert again.count() == 2 and again.get(0)['source'] == 'a.txt'
+
+
+def test_upgrades_db_without_tombstone_columns(tmp_path):
+    db = tmp_path / 'meta.db'
+    conn = sqlite3.connect(db)
+    conn.executescript('''
+        CREATE TABLE docs (doc_id INTEGER PRIMARY KEY, source TEXT NOT NULL, fields TEXT NOT NULL,
+                           text_len INTEGER NOT NULL DEFAULT 0);
+        CREATE TABLE doc_text (doc_id INTEGER PRIMARY KEY, text TEXT NOT NULL);
+        INSERT INTO docs VALUES (0, 'old.txt', '{"source": "old.txt"}', 3);
+        INSERT INTO doc_text VALUES (0, 'old');
+    ''')
+    conn.commit()
+    conn.close()
+    store = MetaStore(db, migrate_from=None)
+    assert store.get(0) == {'source': 'old.txt', 'text': 'old'}
+    assert store.deleted_ids() == [] and store.live_ids_by_source('old.txt') == [0]
+
+
+def test_append_replaces_unpublished_rows(tmp_path):
+    store = MetaStore(tmp_path / 'meta.db', migrate_from=None)
+    store.append(make_docs('a.txt', 'b.txt'), 0)
+    # publish 전에 중단된 추가(doc_id 2)는 다음 추가가 같은 번호로 교체
+    store.append(make_docs('lost.txt'), 2)
+    store.append(make_docs('c.txt'), 2)
+    assert store.count() == 3
+    assert [d['source'] for d in store.view(3)] == ['a.txt', 'b.txt', 'c.txt']
+    assert store.find_by_source('lost.txt') == (None, None)
+    assert [doc_id for doc_id, _ in store.iter_docs()] == [0, 1, 2]
+
+
+def test_overwrite_tombstone_waits_for_publish(tmp_path):
+    store = MetaStore(tmp_path / 'meta.db', migrate_from=None)
+    store.append(make_docs('a.txt', 'b.txt'), 0)
+    replaced = store.append(make_docs('a.txt'), 2)
+    assert replaced == [0]
+
+    # 대체 문서(doc_id 2)가 publish되기 전(meta_count=2): 이전 문서가 그대로 보임
+    assert store.deleted_ids(limit=2) == []
+    assert store.find_by_source('a.txt', limit=2)[0] == 0
+    assert store.get_text(0)
+
+    # publish 후(meta_count=3): 이전 문서는 삭제로 취급되고 정리 시 본문 삭제
+    assert store.deleted_ids(limit=3) == [0]
+    assert store.find_by_source('a.txt', limit=3)[0] == 2
+    store.settle_replaced(3)
+    assert store.get_text(0) == ''
+    assert store.live_ids_by_source('a.txt') == [2]
+
+
+def test_unpublished_overwrite_is_rolled_back(tmp_path):
+    store = MetaStore(tmp_path / 'meta.db', migrate_from=None)
+    store.append(make_docs('a.txt'), 0)
+    # 덮어쓰기를 커밋했지만 publish 전에 중단 → 다음 추가가 같은 번호에서 시작하면 tombstone을 되돌림
+    store.append(make_docs('a.txt'), 1)
+    store.append(make_docs('b.txt'), 1)
+    assert store.deleted_ids() == []
+    assert store.find_by_source('a.txt') == (0, make_docs('a.txt')[0])
+
+
+def test_delete_and_delete_sources(tmp_path):
+    store = MetaStore(tmp_path / 'meta.db', migrate_from=None)
+    store.append(make_docs('a.txt', 'b.txt', 'c.txt'), 0)
+    assert store.delete([1]) == [1]
+    assert store.delete([1]) == []
+    assert store.get_text(1) == '' and store.deleted_ids() == [1]
+    # 추가 문서 없이 delete_sources만 주면 바로 삭제
+    assert store.append([], 3, delete_sources=['c.txt']) == [2]
+    assert store.deleted_ids(limit=3) == [1, 2]
+    assert [doc_id for doc_id, _ in store.iter_docs()] == [0]
+
+
+def test_staged_docs(tmp_path):
+    store = MetaStore(tmp_path / 'meta.db', migrate_from=None)
+    doc = make_docs('staged.txt')[0]
+    stage_id = store.stage(doc)
+    assert store.staged([stage_id, 'missing']) == {stage_id: doc}
+    store.unstage([stage_id])
+    assert store.staged([stage_id]) == {}
@@ -0,0 +1,56 @@
+"""/metrics(Prometheus 텍스트 형식)와 요청별 추적(trace)"""
+import re
+
+from metrics import Counter, Histogram
+
+
+def parse(text):
+    """{'이름{레이블}': 값}"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_histogram_buckets_are_cumulative():
+    hist = Histogram('test_seconds', '테스트', ['stage'], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        hist.observe(value, 'a')
+    samples = parse('\n'.join(hist.collect()))
+    assert samples['test_seconds_bucket{stage="a",le="0.1"}'] == 1
+    assert samples['test_seconds_bucket{stage="a",le="1.0"}'] == 3
+    assert samples['test_seconds_bucket{stage="a",le="+Inf"}'] == 4
+    assert samples['test_seconds_sum{stage="a"}'] == 6.05
+    assert hist.count('a') == 4
+
+    counter = Counter('test_total', '테스트', ['kind'])
+    counter.inc('x "quoted"', amount=2)
+    assert 'test_total{kind="x \\"quoted\\""} 2' in list(counter.collect())
+
+
+def test_metrics_endpoint(client, upload):
+    upload('metrics.txt', '메트릭 수수료 정산 고객 대리점별 집계 문서 ' * 30)
+    for _ in range(3):
+        assert client.get('/search', params={'q': '메트릭 정산', 'mode': 'vector'}).status_code == 200
+    r = client.get('/metrics')
+    assert r.status_code == 200 and r.headers['content-type'].startswith('text/plain')
+    samples = parse(r.text)
+    assert samples['app_requests_total{handler="search",method="GET",status="200"}'] >= 3
+    assert samples['app_request_seconds_count{handler="search",method="GET"}'] >= 3
+    assert samples['app_stage_seconds_count{stage="faiss_search"}'] >= 3
+    assert samples['app_stage_seconds_count{stage="query_embedding"}'] >= 1
+    assert samples['app_cache_requests_total{cache="query_embedding",result="hit"}'] >= 2
+    assert samples['app_index_ntotal'] > 0
+    assert re.search(r'^# TYPE app_request_seconds histogram$', r.text, re.M)
+
+
+def test_trace_only_when_requested(client, upload):
+    upload('trace.txt', '추적 수수료 정산 고객 대리점별 집계 문서 ' * 30)
+    plain = client.get('/search', params={'q': '추적 정산', 'mode': 'vector'}).json()
+    assert 'trace' not in plain
+    traced = client.get('/search', params={'q': '추적 정산', 'mode': 'vector', 'trace': 1}).json()
+    assert traced['trace']
+    header = client.get('/search', params={'q': '추적 정산', 'mode': 'vector'}, headers={'X-Trace': '1'}).json()
+    assert header['trace']